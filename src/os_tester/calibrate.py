@@ -0,0 +1,511 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from math import floor
+from os import listdir, path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+from os_tester.compare import build_mask, compWorkspace, imageMask
+from os_tester.lazy import lazy_import
+from os_tester.stages import area
+from os_tester.trace import TRACE_FILE_NAME, area_to_dict
+
+if TYPE_CHECKING:
+    import cv2
+else:
+    cv2 = lazy_import("cv2")
+
+# (stage name, path index, check index, reference file)
+checkKey = Tuple[str, int, int, str]
+
+
+class recordedMask:
+    """
+    The mask image and include/exclude areas of an image check as recorded inside a trace.
+    """
+
+    filePath: Optional[str]
+    includeAreas: List[area]
+    excludeAreas: List[area]
+
+    def __init__(self, filePath: Optional[str] = None, includeAreas: Optional[List[area]] = None, excludeAreas: Optional[List[area]] = None):
+        self.filePath = filePath
+        self.includeAreas = includeAreas if includeAreas is not None else list()
+        self.excludeAreas = excludeAreas if excludeAreas is not None else list()
+
+    @property
+    def enabled(self) -> bool:
+        """
+        True in case not all pixels of the compared area get compared.
+        """
+        return bool(self.filePath or self.includeAreas or self.excludeAreas)
+
+
+class recordedCheck:
+    """
+    An image check as configured while recording a trace.
+    """
+
+    stageName: str
+    pathIndex: int
+    checkIndex: int
+    filePath: str
+    ssimGeq: float
+    imageArea: Optional[area]
+    maskObj: recordedMask
+
+    def __init__(self, stageName: str, pathIndex: int, checkIndex: int, filePath: str, ssimGeq: float, imageArea: Optional[area], maskObj: Optional[recordedMask] = None):
+        self.stageName = stageName
+        self.pathIndex = pathIndex
+        self.checkIndex = checkIndex
+        self.filePath = filePath
+        self.ssimGeq = ssimGeq
+        self.imageArea = imageArea
+        self.maskObj = maskObj if maskObj is not None else recordedMask()
+
+    @property
+    def key(self) -> checkKey:
+        """
+        Identifies the check across all recorded visits.
+        """
+        return (self.stageName, self.pathIndex, self.checkIndex, self.filePath)
+
+    @staticmethod
+    def from_dict(stageName: str, checkDict: Dict[str, Any]) -> "recordedCheck":
+        """
+        Creates a check from its representation inside a trace (see 'traceRecorder.begin_stage(...)').
+        """
+        imageArea: Optional[area] = area(checkDict["area"]) if checkDict["area"] else None
+        # Traces recorded before masks existed do not contain them
+        maskObj: recordedMask = recordedMask(
+            checkDict.get("mask"),
+            [area(areaDict) for areaDict in checkDict.get("include", list())],
+            [area(areaDict) for areaDict in checkDict.get("exclude", list())],
+        )
+        return recordedCheck(stageName, checkDict["path"], checkDict["check"], checkDict["file"], checkDict["ssimGeq"], imageArea, maskObj)
+
+
+class calibrationSuggestion:
+    """
+    The values suggested for a single image check. Each of them is None in case no safe value has been found.
+    """
+
+    ssimGeq: Optional[float]
+    # The smallest grid aligned area separating matching from not matching frames and the 'ssim_geq' to use together with it
+    imageArea: Optional[area]
+    areaSsimGeq: Optional[float]
+
+    def __init__(self) -> None:
+        self.ssimGeq = None
+        self.imageArea = None
+        self.areaSsimGeq = None
+
+
+class checkCalibration:
+    """
+    Calibration result for a single image check, aggregated over all recorded visits of its stage.
+    Frames the check matched in are positives. All frames before the match of a stage are negatives, since the stage was not done yet.
+    Visits that timed out are not labeled, only their best SSIM gets reported.
+    """
+
+    # The currently configured check
+    checkObj: recordedCheck
+
+    positives: List[float]
+    negatives: List[float]
+    # (run directory, frame file) and whether the frame is a positive. Only frames that have been stored.
+    frames: List[Tuple[str, str, bool]]
+    # Best SSIM reached during timed out visits and the frame ID it was reached at
+    timedOutBest: Optional[Tuple[float, int]]
+
+    suggestionObj: calibrationSuggestion
+
+    def __init__(self, checkObj: recordedCheck):
+        self.checkObj = checkObj
+        self.positives = list()
+        self.negatives = list()
+        self.frames = list()
+        self.timedOutBest = None
+        self.suggestionObj = calibrationSuggestion()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Converts the result into the representation written via 'python -m os_tester.calibrate --output ...'.
+        """
+        checkObj: recordedCheck = self.checkObj
+        return {
+            "stage": checkObj.stageName,
+            "path": checkObj.pathIndex,
+            "check": checkObj.checkIndex,
+            "file": checkObj.filePath,
+            "ssimGeq": checkObj.ssimGeq,
+            "area": area_to_dict(checkObj.imageArea),
+            "mask": checkObj.maskObj.filePath,
+            "include": [area_to_dict(includeArea) for includeArea in checkObj.maskObj.includeAreas],
+            "exclude": [area_to_dict(excludeArea) for excludeArea in checkObj.maskObj.excludeAreas],
+            "positives": len(self.positives),
+            "negatives": len(self.negatives),
+            "positiveMin": min(self.positives) if self.positives else None,
+            "negativeMax": max(self.negatives) if self.negatives else None,
+            "timedOutBest": self.timedOutBest,
+            "suggestedSsimGeq": self.suggestionObj.ssimGeq,
+            "suggestedArea": area_to_dict(self.suggestionObj.imageArea),
+            "suggestedAreaSsimGeq": self.suggestionObj.areaSsimGeq,
+        }
+
+
+def find_traces(traceDirs: Sequence[str]) -> List[str]:
+    """
+    Returns all run directories containing a trace. Each given directory can either be a run directory or contain run directories.
+    """
+    runDirs: List[str] = list()
+    for traceDir in traceDirs:
+        if path.isfile(path.join(traceDir, TRACE_FILE_NAME)):
+            runDirs.append(traceDir)
+            continue
+        if not path.isdir(traceDir):
+            continue
+        for entry in sorted(listdir(traceDir)):
+            if path.isfile(path.join(traceDir, entry, TRACE_FILE_NAME)):
+                runDirs.append(path.join(traceDir, entry))
+    return runDirs
+
+
+def suggest_threshold(positives: Sequence[float], negatives: Sequence[float], margin: float) -> Optional[float]:
+    """
+    Returns the tightest 'ssim_geq' that still accepts all positives with the given margin, but never gets closer to the negatives than to the positives.
+
+    Returns:
+        Optional[float]: The threshold or None in case there are no positives or they can not be separated from the negatives.
+    """
+    if not positives:
+        return None
+    posMin: float = min(positives)
+    negMax: float = max(negatives) if negatives else 0.0
+    threshold: float = floor(max(posMin - margin, (posMin + negMax) / 2) * 10000) / 10000
+    if threshold <= negMax or threshold > posMin:
+        return None
+    return threshold
+
+
+def candidate_areas(baseArea: Optional[area], grid: int) -> List[area]:
+    """
+    Returns all sub-rectangles of the given area (or the whole image) aligned to a 'grid' x 'grid' grid, ordered by their size.
+    """
+    x1: float = baseArea.x1Percentage if baseArea else 0.0
+    x2: float = baseArea.x2Percentage if baseArea else 1.0
+    y1: float = baseArea.y1Percentage if baseArea else 0.0
+    y2: float = baseArea.y2Percentage if baseArea else 1.0
+    xs: List[float] = [x1 + (x2 - x1) * i / grid for i in range(grid + 1)]
+    ys: List[float] = [y1 + (y2 - y1) * i / grid for i in range(grid + 1)]
+
+    areas: List[area] = list()
+    for xStart in range(grid):
+        for xEnd in range(xStart + 1, grid + 1):
+            for yStart in range(grid):
+                for yEnd in range(yStart + 1, grid + 1):
+                    areas.append(area({"x1Percentage": xs[xStart], "x2Percentage": xs[xEnd], "y1Percentage": ys[yStart], "y2Percentage": ys[yEnd]}))
+    areas.sort(key=lambda a: (a.x2Percentage - a.x1Percentage) * (a.y2Percentage - a.y1Percentage))
+    return areas
+
+
+class checkScorer:
+    """
+    Compares recorded frames against the reference images of checks. Reference images, mask images and the masks of checks get cached.
+    """
+
+    __workspace: compWorkspace
+    __refImages: Dict[str, Optional[cv2.typing.MatLike]]
+    __masks: Dict[checkKey, Optional[imageMask]]
+
+    def __init__(self) -> None:
+        self.__workspace = compWorkspace()
+        self.__refImages = {}
+        self.__masks = {}
+
+    def load_ref(self, filePath: str) -> Optional[cv2.typing.MatLike]:
+        """
+        Loads the given reference or mask image. None in case it does not exist (any more).
+        """
+        if filePath not in self.__refImages:
+            self.__refImages[filePath] = cv2.imread(filePath) if path.isfile(filePath) else None
+            if self.__refImages[filePath] is None:
+                print(f"⚠️ Reference image '{filePath}' not found. Using recorded SSIM values.")
+        return self.__refImages[filePath]
+
+    def build_mask(self, checkObj: recordedCheck, refImg: cv2.typing.MatLike, imageArea: Optional[area]) -> Optional[imageMask]:
+        """
+        Builds the mask of the given check restricted to the given area. None in case the check does not use a mask.
+
+        Raises:
+            ValueError: In case the mask does not leave any pixel inside the area.
+        """
+        maskObj: recordedMask = checkObj.maskObj
+        if not maskObj.enabled:
+            return None
+        maskImg: Optional[cv2.typing.MatLike] = self.load_ref(maskObj.filePath) if maskObj.filePath else None
+        return build_mask(refImg.shape, maskImg, maskObj.includeAreas, maskObj.excludeAreas, imageArea)
+
+    def score(self, img: Optional[cv2.typing.MatLike], checkObj: recordedCheck, frameDict: Dict[str, Any]) -> Optional[float]:
+        """
+        Compares the given frame against the reference image of the check. Falls back to the recorded SSIM in case the frame or reference image is not available.
+
+        Returns:
+            Optional[float]: The SSIM or None in case the check has not been compared for this frame while recording.
+        """
+        refImg: Optional[cv2.typing.MatLike] = self.load_ref(checkObj.filePath)
+        if img is not None and refImg is not None:
+            if checkObj.key not in self.__masks:
+                self.__masks[checkObj.key] = self.build_mask(checkObj, refImg, checkObj.imageArea)
+            return self.__workspace.comp_images(img, refImg, checkObj.imageArea, self.__masks[checkObj.key])
+        score: Any = frameDict["scores"].get(f"{checkObj.pathIndex}:{checkObj.checkIndex}")
+        return float(score) if score is not None else None
+
+    def score_areas(self, checkObj: recordedCheck, refImg: cv2.typing.MatLike, frames: List[Tuple[str, str, bool]], areas: List[area]) -> Tuple[List[List[float]], List[List[float]]]:
+        """
+        Compares the given stored frames against the reference image restricted to each of the given areas.
+        Frames are decoded once and compared against all areas.
+
+        Returns:
+            Tuple[List[List[float]], List[List[float]]]: The SSIM values of the positive and negative frames per area.
+        """
+        masks: List[Optional[imageMask]] = list()
+        for candidate in areas:
+            try:
+                masks.append(self.build_mask(checkObj, refImg, candidate))
+            except ValueError:
+                # The mask ignores the whole candidate
+                masks.append(None)
+
+        positives: List[List[float]] = [list() for _ in areas]
+        negatives: List[List[float]] = [list() for _ in areas]
+        for runDir, fileName, label in frames:
+            img: Optional[cv2.typing.MatLike] = cv2.imread(path.join(runDir, fileName))
+            if img is None:
+                continue
+            for i, candidate in enumerate(areas):
+                if masks[i] is None and checkObj.maskObj.enabled:
+                    continue
+                try:
+                    score: float = self.__workspace.comp_images(img, refImg, candidate, masks[i])
+                except ValueError:
+                    # Too small for the SSIM window
+                    continue
+                (positives[i] if label else negatives[i]).append(score)
+        return positives, negatives
+
+
+class calibrator:
+    """
+    Replays recorded SSIM traces (see 'os_tester.trace.traceRecorder') against the comparison engine and suggests thresholds and areas per image check.
+    Stored frames get compared again, so suggestions stay valid in case the comparison changed since recording. Otherwise the recorded SSIM values are used.
+    """
+
+    # Distance kept between the suggested threshold and the worst matching frame
+    margin: float
+    # Minimum distance between positives and negatives required for suggesting a smaller area
+    minGap: float
+    grid: int
+    suggestAreas: bool
+    # Number of frames right before a matching frame that are neither counted as matching nor as not matching
+    ignoreBeforeMatch: int
+    checks: Dict[checkKey, checkCalibration]
+
+    __scorer: checkScorer
+
+    def __init__(self, margin: float = 0.005, minGap: float = 0.02, grid: int = 4, suggestAreas: bool = True, ignoreBeforeMatch: int = 0):
+        self.margin = margin
+        self.minGap = minGap
+        self.grid = grid
+        self.suggestAreas = suggestAreas
+        self.ignoreBeforeMatch = ignoreBeforeMatch
+        self.checks = {}
+        self.__scorer = checkScorer()
+
+    def add_run(self, runDir: str) -> None:
+        """
+        Replays all stage visits of the given run directory.
+        """
+        with open(path.join(runDir, TRACE_FILE_NAME), "r", encoding="utf-8") as file:
+            traceDict: Dict[str, Any] = json.load(file)
+
+        for visit in traceDict["visits"]:
+            self.__add_visit(runDir, visit)
+
+    def __add_visit(self, runDir: str, visit: Dict[str, Any]) -> None:
+        checks: List[checkCalibration] = list()
+        for checkDict in visit["checks"]:
+            checkObj: recordedCheck = recordedCheck.from_dict(visit["stage"], checkDict)
+            if checkObj.key not in self.checks:
+                self.checks[checkObj.key] = checkCalibration(checkObj)
+            checks.append(self.checks[checkObj.key])
+
+        match: Optional[Dict[str, Any]] = visit["match"]
+        frames: List[Dict[str, Any]] = visit["frames"]
+        matchIndex: Optional[int] = None
+        if match and match["frameId"] is not None:
+            matchIndex = next((i for i, frameDict in enumerate(frames) if frameDict["frameId"] == match["frameId"]), None)
+
+        for frameIndex, frameDict in enumerate(frames):
+            # The awaited screen might already have been shown a few frames before a too strict 'ssim_geq' matched it
+            settling: bool = matchIndex is not None and matchIndex - self.ignoreBeforeMatch <= frameIndex < matchIndex
+            img: Optional[cv2.typing.MatLike] = cv2.imread(path.join(runDir, frameDict["file"])) if frameDict["file"] else None
+            for check in checks:
+                label: Optional[bool] = None if settling else self.__label(match, frameDict, frameIndex == len(frames) - 1, check.checkObj)
+                if label is None and not visit["timedOut"]:
+                    continue
+
+                score: Optional[float] = self.__scorer.score(img, check.checkObj, frameDict)
+                if score is None:
+                    continue
+
+                if visit["timedOut"]:
+                    if not check.timedOutBest or score > check.timedOutBest[0]:
+                        check.timedOutBest = (score, frameDict["frameId"])
+                    continue
+
+                assert label is not None
+                (check.positives if label else check.negatives).append(score)
+                if frameDict["file"]:
+                    check.frames.append((runDir, frameDict["file"], label))
+
+    @staticmethod
+    def __label(match: Optional[Dict[str, Any]], frameDict: Dict[str, Any], lastFrame: bool, checkObj: recordedCheck) -> Optional[bool]:
+        """
+        Returns whether the check should match the given frame. None in case this is not known.
+        """
+        if not match:
+            return None
+        samePath: bool = match["path"] == checkObj.pathIndex
+        if match["frameId"] is None:
+            # The stage matched via the console, a VM state or a path without checks. The last frame might already show the awaited screen.
+            return None if samePath and lastFrame else False
+        if frameDict["frameId"] != match["frameId"]:
+            return False
+        if samePath and match["check"] == checkObj.checkIndex:
+            return True
+        # Any check of the matching path completes it, so other checks of it may match as well
+        return None if samePath else False
+
+    def suggest(self) -> List[checkCalibration]:
+        """
+        Calculates the suggested thresholds and areas for all checks replayed so far.
+        """
+        for check in self.checks.values():
+            check.suggestionObj.ssimGeq = suggest_threshold(check.positives, check.negatives, self.margin)
+            if self.suggestAreas and check.positives and check.negatives and check.frames:
+                self.__suggest_area(check)
+        return sorted(self.checks.values(), key=lambda c: (c.checkObj.stageName, c.checkObj.pathIndex, c.checkObj.checkIndex))
+
+    def __suggest_area(self, check: checkCalibration) -> None:
+        """
+        Finds the smallest grid aligned area which still separates positives from negatives by at least 'minGap'.
+        Requires stored frames (traceRecorder(saveFrames=True)).
+        """
+        refImg: Optional[cv2.typing.MatLike] = self.__scorer.load_ref(check.checkObj.filePath)
+        if refImg is None:
+            return
+
+        areas: List[area] = candidate_areas(check.checkObj.imageArea, self.grid)
+        positives, negatives = self.__scorer.score_areas(check.checkObj, refImg, check.frames, areas)
+        bestIndex: Optional[int] = self.__pick_area(areas, positives, negatives)
+        if bestIndex is None:
+            return
+        check.suggestionObj.imageArea = areas[bestIndex]
+        check.suggestionObj.areaSsimGeq = suggest_threshold(positives[bestIndex], negatives[bestIndex], self.margin)
+
+    def __pick_area(self, areas: List[area], positives: List[List[float]], negatives: List[List[float]]) -> Optional[int]:
+        """
+        Returns the index of the area separating positives from negatives by the largest gap (at least 'minGap') among the smallest separating areas.
+        Expects the areas to be ordered by their size. None in case no area separates them.
+        """
+        bestIndex: Optional[int] = None
+        bestGap: float = self.minGap
+        for i, candidate in enumerate(areas):
+            if bestIndex is not None and self.__size(candidate) > self.__size(areas[bestIndex]):
+                break
+            if not positives[i] or not negatives[i]:
+                continue
+            gap: float = min(positives[i]) - max(negatives[i])
+            if gap >= bestGap:
+                bestIndex = i
+                bestGap = gap
+        return bestIndex
+
+    @staticmethod
+    def __size(imageArea: area) -> float:
+        return (imageArea.x2Percentage - imageArea.x1Percentage) * (imageArea.y2Percentage - imageArea.y1Percentage)
+
+
+def _format(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.4f}"
+
+
+def _format_area(imageArea: Optional[area]) -> str:
+    if imageArea is None:
+        return "full"
+    return f"x {imageArea.x1Percentage:.3f}-{imageArea.x2Percentage:.3f}, y {imageArea.y1Percentage:.3f}-{imageArea.y2Percentage:.3f}"
+
+
+def print_report(checks: List[checkCalibration]) -> None:
+    """
+    Prints the suggestions for all checks.
+    """
+    for check in checks:
+        checkObj: recordedCheck = check.checkObj
+        suggestionObj: calibrationSuggestion = check.suggestionObj
+        print(f"Stage '{checkObj.stageName}', path {checkObj.pathIndex + 1}, check {checkObj.checkIndex + 1} [{path.basename(checkObj.filePath)}]:")
+        matched: str = f"matched min {_format(min(check.positives) if check.positives else None)} in {len(check.positives)} frame(s)"
+        notMatched: str = f"not matched max {_format(max(check.negatives) if check.negatives else None)} in {len(check.negatives)} frame(s)"
+        print(f"\tssim_geq: {checkObj.ssimGeq:.4f} -> {_format(suggestionObj.ssimGeq)} ({matched}, {notMatched})")
+        if suggestionObj.imageArea:
+            print(f"\tarea: {_format_area(checkObj.imageArea)} -> {_format_area(suggestionObj.imageArea)} with ssim_geq {_format(suggestionObj.areaSsimGeq)}")
+        if check.timedOutBest:
+            print(f"\t⌛ Timed out visits reached at best {_format(check.timedOutBest[0])} at frame {check.timedOutBest[1]}")
+        if check.positives and suggestionObj.ssimGeq is None:
+            print("\t❌ Matched and not matched frames overlap. Consider a different area or reference image.")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """
+    Entry point of 'python -m os_tester.calibrate'.
+
+    Args:
+        argv (Optional[Sequence[str]]): The command line arguments without the program name. Defaults to 'sys.argv[1:]'.
+
+    Returns:
+        int: The process exit code. 1 in case no trace has been found.
+    """
+    parser = argparse.ArgumentParser(prog="python -m os_tester.calibrate", description="Suggests 'ssim_geq' thresholds and areas based on recorded SSIM traces.")
+    parser.add_argument("traceDirs", nargs="+", help="Run directories or directories containing run directories recorded via 'traceRecorder'.")
+    parser.add_argument("--margin", type=float, default=0.005, help="Distance between the suggested threshold and the worst matching frame.")
+    parser.add_argument("--min-gap", type=float, default=0.02, help="Minimum distance between matching and not matching frames for suggesting an area.")
+    parser.add_argument("--grid", type=int, default=4, help="Number of grid cells per axis used for area candidates.")
+    parser.add_argument("--no-areas", action="store_true", help="Do not suggest areas.")
+    parser.add_argument("--ignore-before-match", type=int, default=0, help="Number of frames right before a matching frame not counted as not matching.")
+    parser.add_argument("--output", help="Write the suggestions as JSON to this file.")
+    args = parser.parse_args(argv)
+
+    runDirs: List[str] = find_traces(args.traceDirs)
+    if not runDirs:
+        print(f"No '{TRACE_FILE_NAME}' found inside: {', '.join(args.traceDirs)}")
+        return 1
+
+    calibratorObj: calibrator = calibrator(args.margin, args.min_gap, args.grid, not args.no_areas, args.ignore_before_match)
+    for runDir in runDirs:
+        print(f"Replaying '{runDir}'...")
+        calibratorObj.add_run(runDir)
+
+    checks: List[checkCalibration] = calibratorObj.suggest()
+    print_report(checks)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump([check.to_dict() for check in checks], file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+from contextlib import suppress
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from time import monotonic
+from typing import TYPE_CHECKING, Callable, Optional
+
+from os_tester.exceptions import screenshotError
+from os_tester.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import cv2
+    import numpy as np
+else:
+    cv2 = lazy_import("cv2")
+    np = lazy_import("numpy")
+
+
+class frame:
+    """
+    A single decoded VM screenshot.
+    """
+
+    # Monotonically increasing ID (starting at 0) of the frame since its grabber has been started
+    frameId: int
+    img: cv2.typing.MatLike
+    # When capturing the frame has been requested (time.monotonic())
+    timestamp: float
+
+    def __init__(self, frameId: int, img: cv2.typing.MatLike, timestamp: float):
+        self.frameId = frameId
+        self.img = img
+        self.timestamp = timestamp
+
+
+def decode_frame(data: bytes) -> cv2.typing.MatLike:
+    """
+    Decodes the raw screenshot data (PNG, PPM, ...) into an OpenCV BGR image.
+
+    Raises:
+        screenshotError: In case the data can not be decoded.
+    """
+    img: cv2.typing.MatLike | None = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise screenshotError("Failed to convert current image to CV2 object")
+    return img
+
+
+class frameGrabber:
+    """
+    Captures and decodes screenshots in a background thread while the consumer compares the previous frame.
+    Frames are stored inside a small bounded queue. Consumers always get the newest frame, stale frames get dropped.
+    """
+
+    captureFn: Callable[[], bytes]
+    intervalS: float
+    # Blocks until capturing makes sense (e.g. the VM is running) or the given timeout elapsed. Returns False in case it timed out.
+    waitReadyFn: Optional[Callable[[float], bool]]
+
+    # 'None' wakes up the consumer in case the capture thread failed
+    __queue: "Queue[Optional[frame]]"
+    __stopEvent: Event
+    __thread: Optional[Thread]
+    __error: Optional[Exception]
+
+    def __init__(self, captureFn: Callable[[], bytes], intervalS: float = 0.5, queueSize: int = 2, waitReadyFn: Optional[Callable[[float], bool]] = None):
+        """
+        Args:
+            captureFn (Callable[[], bytes]): Returns the raw data of a fresh screenshot.
+            intervalS (float): Minimum time in seconds between two captures.
+            queueSize (int): Maximum number of decoded frames kept around.
+            waitReadyFn (Optional[Callable[[float], bool]]): Optional gate that pauses capturing, e.g. while the VM is not running.
+        """
+        self.captureFn = captureFn
+        self.intervalS = intervalS
+        self.waitReadyFn = waitReadyFn
+        self.__queue = Queue(maxsize=queueSize)
+        self.__stopEvent = Event()
+        self.__thread = None
+        self.__error = None
+
+    def __put(self, frameObj: Optional[frame]) -> None:
+        """
+        Adds the given frame to the queue and drops the oldest frame in case it is full.
+        """
+        while True:
+            try:
+                self.__queue.put_nowait(frameObj)
+                return
+            except Full:
+                with suppress(Empty):
+                    self.__queue.get_nowait()
+
+    def __run(self) -> None:
+        nextFrameId: int = 0
+        while not self.__stopEvent.is_set():
+            if self.waitReadyFn and not self.waitReadyFn(self.intervalS):
+                continue
+
+            captureStart: float = monotonic()
+            try:
+                img: cv2.typing.MatLike = decode_frame(self.captureFn())
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # Hand the error over to the consumer thread
+                self.__error = e
+                self.__stopEvent.set()
+                self.__put(None)
+                return
+
+            self.__put(frame(nextFrameId, img, captureStart))
+            nextFrameId += 1
+
+            self.__stopEvent.wait(max(0.0, self.intervalS - (monotonic() - captureStart)))
+
+    def start(self) -> None:
+        """
+        Starts capturing frames in the background.
+        """
+        self.__stopEvent.clear()
+        self.__thread = Thread(target=self.__run, name="os_tester_frame_grabber", daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops capturing frames and drops all frames that have not been consumed yet.
+        """
+        self.__stopEvent.set()
+        if self.__thread:
+            # Do not wait forever on a hanging screenshot. The thread is a daemon and exits after the capture returns.
+            self.__thread.join(timeout=max(1.0, self.intervalS))
+            self.__thread = None
+
+        while True:
+            try:
+                self.__queue.get_nowait()
+            except Empty:
+                break
+
+    def get_newest(self, timeoutS: float) -> Optional[frame]:
+        """
+        Waits for a frame and returns the newest one available. Older frames get dropped.
+
+        Args:
+            timeoutS (float): Maximum time in seconds to wait for a frame.
+
+        Returns:
+            Optional[frame]: The newest frame or None in case no frame arrived within the timeout.
+
+        Raises:
+            Exception: The error the capture thread stopped with.
+        """
+        frameObj: Optional[frame] = None
+        try:
+            frameObj = self.__queue.get(timeout=max(0.0, timeoutS))
+            while True:
+                frameObj = self.__queue.get_nowait() or frameObj
+        except Empty:
+            pass
+
+        if self.__error:
+            raise self.__error
+        return frameObj
+
+    def __enter__(self) -> "frameGrabber":
+        self.start()
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.stop()
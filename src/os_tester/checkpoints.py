@@ -0,0 +1,192 @@
+import hashlib
+import json
+from contextlib import suppress
+from html import escape
+from os import listdir, makedirs, path
+from typing import Any, Dict, List, Optional, Tuple
+
+import libvirt
+
+from os_tester.stages import checkFile, maskSpec, stage, stages
+
+# The initial value of the suite prefix hash chain
+_ROOT_KEY: str = "os_tester"
+
+
+def _stage_digest(stageObj: stage) -> str:
+    """
+    Returns a digest over the definition of the given stage including the pixels of all its reference images.
+    """
+    h = hashlib.sha256()
+    h.update(stageObj.name.encode("utf-8"))
+    h.update(str(stageObj.timeoutS).encode("utf-8"))
+    for subPathObj in stageObj.pathsList:
+        h.update(subPathObj.key.encode("utf-8"))
+        for check in subPathObj.checkList:
+            if isinstance(check, checkFile):
+                h.update(check.refImageObj.digest.encode("utf-8"))
+                maskSpecObj: maskSpec = check.maskSpecObj
+                if maskSpecObj.imageObj:
+                    h.update(maskSpecObj.imageObj.digest.encode("utf-8"))
+                h.update(repr([(a.x1Percentage, a.x2Percentage, a.y1Percentage, a.y2Percentage) for a in maskSpecObj.includeAreas + maskSpecObj.excludeAreas]).encode("utf-8"))
+    return h.hexdigest()
+
+
+class checkpoint:
+    """
+    A persisted VM snapshot taken after a stage with 'checkpoint: true' succeeded.
+    """
+
+    key: str
+    # (stage name, next stage name) tuples for all stages that have been executed before taking the snapshot
+    visited: List[Tuple[str, str]]
+    snapshotName: str
+    snapshotXml: str
+
+    def __init__(self, key: str, visited: List[Tuple[str, str]], snapshotName: str, snapshotXml: str):
+        self.key = key
+        self.visited = visited
+        self.snapshotName = snapshotName
+        self.snapshotXml = snapshotXml
+
+    @property
+    def nextStage(self) -> str:
+        """
+        The name of the stage to resume with after restoring this checkpoint.
+        """
+        return self.visited[-1][1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Converts this checkpoint into its JSON representation stored inside the checkpoint directory.
+        """
+        return {"key": self.key, "visited": self.visited, "snapshotName": self.snapshotName, "snapshotXml": self.snapshotXml}
+
+    @staticmethod
+    def from_dict(checkpointDict: Dict[str, Any]) -> "checkpoint":
+        """
+        Creates a checkpoint from its JSON representation created via 'to_dict()'.
+
+        Raises:
+            KeyError: In case a required key is missing.
+            TypeError: In case 'visited' is no list.
+            ValueError: In case an entry of 'visited' is no (stage name, next stage name) pair.
+        """
+        visited: List[Tuple[str, str]] = [(str(name), str(nextStage)) for name, nextStage in checkpointDict["visited"]]
+        return checkpoint(str(checkpointDict["key"]), visited, str(checkpointDict["snapshotName"]), str(checkpointDict["snapshotXml"]))
+
+
+class checkpointStore:
+    """
+    Saves and restores libvirt snapshots of a domain keyed by a hash of the suite prefix (the visited stages and their definitions).
+    The snapshot metadata is stored inside 'dirPath' so snapshots can be redefined for a freshly created domain in later runs.
+    The snapshot data itself stays where libvirt puts it (e.g. inside the qcow2 disk image for internal snapshots).
+    """
+
+    dirPath: str
+
+    def __init__(self, dirPath: str):
+        self.dirPath = dirPath
+        makedirs(self.dirPath, exist_ok=True)
+
+    @staticmethod
+    def prefix_key(stagesObj: stages, visited: List[Tuple[str, str]]) -> Optional[str]:
+        """
+        Calculates the key for the given suite prefix.
+
+        Args:
+            stagesObj (stages): The current stages definition.
+            visited (List[Tuple[str, str]]): (stage name, next stage name) tuples in the order they have been executed.
+
+        Returns:
+            Optional[str]: The prefix key or None in case a visited stage does not exist any more.
+        """
+        stagesDict: Dict[str, stage] = {stageObj.name: stageObj for stageObj in stagesObj.stagesList}
+        key: str = _ROOT_KEY
+        for stageName, nextStage in visited:
+            if stageName not in stagesDict:
+                return None
+            key = hashlib.sha256(f"{key}|{_stage_digest(stagesDict[stageName])}|{nextStage}".encode("utf-8")).hexdigest()
+        return key
+
+    def __checkpoint_path(self, key: str) -> str:
+        return path.join(self.dirPath, f"{key}.json")
+
+    def save(self, vmDom: libvirt.virDomain, stagesObj: stages, visited: List[Tuple[str, str]]) -> checkpoint:
+        """
+        Takes a snapshot of the given domain and persists its metadata for the given suite prefix.
+        An existing snapshot for the same prefix gets replaced.
+
+        Args:
+            vmDom (libvirt.virDomain): The domain to snapshot.
+            stagesObj (stages): The current stages definition.
+            visited (List[Tuple[str, str]]): (stage name, next stage name) tuples in the order they have been executed.
+
+        Returns:
+            checkpoint: The stored checkpoint.
+        """
+        key: Optional[str] = self.prefix_key(stagesObj, visited)
+        assert key
+
+        snapshotName: str = f"os_tester_{key[:16]}"
+        with suppress(libvirt.libvirtError):
+            vmDom.snapshotLookupByName(snapshotName, 0).delete(0)
+
+        description: str = escape(" -> ".join(stageName for stageName, _ in visited))
+        snap: libvirt.virDomainSnapshot = vmDom.snapshotCreateXML(
+            f"<domainsnapshot><name>{snapshotName}</name><description>{description}</description></domainsnapshot>",
+            0,
+        )
+
+        checkpointObj: checkpoint = checkpoint(key, list(visited), snapshotName, snap.getXMLDesc(0))
+        with open(self.__checkpoint_path(key), "w", encoding="utf-8") as file:
+            json.dump(checkpointObj.to_dict(), file, indent=2)
+        return checkpointObj
+
+    def find_latest(self, stagesObj: stages) -> Optional[checkpoint]:
+        """
+        Returns the checkpoint with the longest suite prefix that is still valid for the current stages definition.
+        Checkpoints become invalid once any stage they have visited changed.
+
+        Args:
+            stagesObj (stages): The current stages definition.
+
+        Returns:
+            Optional[checkpoint]: The checkpoint to resume from or None in case there is none.
+        """
+        latest: Optional[checkpoint] = None
+        for fileName in sorted(listdir(self.dirPath)):
+            if not fileName.endswith(".json"):
+                continue
+
+            try:
+                with open(path.join(self.dirPath, fileName), "r", encoding="utf-8") as file:
+                    checkpointObj: checkpoint = checkpoint.from_dict(json.load(file))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Ignoring invalid checkpoint '{fileName}': {e}")
+                continue
+
+            if not checkpointObj.visited or self.prefix_key(stagesObj, checkpointObj.visited) != checkpointObj.key:
+                continue
+            if latest is None or len(checkpointObj.visited) > len(latest.visited):
+                latest = checkpointObj
+        return latest
+
+    def restore(self, vmDom: libvirt.virDomain, checkpointObj: checkpoint) -> None:
+        """
+        Reverts the given domain to the snapshot of the given checkpoint.
+        In case the domain does not know the snapshot (e.g. it has been recreated), the snapshot gets redefined first.
+
+        Args:
+            vmDom (libvirt.virDomain): The domain to revert.
+            checkpointObj (checkpoint): The checkpoint to restore.
+
+        Raises:
+            libvirt.libvirtError: In case the snapshot can not be redefined or reverted to.
+        """
+        snap: libvirt.virDomainSnapshot
+        try:
+            snap = vmDom.snapshotLookupByName(checkpointObj.snapshotName, 0)
+        except libvirt.libvirtError:
+            snap = vmDom.snapshotCreateXML(checkpointObj.snapshotXml, libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_REDEFINE)
+        vmDom.revertToSnapshot(snap, 0)
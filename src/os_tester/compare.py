@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from os_tester.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import cv2
+    import numpy as np
+
+    from os_tester.stages import area
+else:
+    cv2 = lazy_import("cv2")
+    np = lazy_import("numpy")
+
+# SSIM parameters matching the scikit-image defaults ('skimage.metrics.structural_similarity') for 8 bit images
+_SSIM_WIN_SIZE: int = 7
+_SSIM_PAD: int = (_SSIM_WIN_SIZE - 1) // 2
+_SSIM_DATA_RANGE: float = 255.0
+_SSIM_C1: float = (0.01 * _SSIM_DATA_RANGE) ** 2
+_SSIM_C2: float = (0.03 * _SSIM_DATA_RANGE) ** 2
+# Sample instead of population covariance
+_SSIM_COV_NORM: float = _SSIM_WIN_SIZE**2 / (_SSIM_WIN_SIZE**2 - 1)
+
+
+def _mean_filter(src: np.ndarray, dst: np.ndarray) -> None:
+    """
+    Writes the mean over the SSIM window around every pixel of 'src' into 'dst'.
+    """
+    cv2.boxFilter(src, -1, (_SSIM_WIN_SIZE, _SSIM_WIN_SIZE), dst=dst, normalize=True, borderType=cv2.BORDER_REFLECT)
+
+
+def area_to_rect(imageArea: area, w: int, h: int) -> Tuple[int, int, int, int]:
+    """
+    Converts the given normalized area into pixel coordinates for an image of the given size.
+
+    Returns:
+        Tuple[int, int, int, int]: x1, x2, y1, y2
+    """
+    x1 = int(np.floor(imageArea.x1Percentage * w))
+    x2 = int(np.ceil(imageArea.x2Percentage * w))
+    y1 = int(np.floor(imageArea.y1Percentage * h))
+    y2 = int(np.ceil(imageArea.y2Percentage * h))
+    return (x1, x2, y1, y2)
+
+
+class imageMask:
+    """
+    Per pixel weights in [0.0, 1.0] for comparing against a reference image. Pixels with a weight of 0 are ignored.
+    Built once when loading a check (see 'build_mask(...)') and already restricted to the pixels the SSIM gets calculated for.
+    """
+
+    # float32 weights of the same height and width as the reference image
+    weights: np.ndarray
+    # Bounding box (x1, x2, y1, y2) of all pixels with a weight > 0
+    bbox: Tuple[int, int, int, int]
+
+    def __init__(self, weights: np.ndarray, bbox: Tuple[int, int, int, int]):
+        self.weights = weights
+        self.bbox = bbox
+
+
+def build_mask(refShape: Tuple[int, ...], maskImg: Optional[cv2.typing.MatLike], includeAreas: List[area], excludeAreas: List[area], imageArea: Optional[area]) -> imageMask:
+    """
+    Combines a mask image and include/exclude rectangles into the weights used for comparing against a reference image of the given shape.
+
+    Args:
+        refShape (Tuple[int, ...]): Shape of the reference image.
+        maskImg (Optional[cv2.typing.MatLike]): Black (ignore) to white (compare) image. Gets resized to the reference image in case the size differs.
+        includeAreas (List[area]): In case not empty, only pixels inside at least one of them get compared.
+        excludeAreas (List[area]): Pixels inside any of them get ignored.
+        imageArea (Optional[area]): The area of the check. Pixels outside of it (or too close to its border for the SSIM window) get ignored.
+
+    Raises:
+        ValueError: In case no pixel would be compared.
+    """
+    h, w = refShape[:2]
+    weights: np.ndarray
+    if maskImg is None:
+        weights = np.ones((h, w), dtype=np.float32)
+    else:
+        gray: cv2.typing.MatLike = maskImg if maskImg.ndim == 2 else cv2.cvtColor(maskImg, cv2.COLOR_BGR2GRAY)
+        if gray.shape[:2] != (h, w):
+            gray = cv2.resize(gray, (w, h), interpolation=cv2.INTER_NEAREST)
+        weights = gray.astype(np.float32) / 255
+
+    if includeAreas:
+        included: np.ndarray = np.zeros((h, w), dtype=bool)
+        for includeArea in includeAreas:
+            x1, x2, y1, y2 = area_to_rect(includeArea, w, h)
+            included[y1:y2, x1:x2] = True
+        weights[~included] = 0
+
+    for excludeArea in excludeAreas:
+        x1, x2, y1, y2 = area_to_rect(excludeArea, w, h)
+        weights[y1:y2, x1:x2] = 0
+
+    # The SSIM ignores the borders of the compared rectangle, since the filter window does not fit there
+    x1, x2, y1, y2 = area_to_rect(imageArea, w, h) if imageArea else (0, w, 0, h)
+    valid: np.ndarray = np.zeros((h, w), dtype=bool)
+    valid[y1 + _SSIM_PAD : y2 - _SSIM_PAD, x1 + _SSIM_PAD : x2 - _SSIM_PAD] = True
+    weights[~valid] = 0
+
+    rows: np.ndarray = np.flatnonzero(weights.any(axis=1))
+    cols: np.ndarray = np.flatnonzero(weights.any(axis=0))
+    if rows.size == 0:
+        raise ValueError("The mask does not leave any pixel to compare.")
+    return imageMask(weights, (int(cols[0]), int(cols[-1]) + 1, int(rows[0]), int(rows[-1]) + 1))
+
+
+class compWorkspace:
+    """
+    Compares VM images against reference images via the structural similarity index (SSIM) without allocating new arrays on every comparison.
+    Scratch buffers are allocated once per image shape and reused. Call 'reset()' (e.g. once per stage) to release buffers of shapes that are not used any more.
+    The diff image of the last comparison is only calculated once requested via 'diff_image()'.
+    """
+
+    # (shape, name) -> buffer
+    __buffers: Dict[Tuple[Tuple[int, ...], str], np.ndarray]
+    # The float versions of the last compared images, used for calculating the diff image lazily
+    __lastRef: Optional[np.ndarray]
+    __lastCur: Optional[np.ndarray]
+
+    def __init__(self) -> None:
+        self.__buffers = {}
+        self.__lastRef = None
+        self.__lastCur = None
+
+    def reset(self) -> None:
+        """
+        Releases all scratch buffers.
+        """
+        self.__buffers = {}
+        self.__lastRef = None
+        self.__lastCur = None
+
+    def __buffer(self, name: str, shape: Tuple[int, ...], dtype: Optional[type] = None) -> np.ndarray:
+        key: Tuple[Tuple[int, ...], str] = (shape, name)
+        buf: Optional[np.ndarray] = self.__buffers.get(key)
+        if buf is None:
+            buf = np.empty(shape, dtype=dtype if dtype is not None else np.float32)
+            self.__buffers[key] = buf
+        return buf
+
+    def comp_images(self, curImg: cv2.typing.MatLike, refImg: cv2.typing.MatLike, imageArea: Optional[area] = None, mask: Optional[imageMask] = None) -> float:
+        """
+        Compares the provided images and calculates the structural similarity index.
+        The current image gets resized to the size of the reference image in case they differ.
+        Based on: https://scikit-image.org/docs/0.25.x/auto_examples/transform/plot_ssim.html
+
+        With a mask, the result is the mask weighted mean of the SSIM map. Only the bounding box of the mask (plus the SSIM window) gets compared,
+        which yields the same SSIM values for all masked pixels as comparing the whole area.
+
+        Args:
+            curImg (cv2.typing.MatLike): The current image taken from the VM.
+            refImg (cv2.typing.MatLike): The reference image we are awaiting.
+            imageArea (Optional[area]): Optional sub-rectangle (normalized) used for comparison.
+            mask (Optional[imageMask]): Optional per pixel weights built via 'build_mask(...)' for the same reference image and area.
+
+        Returns:
+            float: The structural similarity index in the range [0.0, 1.0].
+        """
+        # Get the dimensions of the reference and current image
+        hRef, wRef = refImg.shape[:2]
+        hCur, wCur = curImg.shape[:2]
+
+        # Resize the current image to match the reference image's dimensions
+        if (hRef != hCur) or (wRef != wCur):
+            curImg = cv2.resize(curImg, (wRef, hRef), dst=self.__buffer("resized", refImg.shape, refImg.dtype.type))
+
+        weights: Optional[np.ndarray] = None
+        if mask is not None:
+            # The mask is already restricted to the area, so its bounding box plus the SSIM window is all that needs to be compared
+            x1, x2, y1, y2 = mask.bbox
+            x1, x2, y1, y2 = (max(0, x1 - _SSIM_PAD), min(wRef, x2 + _SSIM_PAD), max(0, y1 - _SSIM_PAD), min(hRef, y2 + _SSIM_PAD))
+            refImg = refImg[y1:y2, x1:x2]
+            curImg = curImg[y1:y2, x1:x2]
+            weights = mask.weights[y1:y2, x1:x2]
+        # If a sub-area has been defined, cut the image accordingly
+        elif imageArea is not None:
+            x1, x2, y1, y2 = area_to_rect(imageArea, wRef, hRef)
+            refImg = refImg[y1:y2, x1:x2]
+            curImg = curImg[y1:y2, x1:x2]
+
+        ssimIndex: float = self.__ssim(curImg, refImg, weights)
+        return min(1.0, max(0.0, ssimIndex))
+
+    def __ssim(self, curImg: cv2.typing.MatLike, refImg: cv2.typing.MatLike, weights: Optional[np.ndarray] = None) -> float:
+        """
+        Calculates the mean structural similarity index over all channels like 'skimage.metrics.structural_similarity(..., channel_axis=-1)' does,
+        but writes all intermediate results into the preallocated scratch buffers.
+        In case weights are given, the weighted mean of the SSIM map gets returned instead.
+        """
+        shape: Tuple[int, ...] = refImg.shape
+        if min(shape[:2]) < _SSIM_WIN_SIZE:
+            raise ValueError(f"Images to compare have to be at least {_SSIM_WIN_SIZE}x{_SSIM_WIN_SIZE} pixels, got {shape[1]}x{shape[0]}.")
+
+        x: np.ndarray = self.__buffer("x", shape)
+        y: np.ndarray = self.__buffer("y", shape)
+        np.copyto(x, refImg, casting="unsafe")
+        np.copyto(y, curImg, casting="unsafe")
+        self.__lastRef = x
+        self.__lastCur = y
+
+        ux, uy, vx, vy, vxy, tmp = self.__local_statistics(x, y)
+
+        # Numerator: (2 * ux * uy + C1) * (2 * vxy + C2) -> tmp
+        tmp *= 2
+        tmp += _SSIM_C1
+        vxy *= 2
+        vxy += _SSIM_C2
+        tmp *= vxy
+
+        # Denominator: (ux * ux + uy * uy + C1) * (vx + vy + C2) -> ux
+        ux *= ux
+        uy *= uy
+        ux += uy
+        ux += _SSIM_C1
+        vx += vy
+        vx += _SSIM_C2
+        ux *= vx
+
+        # SSIM map -> tmp
+        tmp /= ux
+        return self.__reduce_ssim_map(tmp, weights)
+
+    def __local_statistics(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Calculates the local means, variances and the covariance of both images over the SSIM window.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]: The buffers ux, uy, vx, vy, vxy and a scratch buffer holding ux * uy.
+        """
+        shape: Tuple[int, ...] = x.shape
+        ux: np.ndarray = self.__buffer("ux", shape)
+        uy: np.ndarray = self.__buffer("uy", shape)
+        vx: np.ndarray = self.__buffer("vx", shape)
+        vy: np.ndarray = self.__buffer("vy", shape)
+        vxy: np.ndarray = self.__buffer("vxy", shape)
+        tmp: np.ndarray = self.__buffer("tmp", shape)
+
+        _mean_filter(x, ux)
+        _mean_filter(y, uy)
+
+        # vx = cov_norm * (E[x * x] - ux * ux), vy and vxy likewise
+        for a, b, ua, ub, dst in ((x, x, ux, ux, vx), (y, y, uy, uy, vy), (x, y, ux, uy, vxy)):
+            np.multiply(a, b, out=tmp)
+            _mean_filter(tmp, dst)
+            np.multiply(ua, ub, out=tmp)
+            dst -= tmp
+            dst *= _SSIM_COV_NORM
+        return ux, uy, vx, vy, vxy, tmp
+
+    @staticmethod
+    def __reduce_ssim_map(ssimMapFull: np.ndarray, weights: Optional[np.ndarray]) -> float:
+        """
+        Returns the (weighted) mean of the SSIM map without the borders which are influenced by the filter padding.
+
+        Raises:
+            ValueError: In case the weights do not leave any pixel to compare.
+        """
+        h, w = ssimMapFull.shape[:2]
+        ssimMap: np.ndarray = ssimMapFull[_SSIM_PAD : h - _SSIM_PAD, _SSIM_PAD : w - _SSIM_PAD]
+        if weights is None:
+            return float(ssimMap.mean(dtype=np.float64))
+
+        validWeights: np.ndarray = weights[_SSIM_PAD : h - _SSIM_PAD, _SSIM_PAD : w - _SSIM_PAD]
+        weightSum: float = float(validWeights.sum(dtype=np.float64))
+        if weightSum <= 0:
+            raise ValueError("The mask does not leave any pixel to compare.")
+        channels: int = ssimMap.shape[2] if ssimMap.ndim == 3 else 1
+        np.multiply(ssimMap, validWeights[..., None] if ssimMap.ndim == 3 else validWeights, out=ssimMap)
+        return float(ssimMap.sum(dtype=np.float64)) / (weightSum * channels)
+
+    def diff_image(self) -> cv2.typing.MatLike:
+        """
+        Calculates |refImg - curImg| for the last compared images (after resizing and cropping).
+        The result is only valid until the next comparison.
+
+        Returns:
+            cv2.typing.MatLike: The float32 image diff.
+        """
+        if self.__lastRef is None or self.__lastCur is None:
+            raise ValueError("No images have been compared yet.")
+        # Use absdiff on float to avoid uint8 saturation masking differences.
+        return cv2.absdiff(self.__lastRef, self.__lastCur, dst=self.__buffer("diff", self.__lastRef.shape))
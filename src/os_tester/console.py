@@ -0,0 +1,182 @@
+import codecs
+import re
+from contextlib import suppress
+from threading import Condition, Thread
+from typing import Any, Dict, Optional
+
+
+class consoleBuffer:
+    """
+    A bounded rolling buffer of console text.
+    Offsets are absolute (counted since the buffer has been created), so they stay valid while old text gets dropped.
+
+    Searching is incremental: text a pattern has already been searched without a match is not searched again, except for an overlap of 'maxMatchLen' characters for matches spanning old and new text.
+    A match consumes all text up to its end, so later searches only see newer output.
+    """
+
+    maxSize: int
+    maxMatchLen: int
+    text: str
+    # Absolute offset of 'text[0]'
+    startOffset: int
+    # Absolute offset up to which text has been consumed by matches
+    consumedOffset: int
+    # Pattern -> absolute offset up to which it has been searched without a match
+    __scannedOffsets: Dict[str, int]
+
+    def __init__(self, maxSize: int = 65536, maxMatchLen: int = 4096):
+        self.maxSize = maxSize
+        self.maxMatchLen = maxMatchLen
+        self.text = ""
+        self.startOffset = 0
+        self.consumedOffset = 0
+        self.__scannedOffsets = {}
+
+    @property
+    def endOffset(self) -> int:
+        """
+        Absolute offset right after the newest console output.
+        """
+        return self.startOffset + len(self.text)
+
+    def append(self, data: str) -> None:
+        """
+        Appends new console output and drops the oldest text in case the buffer exceeds 'maxSize'.
+        """
+        self.text += data
+        if len(self.text) > self.maxSize:
+            dropped: int = len(self.text) - self.maxSize
+            self.text = self.text[dropped:]
+            self.startOffset += dropped
+
+    def search(self, regex: "re.Pattern[str]") -> Optional["re.Match[str]"]:
+        """
+        Searches the not yet consumed console output for the given regular expression.
+
+        Args:
+            regex (re.Pattern[str]): The compiled regular expression.
+
+        Returns:
+            Optional[re.Match[str]]: The match (positions are relative to 'text' at the time of the call) or None.
+        """
+        searchFrom: int = max(self.startOffset, self.consumedOffset, self.__scannedOffsets.get(regex.pattern, 0) - self.maxMatchLen)
+        match: Optional["re.Match[str]"] = regex.search(self.text, searchFrom - self.startOffset)
+        if not match:
+            self.__scannedOffsets[regex.pattern] = self.endOffset
+            return None
+
+        self.consumedOffset = self.startOffset + match.end()
+        return match
+
+
+class consoleReader:
+    """
+    Streams the serial console of a libvirt domain ('virDomain.openConsole') in a background thread into a 'consoleBuffer'.
+    """
+
+    conn: Any
+    vmDom: Any
+    buffer: consoleBuffer
+
+    __stream: Any
+    __thread: Optional[Thread]
+    __condition: Condition
+    __running: bool
+
+    def __init__(self, conn: Any, vmDom: Any, maxBufferSize: int = 65536, buffer: Optional[consoleBuffer] = None):
+        """
+        Args:
+            conn (libvirt.virConnect): The connection the domain belongs to.
+            vmDom (libvirt.virDomain): The domain to read the console from.
+            maxBufferSize (int): The maximum number of characters kept in the rolling buffer.
+            buffer (Optional[consoleBuffer]): Continue with the buffer of a previous reader, e.g. after its stream ended. Ignores 'maxBufferSize'.
+        """
+        self.conn = conn
+        self.vmDom = vmDom
+        self.buffer = buffer if buffer is not None else consoleBuffer(maxBufferSize)
+        self.__stream = None
+        self.__thread = None
+        self.__condition = Condition()
+        self.__running = False
+
+    def __run(self) -> None:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            try:
+                data: Any = self.__stream.recv(4096)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                if self.__running:
+                    print(f"Reading the VM console failed: {e}")
+                break
+
+            if data == b"":
+                break
+
+            with self.__condition:
+                self.buffer.append(decoder.decode(data))
+                self.__condition.notify_all()
+
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify_all()
+
+    def start(self) -> None:
+        """
+        Opens the console of the domain and starts reading it in the background.
+
+        Raises:
+            libvirt.libvirtError: In case the console can not be opened (e.g. the domain has no console or it is in use).
+        """
+        self.__stream = self.conn.newStream(0)
+        self.vmDom.openConsole(None, self.__stream, 0)
+        self.__running = True
+        self.__thread = Thread(target=self.__run, name="os_tester_console_reader", daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """
+        Closes the console stream and stops the background thread.
+        """
+        with self.__condition:
+            self.__running = False
+        if self.__stream is not None:
+            with suppress(Exception):
+                self.__stream.abort()
+            self.__stream = None
+        if self.__thread:
+            self.__thread.join(timeout=1.0)
+            self.__thread = None
+
+    def search(self, regex: "re.Pattern[str]") -> Optional["re.Match[str]"]:
+        """
+        Thread safe version of 'consoleBuffer.search(...)'.
+        """
+        with self.__condition:
+            return self.buffer.search(regex)
+
+    @property
+    def endOffset(self) -> int:
+        """
+        Thread safe version of 'consoleBuffer.endOffset'.
+        """
+        with self.__condition:
+            return self.buffer.endOffset
+
+    @property
+    def running(self) -> bool:
+        """
+        False once the console stream reached its end or failed (e.g. the VM has been shut down) or 'stop()' has been called.
+        """
+        with self.__condition:
+            return self.__running
+
+    def wait_for_data(self, sinceOffset: int, timeoutS: float) -> None:
+        """
+        Blocks until console output past 'sinceOffset' is available, the console stream ended or the timeout elapsed.
+
+        Args:
+            sinceOffset (int): The absolute 'endOffset' of the buffer the caller has already seen.
+            timeoutS (float): Maximum time in seconds to wait.
+        """
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.buffer.endOffset > sinceOffset or not self.__running, max(0.0, timeoutS))
@@ -0,0 +1,224 @@
+from threading import Condition, Thread
+from time import monotonic, sleep
+from typing import Any, List, Optional, Tuple
+
+import libvirt
+
+from os_tester.exceptions import osTesterError
+
+# The thread running the libvirt default event loop
+_eventLoopThread: Optional[Thread] = None
+
+# Maps libvirt lifecycle events to the states stages can await
+_EVENT_STATES = {
+    libvirt.VIR_DOMAIN_EVENT_STARTED: "running",
+    libvirt.VIR_DOMAIN_EVENT_RESUMED: "running",
+    libvirt.VIR_DOMAIN_EVENT_SUSPENDED: "paused",
+    libvirt.VIR_DOMAIN_EVENT_PMSUSPENDED: "paused",
+    libvirt.VIR_DOMAIN_EVENT_STOPPED: "stopped",
+    libvirt.VIR_DOMAIN_EVENT_CRASHED: "crashed",
+}
+
+# Maps libvirt domain states ('virDomain.state()') to the states stages can await
+_DOMAIN_STATES = {
+    libvirt.VIR_DOMAIN_RUNNING: "running",
+    libvirt.VIR_DOMAIN_BLOCKED: "running",
+    # The guest is shutting down, but still running
+    libvirt.VIR_DOMAIN_SHUTDOWN: "running",
+    libvirt.VIR_DOMAIN_PAUSED: "paused",
+    libvirt.VIR_DOMAIN_PMSUSPENDED: "paused",
+    libvirt.VIR_DOMAIN_SHUTOFF: "stopped",
+    libvirt.VIR_DOMAIN_CRASHED: "crashed",
+}
+
+
+def _run_event_loop() -> None:
+    while True:
+        libvirt.virEventRunDefaultImpl()
+
+
+def start_event_loop() -> None:
+    """
+    Registers the libvirt default event loop implementation and runs it inside a background thread.
+    Has to be called before opening the libvirt connection, so lifecycle events get delivered.
+    Calling it multiple times is fine.
+    """
+    global _eventLoopThread  # pylint: disable=global-statement
+    if _eventLoopThread:
+        return
+
+    libvirt.virEventRegisterDefaultImpl()
+    _eventLoopThread = Thread(target=_run_event_loop, name="os_tester_libvirt_events", daemon=True)
+    _eventLoopThread.start()
+
+
+def event_loop_running() -> bool:
+    """
+    Returns:
+        bool: True in case 'start_event_loop()' has been called.
+    """
+    return _eventLoopThread is not None
+
+
+class domainStateWatcher:
+    """
+    Tracks the power state of a domain via libvirt lifecycle events ('domainEventRegisterAny').
+    In case the event loop is not running (see 'start_event_loop()'), the state is polled via 'virDomain.state()' instead.
+    Reboots can only be detected via events.
+    """
+
+    conn: libvirt.virConnect
+    vmDom: libvirt.virDomain
+    # (time.monotonic(), state) tuples for every received state change including reboots
+    transitions: List[Tuple[float, str]]
+
+    __state: str
+    __rebooted: bool
+    __callbackIds: List[int]
+    __condition: Condition
+
+    def __init__(self, conn: libvirt.virConnect, vmDom: libvirt.virDomain):
+        self.conn = conn
+        self.vmDom = vmDom
+        self.transitions = list()
+        self.__rebooted = False
+        self.__callbackIds = list()
+        self.__condition = Condition()
+        self.__state = self.__poll_state()
+
+        if event_loop_running():
+            self.__callbackIds.append(self.conn.domainEventRegisterAny(self.vmDom, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, self.__on_lifecycle, None))
+            self.__callbackIds.append(self.conn.domainEventRegisterAny(self.vmDom, libvirt.VIR_DOMAIN_EVENT_ID_REBOOT, self.__on_reboot, None))
+
+    def __poll_state(self) -> str:
+        try:
+            return _DOMAIN_STATES.get(self.vmDom.state()[0], "running")
+        except libvirt.libvirtError:
+            # Transient domains vanish once they are stopped
+            return "stopped"
+
+    def __on_lifecycle(self, _conn: Any, _dom: Any, event: int, _detail: int, _opaque: Any) -> None:
+        state: Optional[str] = _EVENT_STATES.get(event)
+        if not state:
+            return
+        with self.__condition:
+            self.__state = state
+            self.transitions.append((monotonic(), state))
+            self.__condition.notify_all()
+
+    def __on_reboot(self, _conn: Any, _dom: Any, _opaque: Any) -> None:
+        with self.__condition:
+            self.__rebooted = True
+            self.transitions.append((monotonic(), "rebooted"))
+            self.__condition.notify_all()
+
+    @property
+    def useEvents(self) -> bool:
+        """
+        True in case state changes are received via lifecycle events. Otherwise the state gets polled.
+        """
+        return bool(self.__callbackIds)
+
+    @property
+    def state(self) -> str:
+        """
+        The current state of the domain. One of: running, paused, stopped, crashed
+        """
+        if not self.useEvents:
+            return self.__poll_state()
+        with self.__condition:
+            return self.__state
+
+    @property
+    def running(self) -> bool:
+        """
+        True in case the domain is running.
+        """
+        return self.state == "running"
+
+    def reset_reboot(self) -> None:
+        """
+        Forgets about reboots that happened so far. Called once a stage matched, so 'rebooted' only covers reboots afterwards.
+        """
+        with self.__condition:
+            self.__rebooted = False
+
+    def has_state(self, state: str) -> bool:
+        """
+        Checks whether the domain is in the given state.
+        'rebooted' is true in case the domain rebooted since the last call to 'reset_reboot()'.
+
+        Raises:
+            osTesterError: In case 'rebooted' is requested without a running event loop.
+        """
+        if state == "rebooted":
+            if not self.useEvents:
+                raise osTesterError("Awaiting the 'rebooted' state requires os_tester.events.start_event_loop() to be called before opening the libvirt connection.")
+            with self.__condition:
+                return self.__rebooted
+        return self.state == state
+
+    def transition_time(self, state: str) -> Optional[float]:
+        """
+        Returns when the domain entered the given state, in case it currently is in it.
+        For 'rebooted' this is the time of the latest reboot since the last call to 'reset_reboot()'.
+
+        Returns:
+            Optional[float]: The 'time.monotonic()' of the transition. None in case the domain is not in the given state or the transition has not been received as event.
+        """
+        if not self.useEvents:
+            return None
+        rebooted: bool = state == "rebooted"
+        with self.__condition:
+            if not (self.__rebooted if rebooted else self.__state == state):
+                return None
+            for timestamp, transitionState in reversed(self.transitions):
+                if (transitionState == "rebooted") == rebooted:
+                    return timestamp
+        # The domain has been in this state since before the watcher has been created
+        return None
+
+    @property
+    def changeCount(self) -> int:
+        """
+        The number of state changes received so far.
+        """
+        with self.__condition:
+            return len(self.transitions)
+
+    def wait_for_change(self, sinceCount: int, timeoutS: float) -> None:
+        """
+        Blocks until more than 'sinceCount' state changes have been received or until the timeout elapsed.
+        Without a running event loop this sleeps for the given timeout.
+        """
+        if not self.useEvents:
+            sleep(max(0.0, timeoutS))
+            return
+        with self.__condition:
+            self.__condition.wait_for(lambda: len(self.transitions) > sinceCount, max(0.0, timeoutS))
+
+    def wait_for_running(self, timeoutS: float) -> bool:
+        """
+        Blocks until the domain is running or until the timeout elapsed.
+
+        Returns:
+            bool: True in case the domain is running.
+        """
+        if not self.useEvents:
+            if self.running:
+                return True
+            sleep(max(0.0, timeoutS))
+            return False
+        with self.__condition:
+            return self.__condition.wait_for(lambda: self.__state == "running", max(0.0, timeoutS))
+
+    def close(self) -> None:
+        """
+        Deregisters all event callbacks.
+        """
+        for callbackId in self.__callbackIds:
+            try:
+                self.conn.domainEventDeregisterAny(callbackId)
+            except libvirt.libvirtError as e:
+                print(f"Failed to deregister domain event callback: {e}")
+        self.__callbackIds = list()
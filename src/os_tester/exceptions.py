@@ -0,0 +1,115 @@
+from typing import Optional
+
+
+class osTesterError(Exception):
+    """
+    Base class for all errors raised while loading or running stages.
+    'exitCode' is the process exit code scripts should use when terminating because of this error.
+    """
+
+    exitCode: int = 1
+
+    def __init__(self, message: str, exitCode: Optional[int] = None):
+        super().__init__(message)
+        if exitCode is not None:
+            self.exitCode = exitCode
+
+
+class loadError(osTesterError):
+    """
+    A stage config or reference image file does not exist, is no file or could not be parsed.
+    """
+
+
+class screenshotError(osTesterError):
+    """
+    The VM screenshot could not be converted to an OpenCV object.
+    """
+
+    exitCode = 6
+
+
+class consoleError(osTesterError):
+    """
+    The serial console of the VM could not be opened.
+    """
+
+    exitCode = 7
+
+
+class vmError(osTesterError):
+    """
+    A libvirt call on the VM failed while running a stage (e.g. taking a screenshot or rebooting).
+    """
+
+    exitCode = 8
+
+
+class actionError(osTesterError):
+    """
+    A stage action is unknown.
+    """
+
+    exitCode = 9
+
+
+class stageTimeoutError(osTesterError):
+    """
+    None of the paths of a stage matched within its timeout.
+    """
+
+    exitCode = 5
+
+    stageName: str
+    timeoutS: float
+
+    def __init__(self, stageName: str, timeoutS: float):
+        super().__init__(f"Timeout for stage '{stageName}' reached after {timeoutS} seconds.")
+        self.stageName = stageName
+        self.timeoutS = timeoutS
+
+
+class stageNotFoundError(osTesterError):
+    """
+    A path references a next stage that does not exist.
+    """
+
+    exitCode = 10
+
+    stageName: str
+
+    def __init__(self, stageName: str):
+        super().__init__(f"No Stage named '{stageName}' was found.")
+        self.stageName = stageName
+
+
+class noHostAvailableError(osTesterError):
+    """
+    No host of a connection pool is reachable and has a free slot and enough memory for another VM.
+    """
+
+    exitCode = 11
+
+
+class provisionError(osTesterError):
+    """
+    The overlay image for a new VM could not be created.
+    """
+
+    exitCode = 12
+
+
+class outputError(osTesterError):
+    """
+    A result of a run (match statistics, SSIM trace, matched image, ...) could not be written.
+    """
+
+    exitCode = 13
+
+
+class compareError(osTesterError):
+    """
+    A reference image could not be compared to the VM screenshot, e.g. because its comparison area is smaller than the SSIM window.
+    """
+
+    exitCode = 14
@@ -0,0 +1,53 @@
+from importlib import import_module
+from threading import Lock
+from types import ModuleType
+from typing import Any, Optional
+
+
+class lazyModule:
+    """
+    Stands in for a module and only imports it once one of its attributes is accessed.
+    Accessed attributes are cached on the proxy, so later accesses cost the same as for the module itself.
+
+    Usage, keeping the real module for type checkers:
+        if TYPE_CHECKING:
+            import cv2
+        else:
+            cv2 = lazy_import("cv2")
+
+    Modules using this need 'from __future__ import annotations', since evaluating annotations like 'cv2.typing.MatLike' would import the module.
+    """
+
+    __name: str
+    __module: Optional[ModuleType]
+    __lock: Lock
+
+    def __init__(self, name: str):
+        self.__name = name
+        self.__module = None
+        self.__lock = Lock()
+
+    def __load(self) -> ModuleType:
+        with self.__lock:
+            if self.__module is None:
+                self.__module = import_module(self.__name)
+            return self.__module
+
+    def __getattr__(self, attr: str) -> Any:
+        # Only called for attributes that have not been cached yet
+        value: Any = getattr(self.__load(), attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self) -> str:
+        return f"<lazy module '{self.__name}'{' (loaded)' if self.__module is not None else ''}>"
+
+
+def lazy_import(name: str) -> Any:
+    """
+    Returns a proxy for the given module which imports it on first use.
+
+    Args:
+        name (str): The absolute module name, e.g. 'cv2' or 'matplotlib.pyplot'.
+    """
+    return lazyModule(name)
@@ -0,0 +1,135 @@
+import json
+from os import path
+from typing import Any, Dict, List, Tuple, Union
+
+from os_tester.stages import checkConsole, checkFile, checkState, stage, subPath
+
+
+class matchStats:
+    """
+    Per suite statistics about which paths and checks matched in previous runs.
+    Used to evaluate the most likely path first for stages that allow reordering ('reorder_paths').
+    """
+
+    # Weight of the newest SSIM value in the exponential moving average score trend of a check.
+    TREND_WEIGHT: float = 0.2
+
+    filePath: str
+    statsDict: Dict[str, Dict[str, Dict[str, Any]]]
+
+    def __init__(self, filePath: str):
+        self.filePath = filePath
+        self.statsDict = {}
+        self.__load()
+
+    def __load(self) -> None:
+        """
+        Loads previously persisted statistics from 'self.filePath' in case they exist.
+        Broken or unreadable statistics are ignored since they only influence the evaluation order.
+        """
+        if not path.isfile(self.filePath):
+            return
+
+        try:
+            with open(self.filePath, "r", encoding="utf-8") as file:
+                statsDict: Any = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring invalid match statistics at '{self.filePath}': {e}")
+            return
+
+        if isinstance(statsDict, dict):
+            self.statsDict = statsDict
+
+    def save(self) -> None:
+        """
+        Persists the current statistics to 'self.filePath'.
+        """
+        with open(self.filePath, "w", encoding="utf-8") as file:
+            json.dump(self.statsDict, file, indent=2, sort_keys=True)
+
+    def __get_path_stats(self, stageObj: stage, subPathObj: subPath) -> Dict[str, Any]:
+        pathsDict: Dict[str, Dict[str, Any]] = self.statsDict.setdefault(stageObj.name, {})
+        pathStats: Dict[str, Any] = pathsDict.setdefault(subPathObj.key, {"matches": 0, "checks": {}})
+        # Statistics written before trends were kept per check only contain a per path 'ssimTrend'
+        pathStats.setdefault("ssimTrends", {})
+        return pathStats
+
+    def record_score(self, stageObj: stage, subPathObj: subPath, checkIndex: int, ssim: float) -> None:
+        """
+        Updates the score trend of the given check with a freshly measured SSIM value.
+        Trends are kept per check, since the SSIM of different reference images and areas is not comparable.
+
+        Args:
+            stageObj (stage): The stage the path belongs to.
+            subPathObj (subPath): The path that has been evaluated.
+            checkIndex (int): The index of the evaluated check inside 'subPathObj.checkList'.
+            ssim (float): The measured structural similarity index.
+        """
+        trendsDict: Dict[str, float] = self.__get_path_stats(stageObj, subPathObj)["ssimTrends"]
+        trendsDict[str(checkIndex)] = (1 - self.TREND_WEIGHT) * trendsDict.get(str(checkIndex), 0.0) + self.TREND_WEIGHT * ssim
+
+    def record_match(self, stageObj: stage, subPathObj: subPath, checkIndex: int) -> None:
+        """
+        Records that the given check of the given path matched.
+
+        Args:
+            stageObj (stage): The stage the path belongs to.
+            subPathObj (subPath): The path that matched.
+            checkIndex (int): The index of the matching check inside 'subPathObj.checkList'.
+        """
+        pathStats: Dict[str, Any] = self.__get_path_stats(stageObj, subPathObj)
+        pathStats["matches"] += 1
+        checksDict: Dict[str, int] = pathStats["checks"]
+        checksDict[str(checkIndex)] = checksDict.get(str(checkIndex), 0) + 1
+
+    def order_paths(self, stageObj: stage) -> List[Tuple[int, subPath]]:
+        """
+        Returns the paths of the given stage in the order they should be evaluated.
+        Without 'reorder_paths' this is the YAML order.
+        Otherwise paths are sorted by their match count and the best score trend of their checks.
+        Paths without checks always match, so they and all paths after them keep their position.
+
+        Args:
+            stageObj (stage): The stage to order the paths for.
+
+        Returns:
+            List[Tuple[int, subPath]]: Tuples of the original (zero based) path index and the path.
+        """
+        indexedPaths: List[Tuple[int, subPath]] = list(enumerate(stageObj.pathsList))
+        if not stageObj.reorderPaths:
+            return indexedPaths
+
+        reorderCount: int = len(indexedPaths)
+        for i, subPathObj in indexedPaths:
+            if not subPathObj.checkList:
+                reorderCount = i
+                break
+
+        pathsDict: Dict[str, Dict[str, Any]] = self.statsDict.get(stageObj.name, {})
+
+        def sort_key(indexedPath: Tuple[int, subPath]) -> Tuple[int, float, int]:
+            pathStats: Dict[str, Any] = pathsDict.get(indexedPath[1].key, {})
+            # Any check completes the path, so the path is as promising as its best check
+            bestTrend: float = max((float(trend) for trend in pathStats.get("ssimTrends", {}).values()), default=0.0)
+            return (-int(pathStats.get("matches", 0)), -bestTrend, indexedPath[0])
+
+        return sorted(indexedPaths[:reorderCount], key=sort_key) + indexedPaths[reorderCount:]
+
+    def order_checks(self, stageObj: stage, subPathObj: subPath) -> List[Tuple[int, Union[checkFile, checkConsole, checkState]]]:
+        """
+        Returns the checks of the given path in the order they should be evaluated.
+        Any matching check completes the path, so for stages with 'reorder_paths' the most frequently matching check comes first.
+
+        Args:
+            stageObj (stage): The stage the path belongs to.
+            subPathObj (subPath): The path to order the checks for.
+
+        Returns:
+            List[Tuple[int, Union[checkFile, checkConsole, checkState]]]: Tuples of the original (zero based) check index and the check.
+        """
+        indexedChecks: List[Tuple[int, Union[checkFile, checkConsole, checkState]]] = list(enumerate(subPathObj.checkList))
+        if not stageObj.reorderPaths:
+            return indexedChecks
+
+        checksDict: Dict[str, int] = self.statsDict.get(stageObj.name, {}).get(subPathObj.key, {}).get("checks", {})
+        return sorted(indexedChecks, key=lambda indexedCheck: (-int(checksDict.get(str(indexedCheck[0]), 0)), indexedCheck[0]))
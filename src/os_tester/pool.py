@@ -0,0 +1,316 @@
+from contextlib import suppress
+from threading import Condition, RLock
+from time import monotonic
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Union
+from uuid import uuid4
+
+import libvirt
+
+from os_tester.exceptions import noHostAvailableError
+
+
+class hostStats:
+    """
+    Snapshot of the resources of a pool host as reported by libvirt.
+    """
+
+    conn: libvirt.virConnect
+    totalMemoryKiB: int
+    freeMemoryKiB: int
+    cpus: int
+    # vCPUs of all active domains
+    allocatedVcpus: int
+    # UUIDs of all active domains
+    activeUuids: Set[str]
+
+    def __init__(self, conn: libvirt.virConnect, totalMemoryKiB: int, freeMemoryKiB: int, cpus: int, allocatedVcpus: int, activeUuids: Set[str]):
+        self.conn = conn
+        self.totalMemoryKiB = totalMemoryKiB
+        self.freeMemoryKiB = freeMemoryKiB
+        self.cpus = cpus
+        self.allocatedVcpus = allocatedVcpus
+        self.activeUuids = activeUuids
+
+
+class poolHost:
+    """
+    A single libvirt host of a 'connectionPool' together with its concurrency limit.
+    Dropped connections get reopened on demand. Hosts that can not be reached are retried after 'reconnectIntervalS'.
+    """
+
+    uri: str
+    # Maximum number of VMs leased on this host at the same time
+    maxVms: int
+    reconnectIntervalS: float
+    conn: Optional[libvirt.virConnect]
+    activeLeases: List["hostLease"]
+
+    __retryAt: float
+    # Serializes libvirt calls on this host without blocking the whole pool
+    __lock: RLock
+
+    def __init__(self, uri: str, maxVms: int, reconnectIntervalS: float = 10.0):
+        if maxVms < 1:
+            raise ValueError(f"Expected 'maxVms' of host '{uri}' to be >= 1, got {maxVms}.")
+        self.uri = uri
+        self.maxVms = maxVms
+        self.reconnectIntervalS = reconnectIntervalS
+        self.conn = None
+        self.activeLeases = list()
+        self.__retryAt = 0.0
+        self.__lock = RLock()
+
+    @property
+    def leases(self) -> int:
+        """
+        The number of VMs currently placed on this host.
+        """
+        return len(self.activeLeases)
+
+    @property
+    def reservedMemoryKiB(self) -> int:
+        """
+        The memory in KiB reserved by all active leases on this host.
+        """
+        return sum(leaseObj.memoryKiB for leaseObj in self.activeLeases)
+
+    @property
+    def reservedVcpus(self) -> int:
+        """
+        The number of vCPUs reserved by all active leases on this host.
+        """
+        return sum(leaseObj.vcpus for leaseObj in self.activeLeases)
+
+    def __is_alive(self) -> bool:
+        if not self.conn:
+            return False
+        try:
+            return bool(self.conn.isAlive())
+        except Exception:  # pylint: disable=broad-exception-caught
+            # Closed connections raise instead of returning False
+            return False
+
+    def connection(self) -> Optional[libvirt.virConnect]:
+        """
+        Returns the connection to the host and reconnects in case it dropped.
+
+        Returns:
+            Optional[libvirt.virConnect]: The connection or None in case the host can not be reached.
+        """
+        with self.__lock:
+            if self.__is_alive():
+                return self.conn
+
+            self.close()
+            if monotonic() < self.__retryAt:
+                return None
+
+            try:
+                self.conn = libvirt.open(self.uri)
+            except libvirt.libvirtError as e:
+                print(f"Failed to connect to '{self.uri}'. Retrying in {self.reconnectIntervalS}s. {e}")
+                self.__retryAt = monotonic() + self.reconnectIntervalS
+                return None
+            return self.conn
+
+    def query(self) -> Optional[hostStats]:
+        """
+        Queries the current resources of the host. Might block for a long time in case the host is slow or unreachable.
+
+        Returns:
+            Optional[hostStats]: The resources or None in case the host can not be reached.
+        """
+        with self.__lock:
+            conn: Optional[libvirt.virConnect] = self.connection()
+            if not conn:
+                return None
+
+            try:
+                # [model, memory (MiB), cpus, mhz, nodes, sockets, cores, threads]
+                info: List[Any] = conn.getInfo()
+                freeMemoryKiB: int = conn.getFreeMemory() // 1024
+                domains: List[libvirt.virDomain] = conn.listAllDomains(libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE)
+                # [state, maxMem, memory, nrVirtCpu, cpuTime]
+                allocatedVcpus: int = sum(dom.info()[3] for dom in domains)
+                activeUuids: Set[str] = {dom.UUIDString() for dom in domains}
+            except libvirt.libvirtError as e:
+                print(f"Failed to query the load of '{self.uri}': {e}")
+                return None
+
+        return hostStats(conn, max(1, int(info[1]) * 1024), freeMemoryKiB, max(1, int(info[2])), allocatedVcpus, activeUuids)
+
+    def load(self, statsObj: hostStats, memoryKiB: int = 0, vcpus: int = 0) -> Optional[float]:
+        """
+        Returns how loaded the host would be after placing a VM with the given requirements on it.
+        The load is the larger of the used memory and the allocated vCPU fraction, including all active leases.
+        Leases whose VM is already running are part of the host statistics, so only the resources of the other leases get reserved on top.
+
+        Args:
+            statsObj (hostStats): The resources of the host as returned by 'query()'.
+            memoryKiB (int): Memory the new VM requires.
+            vcpus (int): Number of vCPUs of the new VM.
+
+        Returns:
+            Optional[float]: The load or None in case the host has no free slot or not enough free memory.
+        """
+        if self.leases >= self.maxVms:
+            return None
+
+        pendingLeases: List[hostLease] = [leaseObj for leaseObj in self.activeLeases if leaseObj.uuid not in statsObj.activeUuids]
+        availableMemoryKiB: int = statsObj.freeMemoryKiB - sum(leaseObj.memoryKiB for leaseObj in pendingLeases)
+        if availableMemoryKiB < memoryKiB:
+            return None
+
+        memoryLoad: float = 1 - (availableMemoryKiB - memoryKiB) / statsObj.totalMemoryKiB
+        vcpuLoad: float = (statsObj.allocatedVcpus + sum(leaseObj.vcpus for leaseObj in pendingLeases) + vcpus) / statsObj.cpus
+        return max(memoryLoad, vcpuLoad)
+
+    def close(self) -> None:
+        """
+        Closes the connection to the host in case it is open.
+        """
+        with self.__lock:
+            if self.conn:
+                with suppress(Exception):
+                    self.conn.close()
+                self.conn = None
+
+
+class hostLease:
+    """
+    A slot on a pool host. Create the VM with 'uuid' via 'conn' and release the lease once the VM has been destroyed.
+    Can be used as context manager.
+    """
+
+    pool: "connectionPool"
+    host: poolHost
+    conn: libvirt.virConnect
+    # UUID of the VM created for this lease. Its resources stay reserved until a domain with this UUID runs on the host.
+    uuid: str
+    memoryKiB: int
+    vcpus: int
+    released: bool
+
+    def __init__(self, pool: "connectionPool", host: poolHost, conn: libvirt.virConnect, uuid: str, memoryKiB: int, vcpus: int):
+        self.pool = pool
+        self.host = host
+        self.conn = conn
+        self.uuid = uuid
+        self.memoryKiB = memoryKiB
+        self.vcpus = vcpus
+        self.released = False
+
+    def release(self) -> None:
+        """
+        Returns the lease to its pool. Releasing a lease more than once has no effect.
+        """
+        self.pool.release(self)
+
+    def __enter__(self) -> "hostLease":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.release()
+
+
+class connectionPool:
+    """
+    Manages connections to multiple libvirt hosts and places new VMs on the least loaded host that has a free slot.
+    """
+
+    hosts: List[poolHost]
+
+    __condition: Condition
+
+    def __init__(self, uris: Union[Sequence[str], Dict[str, int]], maxVmsPerHost: int = 1, reconnectIntervalS: float = 10.0):
+        """
+        Args:
+            uris (Union[Sequence[str], Dict[str, int]]): The libvirt URIs of all hosts. Either a list or a dict mapping each URI to its maximum number of concurrent VMs.
+            maxVmsPerHost (int): The maximum number of concurrent VMs for hosts without an explicit limit.
+            reconnectIntervalS (float): How long to wait before trying to reach an unreachable host again.
+        """
+        hostLimits: List[Tuple[str, int]] = list(uris.items()) if isinstance(uris, dict) else [(uri, maxVmsPerHost) for uri in uris]
+        if not hostLimits:
+            raise ValueError("Expected at least one libvirt URI.")
+
+        self.hosts = [poolHost(uri, maxVms, reconnectIntervalS) for uri, maxVms in hostLimits]
+        self.__condition = Condition()
+
+    def __try_acquire(self, stats: List[Optional[hostStats]], memoryKiB: int, vcpus: int, uuid: str) -> Optional[hostLease]:
+        best: Optional[Tuple[float, float, int]] = None
+        for i, host in enumerate(self.hosts):
+            statsObj: Optional[hostStats] = stats[i]
+            if not statsObj:
+                continue
+            load: Optional[float] = host.load(statsObj, memoryKiB, vcpus)
+            if load is None:
+                continue
+            # Prefer the least loaded host, then the one with fewer leases relative to its limit
+            candidate: Tuple[float, float, int] = (load, host.leases / host.maxVms, i)
+            if not best or candidate < best:
+                best = candidate
+
+        if not best:
+            return None
+
+        host = self.hosts[best[2]]
+        statsObj = stats[best[2]]
+        assert statsObj
+        leaseObj: hostLease = hostLease(self, host, statsObj.conn, uuid, memoryKiB, vcpus)
+        host.activeLeases.append(leaseObj)
+        return leaseObj
+
+    def acquire(self, memoryKiB: int = 0, vcpus: int = 0, timeoutS: Optional[float] = None, uuid: Optional[str] = None) -> hostLease:
+        """
+        Leases a slot on the least loaded host with enough free memory. Blocks until a slot gets released in case all hosts are busy.
+
+        Args:
+            memoryKiB (int): Memory the new VM requires.
+            vcpus (int): Number of vCPUs of the new VM.
+            timeoutS (Optional[float]): Maximum time in seconds to wait for a free slot. Waits forever in case it is None.
+            uuid (Optional[str]): The UUID of the VM that is going to be created. A random one gets generated in case it is None.
+
+        Returns:
+            hostLease: The leased slot. Create the VM with its 'uuid' via its 'conn'.
+
+        Raises:
+            noHostAvailableError: In case no host had a free slot within the timeout.
+        """
+        end: Optional[float] = monotonic() + timeoutS if timeoutS is not None else None
+        uuid = uuid if uuid else str(uuid4())
+        while True:
+            # Querying hosts involves libvirt calls that might block, so it happens without holding the lock
+            stats: List[Optional[hostStats]] = [host.query() if host.leases < host.maxVms else None for host in self.hosts]
+
+            with self.__condition:
+                leaseObj: Optional[hostLease] = self.__try_acquire(stats, memoryKiB, vcpus, uuid)
+                if leaseObj:
+                    print(f"Placing VM on '{leaseObj.host.uri}' ({leaseObj.host.leases}/{leaseObj.host.maxVms} slots used).")
+                    return leaseObj
+
+                waitS: Optional[float] = None
+                if end is not None:
+                    waitS = end - monotonic()
+                    if waitS <= 0:
+                        raise noHostAvailableError(f"No host available for a VM with {memoryKiB} KiB memory and {vcpus} vCPUs.")
+                # Unreachable hosts and free memory only change without a release, so check again from time to time
+                reconnectS: float = min(host.reconnectIntervalS for host in self.hosts)
+                self.__condition.wait(reconnectS if waitS is None else min(waitS, reconnectS))
+
+    def release(self, leaseObj: hostLease) -> None:
+        """
+        Frees the slot of the given lease. Releasing a lease multiple times is fine.
+        """
+        with self.__condition:
+            if leaseObj.released:
+                return
+            leaseObj.released = True
+            leaseObj.host.activeLeases.remove(leaseObj)
+            self.__condition.notify_all()
+
+    def close(self) -> None:
+        """
+        Closes the connections to all hosts.
+        """
+        for host in self.hosts:
+            host.close()
@@ -0,0 +1,269 @@
+import sys
+import threading
+from contextlib import contextmanager, nullcontext
+from os import makedirs, path
+from time import perf_counter, process_time, thread_time
+from types import FrameType
+from typing import Callable, ContextManager, Dict, Iterator, List, Optional, Tuple, Union
+
+from os_tester.stages import checkConsole, checkFile, checkState
+
+# Returned by 'nullProfiler', so disabled profiling does not allocate anything
+_NULL_CONTEXT: ContextManager[None] = nullcontext()
+
+
+class profileTimer:
+    """
+    Accumulated wall and CPU time of a profiled section.
+    """
+
+    count: int
+    wallS: float
+    cpuS: float
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.wallS = 0.0
+        self.cpuS = 0.0
+
+    def add(self, wallS: float, cpuS: float) -> None:
+        """
+        Adds a single measurement.
+        """
+        self.count += 1
+        self.wallS += wallS
+        self.cpuS += cpuS
+
+
+class nullProfiler:
+    """
+    Used by 'vm' while profiling is disabled. All sections are shared no-op context managers.
+    """
+
+    def start(self) -> None:
+        """
+        Called once before the first stage gets executed.
+        """
+
+    def stop(self) -> None:
+        """
+        Called once after the run finished, failed or got interrupted.
+        """
+
+    def stage(self, _stageName: str) -> ContextManager[None]:
+        """
+        Wraps a single stage execution.
+        """
+        return _NULL_CONTEXT
+
+    def section(self, _sectionName: str) -> ContextManager[None]:
+        """
+        Wraps a part (e.g. 'wait' or 'actions') of the current stage.
+        """
+        return _NULL_CONTEXT
+
+    def check(self, _pathIndex: int, _checkIndex: int, _check: Union[checkFile, checkConsole, checkState]) -> ContextManager[None]:
+        """
+        Wraps evaluating a single check of the current stage.
+        """
+        return _NULL_CONTEXT
+
+
+class stackSampler:
+    """
+    Samples the stacks of all other threads via 'sys._current_frames()' in the background and counts them as collapsed stacks per stage.
+    """
+
+    intervalS: float
+    # Collapsed stack -> number of samples
+    samples: Dict[str, int]
+    # Read by the sampling thread
+    currentStage: Optional[str]
+
+    __stopEvent: threading.Event
+    __thread: Optional[threading.Thread]
+
+    def __init__(self, intervalS: float):
+        """
+        Args:
+            intervalS (float): Time in seconds between two stack samples.
+        """
+        self.intervalS = intervalS
+        self.samples = {}
+        self.currentStage = None
+        self.__stopEvent = threading.Event()
+        self.__thread = None
+
+    def start(self) -> None:
+        """
+        Starts sampling stacks in the background.
+        """
+        self.__stopEvent.clear()
+        self.__thread = threading.Thread(target=self.__run, name="os_tester_profiler", daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops sampling and waits for the sampling thread.
+        """
+        self.__stopEvent.set()
+        if self.__thread:
+            self.__thread.join()
+            self.__thread = None
+
+    def __run(self) -> None:
+        ownId: int = threading.get_ident()
+        while not self.__stopEvent.wait(self.intervalS):
+            stageName: str = self.currentStage if self.currentStage is not None else "<no stage>"
+            threadNames: Dict[Optional[int], str] = {t.ident: t.name for t in threading.enumerate()}
+            for threadId, topFrame in sys._current_frames().items():  # pylint: disable=protected-access
+                if threadId == ownId:
+                    continue
+
+                frames: List[str] = list()
+                curFrame: Optional[FrameType] = topFrame
+                while curFrame is not None:
+                    code = curFrame.f_code
+                    frames.append(f"{code.co_name} ({path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    curFrame = curFrame.f_back
+                frames.append(threadNames.get(threadId, str(threadId)))
+                frames.append(f"stage {stageName}")
+
+                # ';' separates frames and the last ' ' the count
+                stack: str = ";".join(name.replace(";", ":") for name in reversed(frames))
+                self.samples[stack] = self.samples.get(stack, 0) + 1
+
+
+class runProfiler(nullProfiler):
+    """
+    Profiles 'vm.run_stages(...)'.
+    A background thread samples the stacks of all threads via 'sys._current_frames()' and attributes them to the current stage.
+    Additionally wall and CPU time gets measured per stage, per stage section (waiting, actions) and per check.
+
+    Once stopped, the results are written to 'outputDir':
+        profile.collapsed: Collapsed stacks ('stage;thread;frame;... count'), e.g. for flamegraph.pl or speedscope.
+        profile.txt: A per stage summary table.
+    """
+
+    outputDir: str
+    # Stage name -> timer
+    stageTimers: Dict[str, profileTimer]
+    # (stage name, section name) -> timer
+    sectionTimers: Dict[Tuple[str, str], profileTimer]
+    # (stage name, check label) -> timer
+    checkTimers: Dict[Tuple[str, str], profileTimer]
+
+    __sampler: stackSampler
+
+    def __init__(self, outputDir: str, intervalS: float = 0.01):
+        """
+        Args:
+            outputDir (str): Where to write the collapsed stacks and the summary to.
+            intervalS (float): Time in seconds between two stack samples.
+        """
+        self.outputDir = outputDir
+        self.stageTimers = {}
+        self.sectionTimers = {}
+        self.checkTimers = {}
+        self.__sampler = stackSampler(intervalS)
+
+    @property
+    def samples(self) -> Dict[str, int]:
+        """
+        Collapsed stack -> number of samples.
+        """
+        return self.__sampler.samples
+
+    def start(self) -> None:
+        """
+        Starts sampling stacks in the background.
+        """
+        self.__sampler.start()
+
+    def stop(self) -> None:
+        """
+        Stops sampling, writes the results to 'outputDir' and prints the summary.
+        """
+        self.__sampler.stop()
+
+        makedirs(self.outputDir, exist_ok=True)
+        self.write_collapsed(path.join(self.outputDir, "profile.collapsed"))
+        summary: str = self.format_summary()
+        with open(path.join(self.outputDir, "profile.txt"), "w", encoding="utf-8") as file:
+            file.write(summary)
+        print(summary)
+
+    @contextmanager
+    def __timed(self, timers: Dict[Tuple[str, str], profileTimer], key: Tuple[str, str], cpuFn: Callable[[], float] = process_time) -> Iterator[None]:
+        startWall: float = perf_counter()
+        startCpu: float = cpuFn()
+        try:
+            yield
+        finally:
+            timers.setdefault(key, profileTimer()).add(perf_counter() - startWall, cpuFn() - startCpu)
+
+    @contextmanager
+    def __stage(self, stageName: str) -> Iterator[None]:
+        self.__sampler.currentStage = stageName
+        startWall: float = perf_counter()
+        startCpu: float = process_time()
+        try:
+            yield
+        finally:
+            self.stageTimers.setdefault(stageName, profileTimer()).add(perf_counter() - startWall, process_time() - startCpu)
+            self.__sampler.currentStage = None
+
+    def stage(self, stageName: str) -> ContextManager[None]:
+        """
+        Measures a single stage execution. CPU time covers all threads (e.g. capturing screenshots in the background).
+        """
+        return self.__stage(stageName)
+
+    def section(self, sectionName: str) -> ContextManager[None]:
+        """
+        Measures a part (e.g. 'wait' or 'actions') of the current stage.
+        """
+        return self.__timed(self.sectionTimers, (self.__sampler.currentStage or "", sectionName))
+
+    def check(self, pathIndex: int, checkIndex: int, check: Union[checkFile, checkConsole, checkState]) -> ContextManager[None]:
+        """
+        Measures evaluating a single check of the current stage. CPU time only covers the evaluating thread.
+        """
+        label: str
+        if isinstance(check, checkConsole):
+            label = f"console '{check.pattern}'"
+        elif isinstance(check, checkState):
+            label = f"state '{check.state}'"
+        else:
+            label = f"[{path.basename(check.filePath)}]"
+        return self.__timed(self.checkTimers, (self.__sampler.currentStage or "", f"path {pathIndex + 1} check {checkIndex + 1} {label}"), thread_time)
+
+    def write_collapsed(self, filePath: str) -> None:
+        """
+        Writes all samples in the collapsed stack format.
+        """
+        with open(filePath, "w", encoding="utf-8") as file:
+            for stack, count in sorted(self.samples.items()):
+                file.write(f"{stack} {count}\n")
+
+    def format_summary(self) -> str:
+        """
+        Returns a table with the wall and CPU time per stage, stage section and check.
+        """
+        lines: List[str] = [f"{'Stage / Section / Check':<60} {'Count':>6} {'Wall [s]':>10} {'CPU [s]':>10} {'Mean [ms]':>10}"]
+
+        def add_line(name: str, timer: profileTimer) -> None:
+            meanMs: float = timer.wallS / timer.count * 1000 if timer.count else 0.0
+            lines.append(f"{name:<60} {timer.count:>6} {timer.wallS:>10.3f} {timer.cpuS:>10.3f} {meanMs:>10.2f}")
+
+        for stageName, stageTimer in self.stageTimers.items():
+            add_line(stageName, stageTimer)
+            for (sectionStage, sectionName), timer in self.sectionTimers.items():
+                if sectionStage == stageName:
+                    add_line(f"  {sectionName}", timer)
+            for (checkStage, checkLabel), timer in sorted(self.checkTimers.items(), key=lambda item: -item[1].wallS):
+                if checkStage == stageName:
+                    add_line(f"    {checkLabel}", timer)
+
+        lines.append(f"{sum(self.samples.values())} stack samples")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,162 @@
+import subprocess  # nosec B404
+from contextlib import suppress
+from html import escape
+from os import makedirs, path, remove
+from string import Template
+from typing import Dict, Optional
+from uuid import uuid4
+
+import libvirt
+
+from os_tester.exceptions import provisionError
+from os_tester.vm import vm
+
+
+class provisionedVm(vm):
+    """
+    A VM running on top of a per-run copy-on-write overlay of a golden base image.
+    The overlay gets removed once the VM is destroyed.
+    """
+
+    overlayPath: str
+
+    def __init__(self, conn: libvirt.virConnect, uuid: str, overlayPath: str, debugPlt: bool = False, captureIntervalS: float = 0.5):
+        super().__init__(conn, uuid, debugPlt, captureIntervalS)
+        self.overlayPath = overlayPath
+
+    def destroy(self) -> None:
+        """
+        Tell qemu/libvirt to destroy the VM defined by 'self.uuid' and removes its overlay image afterwards.
+
+        Raises:
+            Exception: In case the VM has not been loaded before via e.g. try_load(...).
+        """
+        super().destroy()
+        with suppress(FileNotFoundError):
+            remove(self.overlayPath)
+
+
+class vmProvisioner:
+    """
+    Creates VMs from a golden base image and a libvirt XML template.
+    Instead of copying the base image, each VM gets a qcow2 overlay backed by it, so only the blocks written by the VM take up space.
+
+    The template uses 'string.Template' placeholders:
+        $name: The name of the VM.
+        $title: The title of the VM.
+        $uuid: The UUID of the VM.
+        $disk_path: The path to the overlay disk image (qcow2).
+    These values get XML escaped. Values passed via 'extra' are inserted as is.
+    """
+
+    conn: libvirt.virConnect
+    baseImagePath: str
+    baseImageFormat: str
+    xmlTemplate: Template
+    overlayDir: str
+    qemuImgPath: str
+
+    def __init__(
+        self,
+        conn: libvirt.virConnect,
+        baseImagePath: str,
+        xmlTemplate: str,
+        overlayDir: str,
+        baseImageFormat: str = "qcow2",
+        qemuImgPath: str = "qemu-img",
+    ):
+        if not path.isfile(baseImagePath):
+            raise ValueError(f"Base image '{baseImagePath}' does not exist or is no file.")
+
+        self.conn = conn
+        # Overlays reference their backing file by path, so it has to be absolute
+        self.baseImagePath = path.abspath(baseImagePath)
+        self.baseImageFormat = baseImageFormat
+        self.xmlTemplate = Template(xmlTemplate)
+        self.overlayDir = overlayDir
+        self.qemuImgPath = qemuImgPath
+        makedirs(self.overlayDir, exist_ok=True)
+
+    def fill_template(self, name: str, title: str, uuid: str, diskPath: str, extra: Optional[Dict[str, str]] = None) -> str:
+        """
+        Fills in the XML template for a single VM.
+
+        Args:
+            name (str): The name of the VM.
+            title (str): The title of the VM.
+            uuid (str): The UUID of the VM.
+            diskPath (str): The path to the overlay disk image.
+            extra (Optional[Dict[str, str]]): Additional template placeholder values.
+
+        Returns:
+            str: The libvirt XML string defining the VM.
+        """
+        mapping: Dict[str, str] = dict(extra) if extra else {}
+        mapping.update({"name": escape(name), "title": escape(title), "uuid": escape(uuid), "disk_path": escape(diskPath)})
+        return self.xmlTemplate.substitute(mapping)
+
+    def __create_overlay(self, overlayPath: str) -> None:
+        """
+        Creates a qcow2 overlay backed by 'self.baseImagePath'.
+
+        Raises:
+            provisionError: In case the overlay already exists or qemu-img could not be run or failed.
+        """
+        # qemu-img would silently replace the overlay of a running VM
+        if path.exists(overlayPath):
+            raise provisionError(f"Overlay '{overlayPath}' already exists.")
+        try:
+            subprocess.run(  # nosec B603
+                [self.qemuImgPath, "create", "-q", "-f", "qcow2", "-F", self.baseImageFormat, "-b", self.baseImagePath, overlayPath],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+        except subprocess.CalledProcessError as e:
+            raise provisionError(f"Creating overlay '{overlayPath}' failed with exit code {e.returncode}: {e.stderr.strip()}") from e
+        except OSError as e:
+            raise provisionError(f"Running '{self.qemuImgPath}' to create overlay '{overlayPath}' failed: {e}") from e
+
+    def provision(
+        self,
+        name: Optional[str] = None,
+        title: Optional[str] = None,
+        debugPlt: bool = False,
+        extra: Optional[Dict[str, str]] = None,
+        captureIntervalS: float = 0.5,
+    ) -> provisionedVm:
+        """
+        Creates a new overlay, fills in the XML template and creates/starts the VM.
+
+        Args:
+            name (Optional[str]): The name of the VM. Derived from a fresh UUID in case it is None. Also used as prefix of the overlay file name.
+            title (Optional[str]): The title of the VM. Defaults to the name.
+            debugPlt (bool): Passed on to the created VM.
+            extra (Optional[Dict[str, str]]): Additional template placeholder values.
+            captureIntervalS (float): Passed on to the created VM.
+
+        Returns:
+            provisionedVm: The created VM. Call 'destroy()' on it to remove the VM and its overlay again.
+
+        Raises:
+            ValueError: In case the name contains a path separator.
+            provisionError: In case creating the overlay failed.
+        """
+        uuid: str = str(uuid4())
+        if not name:
+            name = f"os_tester_{uuid[:8]}"
+        # Otherwise the overlay could end up outside of 'self.overlayDir'
+        if path.basename(name) != name:
+            raise ValueError(f"Expected the VM name '{name}' to not contain path separators.")
+
+        # The UUID keeps overlays of VMs sharing a name apart
+        overlayPath: str = path.abspath(path.join(self.overlayDir, f"{name}_{uuid}.qcow2"))
+        self.__create_overlay(overlayPath)
+
+        vmObj: provisionedVm = provisionedVm(self.conn, uuid, overlayPath, debugPlt, captureIntervalS)
+        try:
+            vmObj.create(self.fill_template(name, title if title else name, uuid, overlayPath, extra))
+        except Exception:
+            remove(overlayPath)
+            raise
+        return vmObj
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import hashlib
+from os import path, stat
+from threading import Lock
+from typing import TYPE_CHECKING, Dict, Tuple
+from weakref import WeakValueDictionary
+
+from os_tester.exceptions import loadError
+from os_tester.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import cv2
+else:
+    cv2 = lazy_import("cv2")
+
+
+class refImage:
+    """
+    A decoded reference image. Shared read-only between all checks referencing the same pixels.
+    """
+
+    # SHA-256 over the shape and the decoded pixels
+    digest: str
+    data: cv2.typing.MatLike
+
+    def __init__(self, digest: str, data: cv2.typing.MatLike):
+        self.digest = digest
+        self.data = data
+
+
+def pixel_digest(data: cv2.typing.MatLike) -> str:
+    """
+    Returns the content address of the given decoded image.
+    """
+    h = hashlib.sha256()
+    h.update(f"{data.shape}|{data.dtype}".encode("utf-8"))
+    h.update(data.tobytes())
+    return h.hexdigest()
+
+
+class refImageStore:
+    """
+    Content-addressed store for reference images keyed by the hash of their decoded pixels.
+    Identical images are only kept once, even when referenced via different file names, stages or 'stages' objects.
+    Images are released once no check references them any more.
+    """
+
+    # digest -> image
+    __images: "WeakValueDictionary[str, refImage]"
+    # absolute file path -> (mtime_ns, size, digest). Avoids decoding unchanged files again.
+    __paths: Dict[str, Tuple[int, int, str]]
+    __lock: Lock
+
+    def __init__(self) -> None:
+        self.__images = WeakValueDictionary()
+        self.__paths = {}
+        self.__lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.__images)
+
+    def load(self, filePath: str) -> refImage:
+        """
+        Returns the shared image for the given file and loads it in case it is not part of the store yet.
+
+        Raises:
+            loadError: In case the file does not exist, is no file or can not be loaded by OpenCV.
+        """
+        if not path.exists(filePath):
+            raise loadError(f"Stage ref image file '{filePath}' not found!", 2)
+
+        if not path.isfile(filePath):
+            raise loadError(f"Stage ref image file '{filePath}' is no file!", 3)
+
+        absPath: str = path.abspath(filePath)
+        fileStat = stat(absPath)
+        with self.__lock:
+            cached = self.__paths.get(absPath)
+            if cached and cached[:2] == (fileStat.st_mtime_ns, fileStat.st_size):
+                image = self.__images.get(cached[2])
+                if image:
+                    return image
+
+        data: cv2.typing.MatLike | None = cv2.imread(absPath)
+        if data is None:
+            raise loadError(f"Failed to load CV2 data from '{filePath}'!", 4)
+        digest: str = pixel_digest(data)
+
+        with self.__lock:
+            self.__paths[absPath] = (fileStat.st_mtime_ns, fileStat.st_size, digest)
+            image = self.__images.get(digest)
+            if not image:
+                # Shared between checks, so nobody is allowed to modify it
+                data.setflags(write=False)
+                image = refImage(digest, data)
+                self.__images[digest] = image
+            return image
+
+
+# The store used by all 'stages' objects that do not bring their own
+defaultRefImageStore: refImageStore = refImageStore()
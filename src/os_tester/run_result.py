@@ -0,0 +1,78 @@
+from typing import List, Optional
+
+from os_tester.exceptions import osTesterError
+
+
+class stageResult:
+    """
+    The outcome of a single executed stage.
+    """
+
+    name: str
+    durationS: float
+    # The name of the requested next stage. None in case the stage failed.
+    nextStage: Optional[str]
+    # Seconds from the start of the stage until the VM entered the power state (or rebooted) a state check matched on.
+    # Negative in case the transition happened before the stage started. None in case no state check matched or the state has been polled.
+    stateChangeS: Optional[float]
+
+    def __init__(self, name: str, durationS: float, nextStage: Optional[str], stateChangeS: Optional[float] = None):
+        self.name = name
+        self.durationS = durationS
+        self.nextStage = nextStage
+        self.stateChangeS = stateChangeS
+
+    def __repr__(self) -> str:
+        stateChange: str = f", stateChangeS={self.stateChangeS:.3f}" if self.stateChangeS is not None else ""
+        return f"stageResult(name={self.name!r}, durationS={self.durationS:.3f}, nextStage={self.nextStage!r}{stateChange})"
+
+
+class runResult:
+    """
+    The outcome of executing all stages via 'vm.run_stages(...)'.
+    """
+
+    stageResults: List[stageResult]
+    # Names of the stages skipped by resuming from a checkpoint in the order they have been visited originally.
+    resumedStagePath: List[str]
+    durationS: float
+    # The error that stopped the run. None in case all stages succeeded.
+    error: Optional[osTesterError]
+
+    def __init__(self) -> None:
+        self.stageResults = list()
+        self.resumedStagePath = list()
+        self.durationS = 0.0
+        self.error = None
+
+    @property
+    def success(self) -> bool:
+        """
+        True in case all stages succeeded.
+        """
+        return self.error is None
+
+    @property
+    def stagePath(self) -> List[str]:
+        """
+        The names of all executed stages in the order they have been visited.
+        Stages skipped by resuming from a checkpoint are listed in 'resumedStagePath'.
+        """
+        return [result.name for result in self.stageResults]
+
+    @property
+    def failureReason(self) -> Optional[str]:
+        """
+        The message of the error that stopped the run. None on success.
+        """
+        return str(self.error) if self.error else None
+
+    @property
+    def exitCode(self) -> int:
+        """
+        The process exit code matching this result. 0 on success.
+        """
+        return self.error.exitCode if self.error else 0
+
+    def __repr__(self) -> str:
+        return f"runResult(success={self.success}, stagePath={self.stagePath}, durationS={self.durationS:.3f}, failureReason={self.failureReason!r})"
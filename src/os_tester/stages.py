@@ -1,10 +1,22 @@
-import sys
-from dataclasses import dataclass
+from __future__ import annotations
+
+import hashlib
+import json
+import re
 from os import path
-from typing import Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+
+from os_tester.compare import build_mask, imageMask
+from os_tester.exceptions import loadError
+from os_tester.lazy import lazy_import
+from os_tester.ref_store import defaultRefImageStore, refImage, refImageStore
 
-import cv2
-import yaml  # type: ignore
+if TYPE_CHECKING:
+    import cv2
+    import yaml  # type: ignore
+else:
+    cv2 = lazy_import("cv2")
+    yaml = lazy_import("yaml")
 
 
 def _is_number(value: Any) -> bool:
@@ -43,26 +55,80 @@ class area:
             raise ValueError("Expected area coordinates to satisfy x1Percentage < x2Percentage and y1Percentage < y2Percentage.")
 
 
+def _load_areas(mapping: Dict[str, Any], key: str) -> List[area]:
+    areaDicts: Any = mapping.get(key, list())
+    if not isinstance(areaDicts, list) or not all(isinstance(areaDict, dict) for areaDict in areaDicts):
+        raise ValueError(f"Expected '{key}' to be a list of areas.")
+    return [area(areaDict) for areaDict in areaDicts]
+
+
+class maskSpec:
+    """
+    Selects the pixels of a reference image that get compared via an optional mask image and include/exclude areas.
+    """
+
+    # Optional black (ignore) to white (compare) mask image
+    filePath: Optional[str]
+    imageObj: Optional[refImage]
+    # In case not empty, only pixels inside one of these areas get compared
+    includeAreas: List[area]
+    # Pixels inside any of these areas get ignored
+    excludeAreas: List[area]
+    # Preprocessed combination of the mask image, include/exclude areas and the area of the check. None in case the whole area gets compared.
+    mask: Optional[imageMask]
+
+    def __init__(self, fileDict: Dict[str, Any], basePath: str, store: refImageStore, refShape: Tuple[int, ...], imageArea: Optional[area]):
+        """
+        Args:
+            fileDict (Dict[str, Any]): The definition of the check containing the optional 'mask', 'include' and 'exclude' keys.
+            basePath (str): The directory the mask image path is relative to.
+            store (refImageStore): Loads the mask image.
+            refShape (Tuple[int, ...]): The shape of the reference image the mask is applied to.
+            imageArea (Optional[area]): The area of the check. Pixels outside of it do not get compared.
+
+        Raises:
+            ValueError: In case the definition is invalid or does not leave any pixel to compare.
+        """
+        self.filePath = None
+        self.imageObj = None
+        if "mask" in fileDict:
+            if not isinstance(fileDict["mask"], str):
+                raise ValueError("Expected 'mask' to be a string.")
+            self.filePath = path.join(basePath, fileDict["mask"])
+            self.imageObj = store.load(self.filePath)
+        self.includeAreas = _load_areas(fileDict, "include")
+        self.excludeAreas = _load_areas(fileDict, "exclude")
+
+        self.mask = None
+        if self.imageObj or self.includeAreas or self.excludeAreas:
+            self.mask = build_mask(refShape, self.imageObj.data if self.imageObj else None, self.includeAreas, self.excludeAreas, imageArea)
+
+
 class checkFile:
     """
     A single reference file with thresholds.
     """
 
     filePath: str
+    # Read-only, since it is shared with all other checks referencing the same pixels
     fileData: cv2.typing.MatLike
+    refImageObj: refImage
 
     ssimGeq: float
     area: Optional[area]
+    maskSpecObj: maskSpec
     nextStage: str
     actions: List[Dict[str, Any]]
 
-    def __init__(self, fileDict: Dict[str, Any], basePath: str):
+    def __init__(self, fileDict: Dict[str, Any], basePath: str, refStore: Optional[refImageStore] = None):
         file_path = _require_key(fileDict, "path")
         if not isinstance(file_path, str):
             raise ValueError("Expected 'path' to be a string.")
         self.filePath = path.join(basePath, file_path)
+        store: refImageStore = refStore if refStore is not None else defaultRefImageStore
         # Check if the reference images exist and if so load them as OpenCV object
-        self.fileData = self.__load(self.filePath)
+        self.refImageObj = store.load(self.filePath)
+        self.fileData = self.refImageObj.data
         self.ssimGeq = _validate_range(_require_key(fileDict, "ssim_geq"), "ssim_geq", 0.0, 1.0)
 
         self.area = None
@@ -70,24 +136,47 @@ class checkFile:
             areaDict: Dict[str, Any] = fileDict["area"]
             self.area = area(areaDict)
 
-    def __load(self, filePath: str) -> cv2.typing.MatLike:
-        """
-        Check if the reference image exist and if so load/return it as OpenCV object.
-        """
+        try:
+            self.maskSpecObj = maskSpec(fileDict, basePath, store, self.fileData.shape, self.area)
+        except ValueError as e:
+            raise ValueError(f"Invalid mask for '{self.filePath}': {e}") from e
 
-        if not path.exists(filePath):
-            print(f"Stage ref image file '{filePath}' not found!")
-            sys.exit(2)
 
-        if not path.isfile(filePath):
-            print(f"Stage ref image file '{filePath}' is no file!")
-            sys.exit(3)
+class checkConsole:
+    """
+    A regular expression awaited on the serial console output of the VM.
+    Considerably cheaper than comparing screenshots, e.g. for text mode boot and installation phases.
+    """
+
+    pattern: str
+    regex: "re.Pattern[str]"
 
-        data: cv2.typing.MatLike | None = cv2.imread(filePath)
-        if data is None:
-            print(f"Failed to load CV2 data from '{filePath}'!")
-            sys.exit(4)
-        return data
+    def __init__(self, consoleDict: Dict[str, Any]):
+        if not isinstance(consoleDict, dict):
+            raise ValueError("Expected 'console' to be a mapping.")
+        pattern = _require_key(consoleDict, "regex")
+        if not isinstance(pattern, str):
+            raise ValueError("Expected 'console.regex' to be a string.")
+        self.pattern = pattern
+        try:
+            self.regex = re.compile(pattern, re.MULTILINE)
+        except re.error as e:
+            raise ValueError(f"Invalid 'console.regex' '{pattern}': {e}") from e
+
+
+class checkState:
+    """
+    A VM power state awaited via libvirt lifecycle events, e.g. after a reboot or shutdown action.
+    """
+
+    STATES = ("running", "paused", "stopped", "crashed", "rebooted")
+
+    state: str
+
+    def __init__(self, state: Any):
+        if state not in self.STATES:
+            raise ValueError(f"Expected 'state' to be one of {', '.join(self.STATES)}, got '{state}'.")
+        self.state = state
 
 
 class subPath:
@@ -95,12 +184,14 @@ class subPath:
     A single path with optionally multiple ref images, thresholds and actions to perform once the threshold for one file (image) is reached.
     """
 
-    checkList: List[checkFile]
+    checkList: List[Union[checkFile, checkConsole, checkState]]
 
     nextStage: str
     actions: List[Dict[str, Any]]
+    # Stable identifier derived from the path definition. Used to persist match statistics.
+    key: str
 
-    def __init__(self, pathDict: Dict[str, Any], basePath: str):
+    def __init__(self, pathDict: Dict[str, Any], basePath: str, refStore: Optional[refImageStore] = None):
         # Removed in 1.1.0
         if "check" in pathDict:
             raise Exception("The keyword 'check' has been replaced with the 'checks' keyword.")
@@ -113,10 +204,16 @@ class subPath:
             for checkDict in pathDict["checks"]:
                 if not isinstance(checkDict, dict):
                     raise ValueError("Expected each entry in 'checks' to be a mapping.")
-                self.checkList.append(checkFile(checkDict, basePath))
+                if "console" in checkDict:
+                    self.checkList.append(checkConsole(checkDict["console"]))
+                elif "state" in checkDict:
+                    self.checkList.append(checkState(checkDict["state"]))
+                else:
+                    self.checkList.append(checkFile(checkDict, basePath, refStore))
 
         self.actions = pathDict["actions"] if "actions" in pathDict else list()
         self.nextStage = _require_key(pathDict, "nextStage")
+        self.key = hashlib.sha1(json.dumps(pathDict, sort_keys=True, default=str).encode("utf-8"), usedforsecurity=False).hexdigest()[:16]
 
 
 class stage:
@@ -127,11 +224,23 @@ class stage:
     name: str
     timeoutS: float
     pathsList: List[subPath]
+    # Allows evaluating paths ordered by their match history instead of the YAML order.
+    reorderPaths: bool
+    # Take a VM snapshot after this stage succeeded so later runs can resume after it.
+    checkpoint: bool
 
-    def __init__(self, stageDict: Dict[str, Any], basePath: str):
+    def __init__(self, stageDict: Dict[str, Any], basePath: str, refStore: Optional[refImageStore] = None):
         self.name = _require_key(stageDict, "stage")
         self.timeoutS = _validate_range(_require_key(stageDict, "timeout_s"), "timeout_s", 0.0, None)
 
+        self.reorderPaths = stageDict.get("reorder_paths", False)
+        if not isinstance(self.reorderPaths, bool):
+            raise ValueError("Expected 'reorder_paths' to be a boolean.")
+
+        self.checkpoint = stageDict.get("checkpoint", False)
+        if not isinstance(self.checkpoint, bool):
+            raise ValueError("Expected 'checkpoint' to be a boolean.")
+
         self.pathsList = list()
         paths = _require_key(stageDict, "paths")
         if not isinstance(paths, list) or not paths:
@@ -140,7 +249,31 @@ class stage:
         for pathDict in paths:
             if not isinstance(pathDict, dict) or "path" not in pathDict:
                 raise ValueError("Expected each entry in 'paths' to contain a 'path' mapping.")
-            self.pathsList.append(subPath(pathDict["path"], basePath))
+            self.pathsList.append(subPath(pathDict["path"], basePath, refStore))
+
+    def __has_checks(self, checkType: type) -> bool:
+        return any(isinstance(check, checkType) for subPathObj in self.pathsList for check in subPathObj.checkList)
+
+    @property
+    def hasImageChecks(self) -> bool:
+        """
+        True in case any path of this stage awaits a reference image. Requires screenshots.
+        """
+        return self.__has_checks(checkFile)
+
+    @property
+    def hasConsoleChecks(self) -> bool:
+        """
+        True in case any path of this stage awaits console output.
+        """
+        return self.__has_checks(checkConsole)
+
+    @property
+    def hasStateChecks(self) -> bool:
+        """
+        True in case any path of this stage awaits a VM state.
+        """
+        return self.__has_checks(checkState)
 
 
 class stages:
@@ -150,25 +283,33 @@ class stages:
 
     basePath: str
     stagesList: List[stage]
+    # Where match statistics for stages with 'reorder_paths' are persisted between runs.
+    statsFilePath: str
+    # Deduplicates reference images across all stages (and all 'stages' objects using the same store)
+    refStore: refImageStore
 
     def __load_stages(self, yamlFileName: str) -> None:
         """
         Loads the stage definition from 'self.basePath' and stores the result inside 'self.stagesList'.
+
+        Raises:
+            loadError: In case the stage config does not exist, is no file or is no valid YAML.
         """
         ymlFilePath: str = path.join(self.basePath, yamlFileName + ".yml")
         print(f"Loading stages from: {ymlFilePath}")
 
         if not path.exists(ymlFilePath):
-            print(f"Stage config at '{ymlFilePath}' not found!")
-            sys.exit(2)
+            raise loadError(f"Stage config at '{ymlFilePath}' not found!", 2)
 
         if not path.isfile(ymlFilePath):
-            print(f"Stage config at '{ymlFilePath}' is no file!")
-            sys.exit(3)
+            raise loadError(f"Stage config at '{ymlFilePath}' is no file!", 3)
 
         stagesDict: Dict[str, Any]
         with open(ymlFilePath, "r", encoding="utf-8") as file:
-            stagesDict = yaml.safe_load(file)
+            try:
+                stagesDict = yaml.safe_load(file)
+            except yaml.YAMLError as e:
+                raise loadError(f"Stage config at '{ymlFilePath}' could not be parsed: {e}", 4) from e
 
         if not isinstance(stagesDict["stages"], list):
             raise ValueError("Expected 'stages' to be a list.")
@@ -178,8 +319,10 @@ class stages:
         for stageDict in stagesDict["stages"]:
             if not isinstance(stageDict, dict):
                 raise ValueError("Expected each entry in 'stages' to be a mapping.")
-            self.stagesList.append(stage(stageDict, self.basePath))
+            self.stagesList.append(stage(stageDict, self.basePath, self.refStore))
 
-    def __init__(self, basePath: str, yamlFileName: str):
+    def __init__(self, basePath: str, yamlFileName: str, refStore: Optional[refImageStore] = None):
         self.basePath = basePath
+        self.refStore = refStore if refStore is not None else defaultRefImageStore
+        self.statsFilePath = path.join(basePath, yamlFileName + ".stats.json")
         self.__load_stages(yamlFileName)
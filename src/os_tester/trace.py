@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import json
+from os import makedirs, path
+from time import monotonic, strftime
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from os_tester.capture import frame
+from os_tester.lazy import lazy_import
+from os_tester.stages import area, checkFile, stage
+
+if TYPE_CHECKING:
+    import cv2
+else:
+    cv2 = lazy_import("cv2")
+
+# Name of the file inside every run directory describing all recorded stage visits
+TRACE_FILE_NAME: str = "trace.json"
+
+
+def area_to_dict(imageArea: Optional[area]) -> Optional[Dict[str, float]]:
+    """
+    Converts the given area into the representation used inside stage files.
+    """
+    if imageArea is None:
+        return None
+    return {
+        "x1Percentage": imageArea.x1Percentage,
+        "x2Percentage": imageArea.x2Percentage,
+        "y1Percentage": imageArea.y1Percentage,
+        "y2Percentage": imageArea.y2Percentage,
+    }
+
+
+class traceRecorder:
+    """
+    Records the SSIM time series of all image checks while waiting for stages, together with the frame that eventually matched.
+    Every call to 'start_run()' creates a new run directory containing a 'trace.json' and the recorded frames.
+    The traces can be replayed offline via 'python -m os_tester.calibrate' to suggest 'ssim_geq' thresholds and areas.
+    """
+
+    dirPath: str
+    # Store every compared frame and not only matching ones. Required for suggesting areas.
+    saveFrames: bool
+    runDir: Optional[str]
+    visits: List[Dict[str, Any]]
+
+    __visit: Optional[Dict[str, Any]]
+    __frame: Optional[frame]
+    __stageStart: float
+
+    def __init__(self, dirPath: str, saveFrames: bool = False):
+        """
+        Args:
+            dirPath (str): The directory all run directories get created in.
+            saveFrames (bool): Store all compared frames as PNG. Otherwise only matching frames are stored.
+        """
+        self.dirPath = dirPath
+        self.saveFrames = saveFrames
+        self.runDir = None
+        self.visits = list()
+        self.__visit = None
+        self.__frame = None
+        self.__stageStart = 0.0
+
+    def start_run(self) -> None:
+        """
+        Creates a new run directory. Called once per 'vm.run_stages(...)'.
+        """
+        baseName: str = f"run_{strftime('%Y%m%d_%H%M%S')}"
+        runDir: str = path.join(self.dirPath, baseName)
+        suffix: int = 1
+        while path.exists(runDir):
+            runDir = path.join(self.dirPath, f"{baseName}_{suffix}")
+            suffix += 1
+        makedirs(runDir)
+        self.runDir = runDir
+        self.visits = list()
+
+    def begin_stage(self, stageObj: stage) -> None:
+        """
+        Starts recording a new visit of the given stage.
+        """
+        checks: List[Dict[str, Any]] = list()
+        for pathIndex, subPathObj in enumerate(stageObj.pathsList):
+            for checkIndex, check in enumerate(subPathObj.checkList):
+                if isinstance(check, checkFile):
+                    checks.append(
+                        {
+                            "path": pathIndex,
+                            "check": checkIndex,
+                            "file": path.abspath(check.filePath),
+                            "ssimGeq": check.ssimGeq,
+                            "area": area_to_dict(check.area),
+                            "mask": path.abspath(check.maskSpecObj.filePath) if check.maskSpecObj.filePath else None,
+                            "include": [area_to_dict(includeArea) for includeArea in check.maskSpecObj.includeAreas],
+                            "exclude": [area_to_dict(excludeArea) for excludeArea in check.maskSpecObj.excludeAreas],
+                        },
+                    )
+
+        self.__visit = {"visit": len(self.visits), "stage": stageObj.name, "checks": checks, "frames": list(), "match": None, "timedOut": False}
+        self.__frame = None
+        self.__stageStart = monotonic()
+
+    def record_frame(self, frameObj: frame) -> None:
+        """
+        Records a new frame. All following scores belong to this frame.
+        """
+        assert self.__visit is not None
+        self.__frame = frameObj
+        self.__visit["frames"].append({"frameId": frameObj.frameId, "timeS": frameObj.timestamp - self.__stageStart, "file": None, "scores": {}})
+        if self.saveFrames:
+            self.__save_frame()
+
+    def record_score(self, pathIndex: int, checkIndex: int, ssim: float) -> None:
+        """
+        Records the SSIM of the given check for the current frame.
+        """
+        frameDict: Optional[Dict[str, Any]] = self.__frame_dict()
+        assert frameDict is not None
+        frameDict["scores"][f"{pathIndex}:{checkIndex}"] = ssim
+
+    def record_match(self, pathIndex: int, checkIndex: Optional[int], viaImage: bool) -> None:
+        """
+        Records which check of which path completed the stage.
+
+        Args:
+            pathIndex (int): The (zero based) index of the matching path.
+            checkIndex (Optional[int]): The (zero based) index of the matching check. None for paths without checks.
+            viaImage (bool): True in case an image check matched the current frame.
+        """
+        assert self.__visit is not None
+        frameId: Optional[int] = None
+        frameDict: Optional[Dict[str, Any]] = self.__frame_dict()
+        if viaImage and frameDict is not None:
+            frameId = frameDict["frameId"]
+            if frameDict["file"] is None:
+                self.__save_frame()
+        self.__visit["match"] = {"path": pathIndex, "check": checkIndex, "frameId": frameId}
+
+    def end_stage(self, timedOut: bool = False) -> None:
+        """
+        Finishes the current visit and persists the trace of the run.
+        """
+        if self.__visit is None:
+            return
+        self.__visit["timedOut"] = timedOut
+        self.__visit["durationS"] = monotonic() - self.__stageStart
+        self.visits.append(self.__visit)
+        self.__visit = None
+        self.__frame = None
+        self.save()
+
+    def save(self) -> None:
+        """
+        Writes all visits recorded so far to the 'trace.json' of the current run.
+        """
+        assert self.runDir
+        with open(path.join(self.runDir, TRACE_FILE_NAME), "w", encoding="utf-8") as file:
+            json.dump({"visits": self.visits}, file, indent=2)
+
+    def __frame_dict(self) -> Optional[Dict[str, Any]]:
+        """
+        Returns the trace entry of the current frame. None in case no frame has been recorded for the current visit yet.
+        """
+        if self.__visit is None or not self.__visit["frames"]:
+            return None
+        frameDict: Dict[str, Any] = self.__visit["frames"][-1]
+        return frameDict
+
+    def __save_frame(self) -> None:
+        frameDict: Optional[Dict[str, Any]] = self.__frame_dict()
+        assert self.runDir and self.__visit is not None and self.__frame is not None and frameDict is not None
+        fileName: str = f"{self.__visit['visit']:04d}_{self.__frame.frameId:06d}.png"
+        if not cv2.imwrite(path.join(self.runDir, fileName), self.__frame.img):
+            raise OSError(f"Failed to write frame '{fileName}' to '{self.runDir}'.")
+        frameDict["file"] = fileName
@@ -1,42 +1,80 @@
+from __future__ import annotations
+
 import json
-import sys
 from contextlib import suppress
-from os import path, remove
-from time import sleep, time
-from typing import Any, Dict, List, Optional, Tuple
+from os import path
+from time import monotonic, sleep, time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
 
-import cv2
 import libvirt
 import libvirt_qemu
-import numpy as np
-from skimage import metrics as skimage_metrics
 
-from os_tester.debug_plot import debugPlot
-from os_tester.stages import area, stage, stages, subPath
+from os_tester.capture import decode_frame, frame, frameGrabber
+from os_tester.checkpoints import checkpoint, checkpointStore
+from os_tester.compare import area_to_rect, compWorkspace, imageMask
+from os_tester.console import consoleBuffer, consoleReader
+from os_tester.events import domainStateWatcher, event_loop_running
+from os_tester.exceptions import actionError, compareError, consoleError, osTesterError, outputError, stageNotFoundError, stageTimeoutError, vmError
+from os_tester.lazy import lazy_import
+from os_tester.match_stats import matchStats
+from os_tester.profiler import nullProfiler
+from os_tester.run_result import runResult, stageResult
+from os_tester.stages import area, checkConsole, checkFile, checkState, stage, stages, subPath
+from os_tester.trace import traceRecorder
+
+if TYPE_CHECKING:
+    import cv2
+
+    from os_tester.debug_plot import debugPlot
+else:
+    cv2 = lazy_import("cv2")
 
 
-class vm:
+class vm:  # pylint: disable=too-many-instance-attributes
     """
     A wrapper around a qemu libvirt VM that handles the live time and stage execution.
     """
 
+    # How often stages awaiting screenshots together with console output or VM states evaluate the latter
+    POLL_INTERVAL_S: float = 0.1
+
     conn: libvirt.virConnect
     uuid: str
     debugPlt: bool
+    # Minimum time in seconds between two screenshots while waiting for a stage
+    captureIntervalS: float
 
     vmDom: Optional[libvirt.virDomain]
     debugPlotObj: debugPlot
     matchedImageIndex: int
-
-    def __init__(self, conn: libvirt.virConnect, uuid: str, debugPlt: bool = False):
+    # Opened on demand by the first stage with console checks
+    consoleReaderObj: Optional[consoleReader]
+    # Created on demand in case the libvirt event loop is running or a stage awaits a VM state
+    stateWatcherObj: Optional[domainStateWatcher]
+    compWorkspaceObj: compWorkspace
+    # Only set while 'run_stages(...)' records SSIM traces for calibrating thresholds
+    traceRecorderObj: Optional[traceRecorder]
+    # A 'runProfiler' while 'run_stages(...)' profiles, otherwise a no-op
+    profilerObj: nullProfiler
+
+    def __init__(self, conn: libvirt.virConnect, uuid: str, debugPlt: bool = False, captureIntervalS: float = 0.5):
         self.conn = conn
         self.uuid = uuid
         self.debugPlt = debugPlt
+        self.captureIntervalS = captureIntervalS
         if self.debugPlt:
+            # Imports matplotlib, so only done in case plotting is enabled
+            from os_tester.debug_plot import debugPlot  # pylint: disable=import-outside-toplevel
+
             self.debugPlotObj = debugPlot()
 
         self.vmDom = None
         self.matchedImageIndex = 0
+        self.consoleReaderObj = None
+        self.stateWatcherObj = None
+        self.compWorkspaceObj = compWorkspace()
+        self.traceRecorderObj = None
+        self.profilerObj = nullProfiler()
 
     def __perform_stage_actions(self, actions: List[Dict[str, Any]]) -> None:
         """
@@ -44,6 +82,9 @@ class vm:
 
         Args:
             actions (List[Dict[str, Any]]): A list of actions that should be performed
+
+        Raises:
+            actionError: In case an action is unknown.
         """
         action: Dict[str, Any]
         for action in actions:
@@ -67,87 +108,39 @@ class vm:
                 assert self.vmDom
                 self.vmDom.shutdown()
             else:
-                raise Exception(f"Invalid stage action: {action}")
-
-    def __img_diff(
-        self,
-        curImg: cv2.typing.MatLike,
-        refImg: cv2.typing.MatLike,
-    ) -> cv2.typing.MatLike:
-        """
-        Calculates the image difference between two given images.
-        Both images have to have the same size.
-
-        Args:
-            curImg (cv2.typing.MatLike): The current image taken from the VM.
-            refImg (cv2.typing.MatLike): The reference image we are awaiting.
-
-        Returns:
-            Tcv2.typing.MatLike: The image diff.
-        """
-        # Use absdiff on float to avoid uint8 saturation masking differences.
-        imgDiff: cv2.typing.MatLike = cv2.absdiff(
-            curImg.astype(np.float32),
-            refImg.astype(np.float32),
-        )
-        return imgDiff
+                raise actionError(f"Invalid stage action: {action}")
 
     def __comp_images(
         self,
         curImg: cv2.typing.MatLike,
         refImg: cv2.typing.MatLike,
         imageArea: Optional[area] = None,
-    ) -> Tuple[float, cv2.typing.MatLike]:
+        mask: Optional[imageMask] = None,
+    ) -> float:
         """
         Compares the provided images and calculates the structural similarity index.
-        Based on: https://scikit-image.org/docs/0.25.x/auto_examples/transform/plot_ssim.html
+        Uses the scratch buffers of 'self.compWorkspaceObj'. The diff image is available afterwards via 'self.compWorkspaceObj.diff_image()'.
 
         Args:
             curImg (cv2.typing.MatLike): The current image taken from the VM.
             refImg (cv2.typing.MatLike): The reference image we are awaiting.
             area (Optional[area]): Optional sub-rectangle (normalized) used for comparison.
+            mask (Optional[imageMask]): Optional per pixel weights. The mask weighted mean SSIM gets returned in this case.
 
         Returns:
-            Tuple[float, cv2.typing.MatLike]: A tuple consisting of the structural similarity index and a image diff of both images.
-        """
-        # Get the dimensions of the original image
-        hRef, wRef = refImg.shape[:2]
+            float: The structural similarity index.
 
-        # Get the dimensions of the current image
-        hCur, wCur = curImg.shape[:2]
-
-        # Resize the reference image to match the original image's dimensions
-        if (hRef != hCur) or (wRef != wCur):
-            curImgResized = cv2.resize(curImg, (wRef, hRef))
-        else:
-            curImgResized = curImg
-
-        # If a sub-area has been defined, cut the image accordingly
-        if imageArea is not None:
-            x1 = int(np.floor(imageArea.x1Percentage * wRef))
-            x2 = int(np.ceil(imageArea.x2Percentage * wRef))
-            y1 = int(np.floor(imageArea.y1Percentage * hRef))
-            y2 = int(np.ceil(imageArea.y2Percentage * hRef))
-            refImg = refImg[y1:y2, x1:x2]
-            curImgResized = curImgResized[y1:y2, x1:x2]
-
-        diffImg: cv2.typing.MatLike = self.__img_diff(refImg, curImgResized)
-
-        ssimIndex: float = skimage_metrics.structural_similarity(refImg, curImgResized, channel_axis=-1)
-        ssimIndex = min(1.0, max(0.0, ssimIndex))
-
-        # ssimIndex = np.clip(a=ssimIndex, a_min=0.0, a_max=1.0)
-        return (ssimIndex, diffImg)
+        Raises:
+            ValueError: In case the (masked) area is too small to compare.
+        """
+        return self.compWorkspaceObj.comp_images(curImg, refImg, imageArea, mask)
 
     def __draw_area_outline(self, img: cv2.typing.MatLike, imageArea: area) -> cv2.typing.MatLike:
         """
         Draws a red outline around the selected area on a copy of the provided image.
         """
         h, w = img.shape[:2]
-        x1 = int(np.floor(imageArea.x1Percentage * w))
-        x2 = int(np.ceil(imageArea.x2Percentage * w))
-        y1 = int(np.floor(imageArea.y1Percentage * h))
-        y2 = int(np.ceil(imageArea.y2Percentage * h))
+        x1, x2, y1, y2 = area_to_rect(imageArea, w, h)
 
         x1 = max(0, min(w - 1, x1))
         x2 = max(1, min(w, x2))
@@ -185,116 +178,530 @@ class vm:
         Args:
             curImg (cv2.typing.MatLike): The source image to save.
             imageArea (Optional[area]): Optional comparison area to outline.
+
+        Raises:
+            outputError: In case the image could not be written.
         """
         if imageArea is not None:
             curImg = self.__draw_area_outline(curImg, imageArea)
 
-        cv2.imwrite(f"/tmp/matched_{self.uuid}_{self.matchedImageIndex}.png", curImg)
+        filePath: str = f"/tmp/matched_{self.uuid}_{self.matchedImageIndex}.png"
+        if not cv2.imwrite(filePath, curImg):
+            raise outputError(f"Failed to write the matched image '{filePath}'.")
         self.matchedImageIndex += 1
 
-    def __wait_for_stage_done(self, stageObj: stage) -> subPath:
+    def __wait_for_stage_done(self, stageObj: stage, statsObj: Optional[matchStats]) -> Tuple[subPath, Optional[Union[checkFile, checkConsole, checkState]]]:
         """
         Returns once the given stages reference image is reached.
 
         Args:
             stageObj (stage): The stage we want to await for.
+            statsObj (Optional[matchStats]): Match statistics used to order paths for stages with 'reorder_paths'.
+
+        Returns:
+            Tuple[subPath, Optional[Union[checkFile, checkConsole, checkState]]]: The matching path and its matching check. See '__check_paths(...)'.
+
+        Raises:
+            screenshotError: In case the VM screenshot could not be loaded.
+            stageTimeoutError: In case no path matched within the stage timeout.
         """
         timeoutInS = stageObj.timeoutS
         start = time()
 
-        while True:
-            loop_start = time()
-            # Take a new screenshot
-            curImgPath: str = f"/tmp/check_{self.uuid}.png"
-            self.take_screenshot(curImgPath)
-            curImgOpt: cv2.typing.MatLike | None = cv2.imread(curImgPath)
-            if curImgOpt is None:
-                print("Failed to convert current image to CV2 object")
-                sys.exit(6)
-            curImg: cv2.typing.MatLike = curImgOpt
-
-            ssimIndex: float
-            difImg: cv2.typing.MatLike
-
-            pathIndex: int = 1
-
-            # Compare the screenshot with all reference images
-            for subPathObj in stageObj.pathsList:
-                # If there are no checks. We consider is asd a successful check
-                if not subPathObj.checkList:
-                    return subPathObj
-
-                print(f"Checking path {pathIndex}...")
-                for check in subPathObj.checkList:
-                    # Compare images by calculating similarity
-                    ssimIndex, difImg = self.__comp_images(curImg, check.fileData, check.area)
-                    same: float = 1 if ssimIndex >= check.ssimGeq else 0
-
-                    if self.debugPlt:
-                        self.debugPlotObj.update_plot(check.fileData, curImg, difImg, ssimIndex, same)
-
-                    # Break if we found a matching image
-                    if same >= 1:
-                        print(f"\t✅ [{path.basename(check.filePath)}]: SSIM expected geq {check.ssimGeq} - SSIM actual: {ssimIndex}, Images same: {same}")
-                        self.__save_matched_image(curImg, check.area)
-                        return subPathObj
-                    print(f"\t❌ [{path.basename(check.filePath)}]: SSIM expected geq {check.ssimGeq} - SSIM actual: {ssimIndex}, Images same: {same}")
-
-                pathIndex += 1
-
-            # if timeout is exited
-            if start + timeoutInS < time():
-                print(f"⌛ Timeout for stage '{stageObj.name}' reached after {timeoutInS} seconds.")
-                sys.exit(5)
-
-            # Avoid checking more frequently than every 0.5 seconds, accounting for processing time.
-            elapsed = time() - loop_start
-            sleep(max(0.0, 0.5 - elapsed))
-
-    def __run_stage(self, stageObj: stage) -> str:
+        # Scratch buffers are kept for the shapes compared during this stage only
+        self.compWorkspaceObj.reset()
+
+        orderedPaths: List[Tuple[int, subPath]] = statsObj.order_paths(stageObj) if statsObj else list(enumerate(stageObj.pathsList))
+
+        readerObj: Optional[consoleReader] = self.__get_console_reader() if stageObj.hasConsoleChecks else None
+        watcherObj: Optional[domainStateWatcher] = self.__get_state_watcher() if stageObj.hasStateChecks or event_loop_running() else None
+
+        # Screenshots are captured and decoded in the background while the previous one gets compared.
+        # Capturing pauses while the VM is not running. Stages only awaiting console output or VM states do not need screenshots at all.
+        grabber: Optional[frameGrabber] = None
+        if stageObj.hasImageChecks:
+            grabber = frameGrabber(self.capture_screenshot, self.captureIntervalS, waitReadyFn=watcherObj.wait_for_running if watcherObj else None)
+            grabber.start()
+
+        # Console output and VM states are cheap to check, so they get evaluated more often than screenshots arrive
+        pollCheapChecks: bool = stageObj.hasConsoleChecks or stageObj.hasStateChecks
+
+        # In case reopening an ended console failed, only the next stage tries again
+        reopenConsole: bool = True
+
+        try:
+            while True:
+                # Console output written while the console was closed is lost, so reopen it right away
+                if readerObj and reopenConsole and not readerObj.running:
+                    readerObj = self.__reopen_console() or readerObj
+                    reopenConsole = readerObj.running
+
+                consoleOffset: int = readerObj.endOffset if readerObj else 0
+                stateChangeCount: int = watcherObj.changeCount if watcherObj else 0
+                curImg: Optional[cv2.typing.MatLike] = None
+                if grabber:
+                    waitS: float = start + timeoutInS - time()
+                    curImg = self.__grab_frame(grabber, min(waitS, self.POLL_INTERVAL_S) if pollCheapChecks else waitS)
+
+                # Without screenshots (console/state checks or paths without checks only) evaluate on every iteration
+                if curImg is not None or pollCheapChecks or not grabber:
+                    match: Optional[Tuple[subPath, Optional[Union[checkFile, checkConsole, checkState]]]] = self.__check_paths(stageObj, orderedPaths, curImg, readerObj, watcherObj, statsObj)
+                    if match:
+                        return match
+
+                # if timeout is exited
+                if start + timeoutInS < time():
+                    print(f"⌛ Timeout for stage '{stageObj.name}' reached after {timeoutInS} seconds.")
+                    raise stageTimeoutError(stageObj.name, timeoutInS)
+
+                if not grabber:
+                    self.__wait_for_input(readerObj, watcherObj, consoleOffset, stateChangeCount, start + timeoutInS - time())
+        finally:
+            if grabber:
+                grabber.stop()
+
+    def __grab_frame(self, grabber: frameGrabber, waitS: float) -> Optional[cv2.typing.MatLike]:
+        """
+        Waits for the next screenshot and records it inside the SSIM trace.
+
+        Returns:
+            Optional[cv2.typing.MatLike]: The new screenshot. None in case no new one arrived within 'waitS' seconds.
+        """
+        frameObj: Optional[frame] = grabber.get_newest(waitS)
+        if not frameObj:
+            return None
+        if self.traceRecorderObj:
+            self.traceRecorderObj.record_frame(frameObj)
+        return frameObj.img
+
+    def __wait_for_input(
+        self,
+        readerObj: Optional[consoleReader],
+        watcherObj: Optional[domainStateWatcher],
+        consoleOffset: int,
+        stateChangeCount: int,
+        waitS: float,
+    ) -> None:
+        """
+        Blocks stages not awaiting screenshots until new console output or a VM state change arrived or 'waitS' seconds passed.
+
+        Args:
+            consoleOffset (int): The console 'endOffset' the last evaluation has seen.
+            stateChangeCount (int): The 'changeCount' of the state watcher the last evaluation has seen.
+        """
+        if readerObj and not watcherObj and readerObj.running:
+            readerObj.wait_for_data(consoleOffset, waitS)
+        elif watcherObj and not readerObj:
+            # Bounded, since without the event loop state changes are polled
+            watcherObj.wait_for_change(stateChangeCount, min(waitS, self.captureIntervalS))
+        elif readerObj:
+            # Both have to be polled, or the console ended and can not be waited on
+            sleep(max(0.0, min(waitS, self.POLL_INTERVAL_S)))
+
+    def __check_paths(
+        self,
+        stageObj: stage,
+        orderedPaths: List[Tuple[int, subPath]],
+        curImg: Optional[cv2.typing.MatLike],
+        readerObj: Optional[consoleReader],
+        watcherObj: Optional[domainStateWatcher],
+        statsObj: Optional[matchStats],
+    ) -> Optional[Tuple[subPath, Optional[Union[checkFile, checkConsole, checkState]]]]:
+        """
+        Evaluates the checks of all paths against the given VM image and the console output.
+
+        Args:
+            stageObj (stage): The stage we are waiting for.
+            orderedPaths (List[Tuple[int, subPath]]): Tuples of the original path index and the path in the order they should be evaluated.
+            curImg (Optional[cv2.typing.MatLike]): A new image taken from the VM. In case it is None, image checks are skipped and no path after the first path with an image check is evaluated.
+            readerObj (Optional[consoleReader]): The VM console. Only required in case the stage has console checks.
+            watcherObj (Optional[domainStateWatcher]): The VM state watcher. Only required in case the stage has state checks.
+            statsObj (Optional[matchStats]): Match statistics used to order checks for stages with 'reorder_paths'.
+
+        Returns:
+            Optional[Tuple[subPath, Optional[Union[checkFile, checkConsole, checkState]]]]: The first matching path and its matching check (None for paths without checks). None in case no path matched.
+        """
+        # Compare the screenshot with all reference images
+        for pathIndex, subPathObj in orderedPaths:
+            skippedImageCheck: bool = False
+            # If there are no checks. We consider is asd a successful check
+            if not subPathObj.checkList:
+                self.__on_match(stageObj, subPathObj, pathIndex, None, False, statsObj)
+                return subPathObj, None
+
+            if curImg is not None:
+                print(f"Checking path {pathIndex + 1}...")
+            orderedChecks = statsObj.order_checks(stageObj, subPathObj) if statsObj else list(enumerate(subPathObj.checkList))
+            for checkIndex, check in orderedChecks:
+                # Image checks can only be evaluated once a new screenshot arrived
+                if isinstance(check, checkFile) and curImg is None:
+                    skippedImageCheck = True
+                    continue
+
+                with self.profilerObj.check(pathIndex, checkIndex, check):
+                    matched: bool = self.__evaluate_check(stageObj, subPathObj, pathIndex, checkIndex, check, curImg, readerObj, watcherObj, statsObj)
+                if matched:
+                    return subPathObj, check
+
+            # The first matching path wins. Later paths must not match before this path had the chance to with the next screenshot.
+            if skippedImageCheck:
+                return None
+        return None
+
+    def __evaluate_check(
+        self,
+        stageObj: stage,
+        subPathObj: subPath,
+        pathIndex: int,
+        checkIndex: int,
+        check: Union[checkFile, checkConsole, checkState],
+        curImg: Optional[cv2.typing.MatLike],
+        readerObj: Optional[consoleReader],
+        watcherObj: Optional[domainStateWatcher],
+        statsObj: Optional[matchStats],
+    ) -> bool:
+        """
+        Evaluates a single check of a path. Arguments are the same as for '__check_paths(...)'.
+
+        Returns:
+            bool: True in case the check matched.
+        """
+        if isinstance(check, checkConsole):
+            assert readerObj
+            if readerObj.search(check.regex):
+                print(f"\t✅ [console]: Found '{check.pattern}'")
+                self.__on_match(stageObj, subPathObj, pathIndex, checkIndex, False, statsObj)
+                return True
+            return False
+
+        if isinstance(check, checkState):
+            assert watcherObj
+            if watcherObj.has_state(check.state):
+                print(f"\t✅ [state]: VM is '{check.state}'")
+                self.__on_match(stageObj, subPathObj, pathIndex, checkIndex, False, statsObj)
+                return True
+            return False
+
+        assert curImg is not None
+
+        # Compare images by calculating similarity
+        try:
+            ssimIndex: float = self.__comp_images(curImg, check.fileData, check.area, check.maskSpecObj.mask)
+        except ValueError as e:
+            raise compareError(f"Failed to compare '{check.filePath}' to the VM screenshot: {e}") from e
+        same: float = 1 if ssimIndex >= check.ssimGeq else 0
+
+        # The diff image only gets calculated in case someone looks at it
+        if self.debugPlt:
+            self.debugPlotObj.update_plot(check.fileData, curImg, self.compWorkspaceObj.diff_image(), ssimIndex, same)
+
+        if statsObj:
+            statsObj.record_score(stageObj, subPathObj, checkIndex, ssimIndex)
+        if self.traceRecorderObj:
+            self.traceRecorderObj.record_score(pathIndex, checkIndex, ssimIndex)
+
+        # Break if we found a matching image
+        if same >= 1:
+            print(f"\t✅ [{path.basename(check.filePath)}]: SSIM expected geq {check.ssimGeq} - SSIM actual: {ssimIndex}, Images same: {same}")
+            self.__save_matched_image(curImg, check.area)
+            self.__on_match(stageObj, subPathObj, pathIndex, checkIndex, True, statsObj)
+            return True
+        print(f"\t❌ [{path.basename(check.filePath)}]: SSIM expected geq {check.ssimGeq} - SSIM actual: {ssimIndex}, Images same: {same}")
+        return False
+
+    def __on_match(self, stageObj: stage, subPathObj: subPath, pathIndex: int, checkIndex: Optional[int], viaImage: bool, statsObj: Optional[matchStats]) -> None:
+        """
+        Records a matching path inside the match statistics and the SSIM trace.
+
+        Args:
+            checkIndex (Optional[int]): The (zero based) index of the matching check. None for paths without checks.
+            viaImage (bool): True in case an image check matched the current frame.
+        """
+        if statsObj and checkIndex is not None:
+            statsObj.record_match(stageObj, subPathObj, checkIndex)
+        if self.traceRecorderObj:
+            self.traceRecorderObj.record_match(pathIndex, checkIndex, viaImage)
+
+    def __get_console_reader(self) -> consoleReader:
+        """
+        Returns the reader for the serial console of the VM and opens it in case it has not been opened yet.
+        The reader stays open across stages, so console output written between two stages does not get lost.
+        In case the console stream ended or failed in the meantime, it gets reopened and continues with the already read output.
+
+        Raises:
+            consoleError: In case the console can not be opened.
+        """
+        if self.consoleReaderObj and self.consoleReaderObj.running:
+            return self.consoleReaderObj
+
+        prevBuffer: Optional[consoleBuffer] = None
+        if self.consoleReaderObj:
+            print("VM console has been closed. Reopening it...")
+            prevBuffer = self.consoleReaderObj.buffer
+
+        assert self.vmDom
+        readerObj: consoleReader = consoleReader(self.conn, self.vmDom, buffer=prevBuffer)
+        try:
+            readerObj.start()
+        except libvirt.libvirtError as e:
+            # The ended reader is kept, so its output can still be searched
+            raise consoleError(f"Failed to open the VM console: {e}") from e
+        self.close_console()
+        self.consoleReaderObj = readerObj
+        return self.consoleReaderObj
+
+    def __reopen_console(self) -> Optional[consoleReader]:
+        """
+        Reopens the VM console after its stream ended while awaiting a stage, e.g. because the VM rebooted.
+        Failing to do so is only reported, since the stage might await the VM shutting down.
+
+        Returns:
+            Optional[consoleReader]: The reopened reader. None in case reopening failed.
+        """
+        try:
+            return self.__get_console_reader()
+        except consoleError as e:
+            print(f"{e} Continuing with the console output received so far.")
+            return None
+
+    def __get_state_watcher(self) -> domainStateWatcher:
+        """
+        Returns the watcher tracking the VM power state and creates it in case it does not exist yet.
+        """
+        if not self.stateWatcherObj:
+            assert self.vmDom
+            self.stateWatcherObj = domainStateWatcher(self.conn, self.vmDom)
+        return self.stateWatcherObj
+
+    def close_state_watcher(self) -> None:
+        """
+        Stops listening for VM lifecycle events in case a watcher has been created.
+        """
+        if self.stateWatcherObj:
+            self.stateWatcherObj.close()
+            self.stateWatcherObj = None
+
+    def close_console(self) -> None:
+        """
+        Closes the serial console of the VM in case it has been opened by a stage with console checks.
+        """
+        if self.consoleReaderObj:
+            self.consoleReaderObj.stop()
+            self.consoleReaderObj = None
+
+    def __run_stage(self, stageObj: stage, statsObj: Optional[matchStats]) -> Tuple[str, Optional[float]]:
         """
         1. Awaits until we reach the current stage reference image.
         2. Executes all actions defined by this stage.
 
         Args:
             stageObj (stage): The stage to execute/await for the image.
+            statsObj (Optional[matchStats]): Match statistics used to order paths for stages with 'reorder_paths'.
         Returns:
-            str: with the name of the next requested Stage
+            Tuple[str, Optional[float]]: The name of the next requested Stage and the 'stageResult.stateChangeS' of the stage.
+
+        Raises:
+            vmError: In case a libvirt call failed while awaiting the stage or performing its actions.
         """
-        start: float = time()
         print(f"Running stage '{stageObj.name}'.")
 
-        subPathObj: subPath = self.__wait_for_stage_done(stageObj)
-        self.__perform_stage_actions(subPathObj.actions)
+        # Only stages that allow reordering their paths make use of and contribute to the match statistics
+        if not stageObj.reorderPaths:
+            statsObj = None
 
-        duration: float = time() - start
-        print(f"Stage '{stageObj.name}' finished after {duration}s. Next Stage is: '{subPathObj.nextStage}'")
+        stageStart: float = monotonic()
+        if self.traceRecorderObj:
+            self.traceRecorderObj.begin_stage(stageObj)
+        try:
+            with self.profilerObj.section("wait"):
+                subPathObj, matchedCheck = self.__wait_for_stage_done(stageObj, statsObj)
+        except (osTesterError, libvirt.libvirtError, OSError) as e:
+            # Persist what has been recorded so far, a timeout is exactly what calibrating thresholds is about.
+            # Failing to do so must not hide why the stage failed.
+            try:
+                self.__end_trace_stage(isinstance(e, stageTimeoutError))
+            except outputError as traceError:
+                print(traceError)
+            if isinstance(e, libvirt.libvirtError):
+                raise vmError(f"libvirt call failed while awaiting stage '{stageObj.name}': {e}") from e
+            if isinstance(e, OSError):
+                raise outputError(f"Failed to write the trace of stage '{stageObj.name}': {e}") from e
+            raise
+        self.__end_trace_stage(False)
+        if statsObj:
+            try:
+                statsObj.save()
+            except OSError as e:
+                raise outputError(f"Failed to write the match statistics '{statsObj.filePath}': {e}") from e
+        stateChangeS: Optional[float] = None
+        if isinstance(matchedCheck, checkState) and self.stateWatcherObj:
+            transitionTime: Optional[float] = self.stateWatcherObj.transition_time(matchedCheck.state)
+            stateChangeS = transitionTime - stageStart if transitionTime is not None else None
+        # A 'rebooted' state check of the next stage only covers reboots from here on
+        if self.stateWatcherObj:
+            self.stateWatcherObj.reset_reboot()
+        with self.profilerObj.section("actions"):
+            try:
+                self.__perform_stage_actions(subPathObj.actions)
+            except libvirt.libvirtError as e:
+                raise vmError(f"libvirt call failed while performing the actions of stage '{stageObj.name}': {e}") from e
+
+        return subPathObj.nextStage, stateChangeS
+
+    def __end_trace_stage(self, timedOut: bool) -> None:
+        """
+        Finishes the current stage visit of the trace recorder, in case one is recording.
 
-        return subPathObj.nextStage
+        Raises:
+            outputError: In case the trace could not be written.
+        """
+        if not self.traceRecorderObj:
+            return
+        try:
+            self.traceRecorderObj.end_stage(timedOut)
+        except OSError as e:
+            raise outputError(f"Failed to write the SSIM trace: {e}") from e
 
-    def run_stages(self, stagesObj: stages) -> None:
+    def run_stages(self, stagesObj: stages, checkpointDir: Optional[str] = None, recorderObj: Optional[traceRecorder] = None, profilerObj: Optional[nullProfiler] = None) -> runResult:
         """
         Executes all stages defined for the current PC and awaits every stage to finish before returning.
-        If no name with requested StageName found exit with error
-        """
-        nextStage = stagesObj.stagesList[0]
-        while True:
-            nextStageName = self.__run_stage(nextStage)
-            # if nextStageName is None exit program
-            if nextStageName == "None":
-                break
-            found: bool = False
-            for stageObj in stagesObj.stagesList:
-                # If the expected next Stage name is found break and continue with that stage
-                if stageObj.name == nextStageName:
-                    nextStage = stageObj
-                    found = True
+        Match statistics are persisted under 'stagesObj.statsFilePath' in case at least one stage allows reordering its paths.
+
+        Args:
+            stagesObj (stages): The stages to execute.
+            checkpointDir (Optional[str]): Enables checkpoints. After every stage with 'checkpoint: true' a VM snapshot is taken and its metadata is stored inside this directory.
+                                           In case a valid checkpoint for the current stages exists, the VM is reverted to it and execution resumes with the stage after it.
+            recorderObj (Optional[traceRecorder]): Records the SSIM time series of all image checks into a new run directory. Replay them via 'python -m os_tester.calibrate'.
+            profilerObj (Optional[nullProfiler]): Profiles the run, e.g. via a 'runProfiler' which writes collapsed stacks and a per stage summary once the run finished.
+
+        Returns:
+            runResult: The visited stages with their durations. In case a stage failed (timeout, unknown next stage, ...) 'error' describes why.
+        """
+        result: runResult = runResult()
+        runStart: float = time()
+
+        statsObj: Optional[matchStats] = None
+        if any(stageObj.reorderPaths for stageObj in stagesObj.stagesList):
+            statsObj = matchStats(stagesObj.statsFilePath)
+
+        self.traceRecorderObj = recorderObj
+        if profilerObj:
+            self.profilerObj = profilerObj
+
+        try:
+            storeObj: Optional[checkpointStore] = self.__start_run(checkpointDir)
+            # (stage name, next stage name) tuples of all visited stages. Used as checkpoint key.
+            visited: List[Tuple[str, str]] = list()
+            nextStage: stage = stagesObj.stagesList[0]
+            checkpointObj: Optional[checkpoint] = self.__try_resume(storeObj, stagesObj) if storeObj else None
+            if checkpointObj:
+                visited = list(checkpointObj.visited)
+                result.resumedStagePath = [stageName for stageName, _ in visited]
+                nextStage = self.__find_stage(stagesObj, checkpointObj.nextStage)
+
+            while True:
+                start: float = time()
+                try:
+                    with self.profilerObj.stage(nextStage.name):
+                        nextStageName, stateChangeS = self.__run_stage(nextStage, statsObj)
+                except osTesterError:
+                    result.stageResults.append(stageResult(nextStage.name, time() - start, None))
+                    raise
+
+                duration: float = time() - start
+                result.stageResults.append(stageResult(nextStage.name, duration, nextStageName, stateChangeS))
+                print(f"Stage '{nextStage.name}' finished after {duration}s. Next Stage is: '{nextStageName}'")
+
+                # "None" marks the last stage
+                if nextStageName == "None":
                     break
 
-            # Exit if no matching stage was found
-            if not found:
-                print(f"No Stage named '{nextStageName}' was found ")
-                sys.exit(10)
+                visited.append((nextStage.name, nextStageName))
+                if storeObj and nextStage.checkpoint:
+                    self.__save_checkpoint(storeObj, stagesObj, visited)
+
+                nextStage = self.__find_stage(stagesObj, nextStageName)
+        except osTesterError as e:
+            print(f"Running stages failed: {e}")
+            result.error = e
+        finally:
+            self.close_console()
+            self.close_state_watcher()
+            self.traceRecorderObj = None
+            try:
+                self.profilerObj.stop()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # Failing to write the profile must not replace the result of the run
+                print(f"Failed to write the profile: {e}")
+            self.profilerObj = nullProfiler()
+
+        result.durationS = time() - runStart
+        return result
+
+    def __start_run(self, checkpointDir: Optional[str]) -> Optional[checkpointStore]:
+        """
+        Starts the trace recorder and profiler of the run and opens the checkpoint store.
+
+        Returns:
+            Optional[checkpointStore]: The checkpoint store inside 'checkpointDir'. None in case checkpoints are disabled.
+
+        Raises:
+            outputError: In case the run or checkpoint directory could not be created.
+        """
+        try:
+            if self.traceRecorderObj:
+                self.traceRecorderObj.start_run()
+            storeObj: Optional[checkpointStore] = checkpointStore(checkpointDir) if checkpointDir else None
+        except OSError as e:
+            raise outputError(f"Failed to create the output directories of the run: {e}") from e
+        self.profilerObj.start()
+        return storeObj
+
+    def __try_resume(self, storeObj: checkpointStore, stagesObj: stages) -> Optional[checkpoint]:
+        """
+        Reverts the VM to the latest valid checkpoint for the given stages.
+
+        Returns:
+            Optional[checkpoint]: The restored checkpoint or None in case there is none or restoring it failed.
+        """
+        checkpointObj: Optional[checkpoint] = storeObj.find_latest(stagesObj)
+        if not checkpointObj:
+            return None
+
+        assert self.vmDom
+        try:
+            storeObj.restore(self.vmDom, checkpointObj)
+        except libvirt.libvirtError as e:
+            print(f"Failed to restore checkpoint '{checkpointObj.snapshotName}'. Running all stages. {e}")
+            return None
+
+        print(f"Resumed from checkpoint '{checkpointObj.snapshotName}' after stage '{checkpointObj.visited[-1][0]}'.")
+        return checkpointObj
+
+    def __save_checkpoint(self, storeObj: checkpointStore, stagesObj: stages, visited: List[Tuple[str, str]]) -> None:
+        """
+        Snapshots the VM for the given suite prefix. Failing to do so only gets reported since the run itself can continue.
+        """
+        assert self.vmDom
+        start: float = time()
+        try:
+            checkpointObj: checkpoint = storeObj.save(self.vmDom, stagesObj, visited)
+        except (libvirt.libvirtError, OSError) as e:
+            print(f"Failed to save checkpoint after stage '{visited[-1][0]}': {e}")
+            return
+        print(f"Saved checkpoint '{checkpointObj.snapshotName}' after {time() - start}s.")
+
+    def __find_stage(self, stagesObj: stages, stageName: str) -> stage:
+        """
+        Returns the stage with the given name.
+
+        Raises:
+            stageNotFoundError: In case no stage with the given name exists.
+        """
+        for stageObj in stagesObj.stagesList:
+            if stageObj.name == stageName:
+                return stageObj
+        raise stageNotFoundError(stageName)
 
     def try_load(self) -> bool:
         """
@@ -318,6 +725,8 @@ class vm:
         if not self.vmDom:
             raise Exception("Can not destroy vm. Use try_load or create first!")
 
+        self.close_console()
+        self.close_state_watcher()
         self.vmDom.destroy()
 
     def create(self, vmXml: str) -> None:
@@ -339,24 +748,36 @@ class vm:
 
         self.vmDom = self.conn.createXML(vmXml, 0)
 
-    def take_screenshot(self, targetPath: str) -> None:
+    def capture_screenshot(self) -> bytes:
         """
-        Takes a screenshoot of the current VM output and stores it as a file.
+        Takes a screenshoot of the current VM output and returns its raw data (e.g. PNG or PPM).
 
-        Args:
-            targetPath (str): Where to store the screenshoot at.
+        Returns:
+            bytes: The raw screenshoot data as returned by libvirt.
         """
         stream: libvirt.virStream = self.conn.newStream()
 
         assert self.vmDom
         _ = self.vmDom.screenshot(stream, 0)
 
-        with open(targetPath, "wb") as f:
+        chunks: List[bytes] = list()
+        streamBytes = stream.recv(262120)
+        while streamBytes != b"":
+            chunks.append(streamBytes)
             streamBytes = stream.recv(262120)
-            while streamBytes != b"":
-                f.write(streamBytes)
-                streamBytes = stream.recv(262120)
         stream.finish()
+        return b"".join(chunks)
+
+    def take_screenshot(self, targetPath: str) -> None:
+        """
+        Takes a screenshoot of the current VM output and stores it as a file.
+
+        Args:
+            targetPath (str): Where to store the screenshoot at.
+        """
+        data: bytes = self.capture_screenshot()
+        with open(targetPath, "wb") as f:
+            f.write(data)
 
     def __get_screen_size(self) -> Tuple[int, int]:
         """
@@ -365,17 +786,11 @@ class vm:
         Returns:
             Tuple[int, int]: width and height
         """
-        filePath: str = f"/tmp/{self.uuid}_screen_size.png"
-        self.take_screenshot(filePath)
-
-        img: cv2.typing.MatLike | None = cv2.imread(filePath)
-
-        if not img:
+        try:
+            img: cv2.typing.MatLike = decode_frame(self.capture_screenshot())
+        except osTesterError:
             return (0, 0)
 
-        # Delete screen shoot again since we do not need it any more
-        remove(filePath)
-
         h, w = img.shape[:2]
         return (w, h)
 
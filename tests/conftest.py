@@ -0,0 +1,22 @@
+from typing import Callable, Dict
+
+import cv2
+import numpy as np
+import pytest
+
+from os_tester.stages import stages
+
+
+@pytest.fixture
+def write_suite(tmp_path) -> Callable[[str, Dict[str, int]], stages]:
+    """
+    Returns a function writing the given stages file and uniformly colored 10x10 reference images (name -> value) into 'tmp_path' and loading the suite.
+    """
+
+    def write(stage_yaml: str, refImages: Dict[str, int]) -> stages:
+        for name, value in refImages.items():
+            cv2.imwrite(str(tmp_path / name), np.full((10, 10, 3), value, dtype=np.uint8))
+        (tmp_path / "stages.yml").write_text(stage_yaml, encoding="utf-8")
+        return stages(str(tmp_path), "stages")
+
+    return write
@@ -0,0 +1,167 @@
+import json
+
+import cv2
+import numpy as np
+
+from os_tester.calibrate import calibrator, candidate_areas, find_traces, main, suggest_threshold
+from os_tester.capture import frame
+from os_tester.compare import compWorkspace
+from os_tester.stages import area, stages
+from os_tester.trace import TRACE_FILE_NAME, traceRecorder
+
+
+def _noise(seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, (64, 64, 3), dtype=np.uint8)
+
+
+def _write_suite(tmp_path, ref: np.ndarray) -> stages:
+    cv2.imwrite(str(tmp_path / "ref.png"), ref)
+    stage_yaml = """
+stages:
+  - stage: "login"
+    timeout_s: 5
+    paths:
+      - path:
+          checks:
+            - path: "ref.png"
+              ssim_geq: 0.99
+          actions: []
+          nextStage: "None"
+"""
+    (tmp_path / "stages.yml").write_text(stage_yaml, encoding="utf-8")
+    return stages(str(tmp_path), "stages")
+
+
+def _record(tmp_path, suite: stages, frames, saveFrames: bool = True, matchLast: bool = True) -> traceRecorder:
+    """
+    Records a single visit of the first stage. The last frame matches in case 'matchLast' is set.
+    """
+    stageObj = suite.stagesList[0]
+    check = stageObj.pathsList[0].checkList[0]
+    recorder = traceRecorder(str(tmp_path / "traces"), saveFrames)
+    recorder.start_run()
+    recorder.begin_stage(stageObj)
+    workspace = compWorkspace()
+    for i, img in enumerate(frames):
+        recorder.record_frame(frame(i, img, float(i)))
+        recorder.record_score(0, 0, workspace.comp_images(img, check.fileData))
+    if matchLast:
+        recorder.record_match(0, 0, True)
+    recorder.end_stage(timedOut=not matchLast)
+    return recorder
+
+
+def test_suggest_threshold() -> None:
+    assert suggest_threshold([0.95, 0.97], [0.5], 0.005) == 0.945
+    # Never closer to the negatives than to the positives
+    assert suggest_threshold([0.95], [0.93], 0.05) == 0.94
+    assert suggest_threshold([0.9], [0.95], 0.005) is None
+    assert suggest_threshold([], [0.5], 0.005) is None
+
+
+def test_candidate_areas_are_ordered_by_size() -> None:
+    areas = candidate_areas(area({"x1Percentage": 0.0, "x2Percentage": 0.5, "y1Percentage": 0.5, "y2Percentage": 1.0}), 2)
+    sizes = [(a.x2Percentage - a.x1Percentage) * (a.y2Percentage - a.y1Percentage) for a in areas]
+
+    assert len(areas) == 9
+    assert sizes == sorted(sizes)
+    assert sizes[0] == 0.0625
+    assert all(a.x2Percentage <= 0.5 and a.y1Percentage >= 0.5 for a in areas)
+
+
+def test_recorder_writes_trace_with_match(tmp_path) -> None:
+    ref = _noise(0)
+    suite = _write_suite(tmp_path, ref)
+    recorder = _record(tmp_path, suite, [_noise(1), ref], saveFrames=False)
+
+    assert recorder.runDir
+    with open(f"{recorder.runDir}/{TRACE_FILE_NAME}", "r", encoding="utf-8") as file:
+        visit = json.load(file)["visits"][0]
+
+    assert visit["stage"] == "login"
+    assert visit["match"] == {"path": 0, "check": 0, "frameId": 1}
+    assert [f["scores"]["0:0"] for f in visit["frames"]][1] == 1.0
+    # Without 'saveFrames' only the matching frame gets stored
+    assert visit["frames"][0]["file"] is None
+    assert visit["frames"][1]["file"]
+    assert find_traces([str(tmp_path / "traces")]) == [recorder.runDir]
+
+
+def test_calibrator_suggests_threshold_and_area(tmp_path) -> None:
+    ref = _noise(0)
+    suite = _write_suite(tmp_path, ref)
+    # The bottom half contains dynamic content (e.g. a clock) and never equals the reference
+    matching = ref.copy()
+    matching[32:] = _noise(1)[32:]
+    recorder = _record(tmp_path, suite, [_noise(2), _noise(3), matching])
+
+    calibratorObj = calibrator()
+    assert recorder.runDir
+    calibratorObj.add_run(recorder.runDir)
+    check = calibratorObj.suggest()[0]
+
+    assert len(check.positives) == 1
+    assert len(check.negatives) == 2
+    assert check.suggestionObj.ssimGeq is not None
+    assert max(check.negatives) < check.suggestionObj.ssimGeq < min(check.positives)
+
+    # The smallest grid cell inside the static top half separates matching from not matching frames
+    assert check.suggestionObj.imageArea is not None
+    assert check.suggestionObj.imageArea.y2Percentage <= 0.5
+    assert (check.suggestionObj.imageArea.x2Percentage - check.suggestionObj.imageArea.x1Percentage) * (check.suggestionObj.imageArea.y2Percentage - check.suggestionObj.imageArea.y1Percentage) == 0.0625
+    assert check.suggestionObj.areaSsimGeq is not None and check.suggestionObj.areaSsimGeq > check.suggestionObj.ssimGeq
+
+
+def test_calibrator_ignores_frames_right_before_match(tmp_path) -> None:
+    ref = _noise(0)
+    suite = _write_suite(tmp_path, ref)
+    # The awaited screen got shown one frame early, but did not reach the configured 'ssim_geq' yet
+    almost = ref.copy()
+    almost[:4] = 0
+    recorder = _record(tmp_path, suite, [_noise(1), almost, ref])
+    assert recorder.runDir
+
+    biased = calibrator(suggestAreas=False)
+    biased.add_run(recorder.runDir)
+    assert len(biased.suggest()[0].negatives) == 2
+
+    calibratorObj = calibrator(suggestAreas=False, ignoreBeforeMatch=1)
+    calibratorObj.add_run(recorder.runDir)
+    check = calibratorObj.suggest()[0]
+
+    assert len(check.positives) == 1
+    assert len(check.negatives) == 1
+    # Only the unrelated first frame is left as not matching
+    assert max(check.negatives) < 0.5
+
+
+def test_calibrator_reports_timed_out_visits(tmp_path) -> None:
+    ref = _noise(0)
+    suite = _write_suite(tmp_path, ref)
+    almost = ref.copy()
+    almost[:8] = 0
+    recorder = _record(tmp_path, suite, [_noise(1), almost], matchLast=False)
+
+    calibratorObj = calibrator()
+    assert recorder.runDir
+    calibratorObj.add_run(recorder.runDir)
+    check = calibratorObj.suggest()[0]
+
+    # Timed out visits are not labeled, since the awaited screen might have been reached
+    assert not check.positives and not check.negatives
+    assert check.suggestionObj.ssimGeq is None
+    assert check.timedOutBest is not None and check.timedOutBest[1] == 1
+
+
+def test_main_writes_json(tmp_path) -> None:
+    ref = _noise(0)
+    suite = _write_suite(tmp_path, ref)
+    _record(tmp_path, suite, [_noise(1), ref])
+    output = tmp_path / "suggestions.json"
+
+    assert main([str(tmp_path / "traces"), "--no-areas", "--output", str(output)]) == 0
+    suggestions = json.loads(output.read_text(encoding="utf-8"))
+    assert suggestions[0]["stage"] == "login"
+    assert suggestions[0]["suggestedSsimGeq"] == 0.995
+
+    assert main([str(tmp_path / "missing")]) == 1
@@ -0,0 +1,68 @@
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from os_tester.capture import decode_frame, frameGrabber
+from os_tester.exceptions import screenshotError
+
+
+def _encode(value: int) -> bytes:
+    ok, data = cv2.imencode(".png", np.full((8, 8, 3), value, dtype=np.uint8))
+    assert ok
+    return data.tobytes()
+
+
+def test_decode_frame() -> None:
+    img = decode_frame(_encode(42))
+    assert img.shape == (8, 8, 3)
+    assert int(img[0, 0, 0]) == 42
+
+
+def test_decode_frame_rejects_invalid_data() -> None:
+    with pytest.raises(screenshotError):
+        decode_frame(b"no image")
+
+
+def test_frame_grabber_returns_newest_frame() -> None:
+    captured = threading.Semaphore(0)
+    counter = [0]
+
+    def capture() -> bytes:
+        counter[0] += 1
+        captured.release()
+        return _encode(counter[0])
+
+    grabber = frameGrabber(capture, intervalS=0.0, queueSize=2)
+    with grabber:
+        for _ in range(5):
+            assert captured.acquire(timeout=5)
+        frameObj = grabber.get_newest(5)
+        assert frameObj is not None
+        # Stale frames have been dropped, so we get one of the newest frames
+        assert frameObj.frameId >= 2
+        nextFrame = grabber.get_newest(5)
+        assert nextFrame is not None
+        assert nextFrame.frameId > frameObj.frameId
+
+
+def test_frame_grabber_forwards_capture_errors() -> None:
+    def capture() -> bytes:
+        raise RuntimeError("screenshot failed")
+
+    with frameGrabber(capture, intervalS=0.0) as grabber:
+        with pytest.raises(RuntimeError, match="screenshot failed"):
+            grabber.get_newest(5)
+
+
+def test_frame_grabber_times_out_without_frames() -> None:
+    release = threading.Event()
+
+    def capture() -> bytes:
+        release.wait(5)
+        return _encode(0)
+
+    with frameGrabber(capture, intervalS=0.0) as grabber:
+        assert grabber.get_newest(0.05) is None
+        release.set()
@@ -0,0 +1,73 @@
+import pytest
+
+try:
+    import libvirt
+except Exception:
+    pytest.skip("libvirt is required to import os_tester.checkpoints", allow_module_level=True)
+
+from os_tester.checkpoints import checkpointStore
+
+_STAGES_YAML = """
+stages:
+  - stage: "install"
+    timeout_s: 5
+    checkpoint: true
+    paths:
+      - path:
+          checks:
+            - path: "ref.png"
+              ssim_geq: 0.9
+          actions: []
+          nextStage: "login"
+  - stage: "login"
+    timeout_s: 5
+    paths:
+      - path:
+          checks: []
+          actions: []
+          nextStage: "None"
+"""
+
+
+@pytest.fixture
+def test_domain():
+    conn = libvirt.open("test:///default")
+    yield conn.lookupByName("test")
+    conn.close()
+
+
+def test_checkpoint_save_and_restore(tmp_path, test_domain, write_suite) -> None:
+    stagesObj = write_suite(_STAGES_YAML, {"ref.png": 0})
+    storeObj = checkpointStore(str(tmp_path / "checkpoints"))
+    saved = storeObj.save(test_domain, stagesObj, [("install", "login")])
+
+    latest = storeObj.find_latest(stagesObj)
+    assert latest is not None
+    assert latest.key == saved.key
+    assert latest.nextStage == "login"
+
+    storeObj.restore(test_domain, latest)
+
+
+def test_checkpoint_restore_redefines_missing_snapshot(tmp_path, test_domain, write_suite) -> None:
+    stagesObj = write_suite(_STAGES_YAML, {"ref.png": 0})
+    storeObj = checkpointStore(str(tmp_path / "checkpoints"))
+    saved = storeObj.save(test_domain, stagesObj, [("install", "login")])
+    test_domain.snapshotLookupByName(saved.snapshotName, 0).delete(libvirt.VIR_DOMAIN_SNAPSHOT_DELETE_METADATA_ONLY)
+
+    storeObj.restore(test_domain, saved)
+    assert test_domain.snapshotLookupByName(saved.snapshotName, 0)
+
+
+def test_checkpoint_invalidated_by_changed_stage(tmp_path, test_domain, write_suite) -> None:
+    storeObj = checkpointStore(str(tmp_path / "checkpoints"))
+    storeObj.save(test_domain, write_suite(_STAGES_YAML, {"ref.png": 0}), [("install", "login")])
+
+    assert storeObj.find_latest(write_suite(_STAGES_YAML, {"ref.png": 255})) is None
+
+
+def test_checkpoint_prefix_key_depends_on_path(write_suite) -> None:
+    stagesObj = write_suite(_STAGES_YAML, {"ref.png": 0})
+
+    assert checkpointStore.prefix_key(stagesObj, [("install", "login")]) != checkpointStore.prefix_key(stagesObj, [("install", "other")])
+    assert checkpointStore.prefix_key(stagesObj, [("unknown", "login")]) is None
@@ -0,0 +1,133 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from os_tester.compare import build_mask, compWorkspace
+from os_tester.stages import area
+
+_BASE_PATH: str = f"{os.path.dirname(os.path.abspath(__file__))}/images"
+
+
+def test_comp_images_matches_skimage() -> None:
+    skimage_metrics = pytest.importorskip("skimage.metrics")
+    workspace = compWorkspace()
+
+    rng = np.random.default_rng(42)
+    img_a = rng.integers(0, 256, (40, 60, 3), dtype=np.uint8)
+    img_b = np.clip(img_a.astype(np.int16) + rng.integers(-40, 40, img_a.shape), 0, 255).astype(np.uint8)
+
+    expected = skimage_metrics.structural_similarity(img_a, img_b, channel_axis=-1)
+    assert workspace.comp_images(img_b, img_a) == pytest.approx(expected, abs=1e-6)
+
+
+def test_comp_images_reuses_buffers() -> None:
+    workspace = compWorkspace()
+    img_a = cv2.imread(f"{_BASE_PATH}/luks_a.png")
+    img_b = cv2.imread(f"{_BASE_PATH}/luks_b.png")
+
+    first = workspace.comp_images(img_a, img_b)
+    diff = workspace.diff_image()
+    second = workspace.comp_images(img_a, img_b)
+
+    assert first == second
+    # The diff buffer gets reused for images of the same shape
+    assert workspace.diff_image() is diff
+
+
+def test_comp_images_resizes_current_image() -> None:
+    workspace = compWorkspace()
+    img_ref = np.zeros((20, 20, 3), dtype=np.uint8)
+    img_cur = np.zeros((40, 40, 3), dtype=np.uint8)
+
+    assert workspace.comp_images(img_cur, img_ref) == pytest.approx(1.0)
+    assert workspace.diff_image().shape == img_ref.shape
+
+
+def test_diff_image_of_area() -> None:
+    workspace = compWorkspace()
+    img_a = np.zeros((20, 20, 3), dtype=np.uint8)
+    img_b = img_a.copy()
+    img_b[15, 15] = [255, 0, 0]
+    imageArea = area({"x1Percentage": 0.5, "x2Percentage": 1.0, "y1Percentage": 0.5, "y2Percentage": 1.0})
+
+    workspace.comp_images(img_b, img_a, imageArea)
+    diff = workspace.diff_image()
+
+    assert diff.shape == (10, 10, 3)
+    assert diff[5, 5, 0] == pytest.approx(255.0)
+    assert float(diff.sum()) == pytest.approx(255.0)
+
+
+def test_diff_image_requires_comparison() -> None:
+    with pytest.raises(ValueError):
+        compWorkspace().diff_image()
+
+
+def _noisy_pair(shape=(40, 60, 3)):
+    rng = np.random.default_rng(7)
+    img_a = rng.integers(0, 256, shape, dtype=np.uint8)
+    img_b = np.clip(img_a.astype(np.int16) + rng.integers(-40, 40, img_a.shape), 0, 255).astype(np.uint8)
+    return img_a, img_b
+
+
+def test_full_mask_matches_unmasked_comparison() -> None:
+    workspace = compWorkspace()
+    img_a, img_b = _noisy_pair()
+    imageArea = area({"x1Percentage": 0.1, "x2Percentage": 0.9, "y1Percentage": 0.2, "y2Percentage": 0.8})
+
+    mask = build_mask(img_a.shape, None, [], [], imageArea)
+    assert workspace.comp_images(img_b, img_a, imageArea, mask) == pytest.approx(workspace.comp_images(img_b, img_a, imageArea), abs=1e-6)
+
+
+def test_excluded_region_is_ignored() -> None:
+    workspace = compWorkspace()
+    img_a = np.full((40, 60, 3), 128, dtype=np.uint8)
+    img_a[::2, ::3] = 255
+    img_b = img_a.copy()
+    # A "clock" that changed in the top right corner
+    img_b[0:10, 40:60] = 0
+
+    assert workspace.comp_images(img_b, img_a) < 0.95
+    exclude = [area({"x1Percentage": 0.5, "x2Percentage": 1.0, "y1Percentage": 0.0, "y2Percentage": 0.5})]
+    mask = build_mask(img_a.shape, None, [], exclude, None)
+    assert workspace.comp_images(img_b, img_a, mask=mask) == pytest.approx(1.0)
+
+
+def test_mask_crop_matches_weighted_full_comparison() -> None:
+    skimage_metrics = pytest.importorskip("skimage.metrics")
+    workspace = compWorkspace()
+    img_a, img_b = _noisy_pair()
+    maskImg = np.zeros(img_a.shape[:2], dtype=np.uint8)
+    maskImg[10:20, 15:30] = 255
+    maskImg[22:30, 25:45] = 128
+
+    mask = build_mask(img_a.shape, maskImg, [], [], None)
+    assert mask.bbox == (15, 45, 10, 30)
+
+    _, ssimMap = skimage_metrics.structural_similarity(img_a, img_b, channel_axis=-1, full=True)
+    weights = mask.weights[..., None]
+    expected = (ssimMap * weights).sum() / (weights.sum() * img_a.shape[2])
+    assert workspace.comp_images(img_b, img_a, mask=mask) == pytest.approx(expected, abs=1e-5)
+
+
+def test_include_areas_are_combined() -> None:
+    include = [
+        area({"x1Percentage": 0.0, "x2Percentage": 0.5, "y1Percentage": 0.0, "y2Percentage": 0.5}),
+        area({"x1Percentage": 0.5, "x2Percentage": 1.0, "y1Percentage": 0.5, "y2Percentage": 1.0}),
+    ]
+    exclude = [area({"x1Percentage": 0.0, "x2Percentage": 0.25, "y1Percentage": 0.0, "y2Percentage": 0.25})]
+    mask = build_mask((40, 40, 3), None, include, exclude, None)
+
+    assert mask.weights[15, 15] == 1.0
+    assert mask.weights[30, 30] == 1.0
+    assert mask.weights[5, 5] == 0.0
+    assert mask.weights[30, 10] == 0.0
+    # The borders of the image can not be compared by the SSIM window
+    assert mask.weights[0, 20] == 0.0
+
+
+def test_empty_mask_is_rejected() -> None:
+    with pytest.raises(ValueError, match="does not leave any pixel"):
+        build_mask((40, 40, 3), np.zeros((40, 40), dtype=np.uint8), [], [], None)
@@ -0,0 +1,92 @@
+import re
+import time
+
+from os_tester.console import consoleBuffer, consoleReader
+
+
+def test_console_buffer_finds_and_consumes_match() -> None:
+    buffer = consoleBuffer()
+    buffer.append("Booting...\nlogin: ")
+
+    assert buffer.search(re.compile("login:"))
+    # The match consumed the output, so it does not match again
+    assert buffer.search(re.compile("login:")) is None
+
+    buffer.append("\nlogin: ")
+    assert buffer.search(re.compile("login:"))
+
+
+def test_console_buffer_matches_across_appends() -> None:
+    buffer = consoleBuffer()
+    regex = re.compile("Installation complete")
+    buffer.append("Installation com")
+    assert buffer.search(regex) is None
+
+    buffer.append("plete\n")
+    assert buffer.search(regex)
+
+
+def test_console_buffer_is_bounded() -> None:
+    buffer = consoleBuffer(maxSize=16, maxMatchLen=8)
+    buffer.append("a" * 10)
+    buffer.append("b" * 10)
+
+    assert len(buffer.text) == 16
+    assert buffer.startOffset == 4
+    assert buffer.endOffset == 20
+    assert buffer.search(re.compile("a{6}b"))
+
+
+class _fakeStream:
+    def __init__(self, chunks) -> None:
+        self.chunks = list(chunks)
+
+    def recv(self, _size: int) -> bytes:
+        return self.chunks.pop(0) if self.chunks else b""
+
+    def abort(self) -> None:
+        pass
+
+
+class _fakeConn:
+    def __init__(self, chunks) -> None:
+        self.chunks = chunks
+
+    def newStream(self, _flags: int) -> _fakeStream:
+        return _fakeStream(self.chunks)
+
+
+class _fakeDom:
+    def openConsole(self, _dev, _stream, _flags: int) -> None:
+        pass
+
+
+def test_console_reader_stops_running_at_end_of_stream() -> None:
+    reader = consoleReader(_fakeConn([b"login: "]), _fakeDom())
+    reader.start()
+    deadline = time.monotonic() + 1.0
+    while reader.running and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert not reader.running
+    reader.stop()
+    assert reader.search(re.compile("login:"))
+
+    # A reopened reader continues with the output read so far
+    reopened = consoleReader(_fakeConn([b"\nlogin: "]), _fakeDom(), buffer=reader.buffer)
+    reopened.start()
+    reopened.wait_for_data(reader.endOffset, 1.0)
+    reopened.stop()
+    assert reopened.endOffset == len("login: \nlogin: ")
+    assert reopened.search(re.compile("login:"))
+
+
+def test_console_reader_wait_for_data_returns_at_end_of_stream() -> None:
+    reader = consoleReader(_fakeConn([]), _fakeDom())
+    reader.start()
+    start = time.monotonic()
+    reader.wait_for_data(reader.endOffset, 5.0)
+
+    assert time.monotonic() - start < 1.0
+    assert not reader.running
+    reader.stop()
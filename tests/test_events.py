@@ -0,0 +1,43 @@
+import time
+
+import pytest
+
+try:
+    import libvirt
+except Exception:
+    pytest.skip("libvirt is required to import os_tester.events", allow_module_level=True)
+
+from os_tester.events import domainStateWatcher, start_event_loop
+
+
+def _wait_until(predicate, timeoutS: float = 5.0) -> bool:
+    end = time.monotonic() + timeoutS
+    while time.monotonic() < end:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_state_watcher_receives_lifecycle_events() -> None:
+    start_event_loop()
+    conn = libvirt.open("test:///default")
+    dom = conn.lookupByName("test")
+    watcher = domainStateWatcher(conn, dom)
+    assert watcher.useEvents
+    assert watcher.running
+
+    dom.suspend()
+    assert _wait_until(lambda: watcher.has_state("paused"))
+    assert not watcher.wait_for_running(0.01)
+
+    dom.resume()
+    assert watcher.wait_for_running(5)
+    assert [state for _, state in watcher.transitions][-2:] == ["paused", "running"]
+    assert watcher.transition_time("running") == watcher.transitions[-1][0]
+    assert watcher.transition_time("paused") is None
+    assert watcher.transition_time("rebooted") is None
+
+    watcher.close()
+    assert not watcher.useEvents
+    conn.close()
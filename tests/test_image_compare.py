@@ -23,8 +23,7 @@ def _load_image(file_path: str) -> np.ndarray:
 
 def _compare_images(img_a: np.ndarray, img_b: np.ndarray, imageArea: Optional[area] = None) -> float:
     tester = vm(None, "pytest")
-    ssim, _ = tester._vm__comp_images(img_a, img_b, imageArea)
-    return ssim
+    return tester._vm__comp_images(img_a, img_b, imageArea)
 
 
 def _compare_images_test(file_name_a: str, file_name_b: str, ssim_expected: float):
@@ -0,0 +1,82 @@
+import importlib.util
+import json
+import os
+import subprocess  # nosec B404
+import sys
+
+import pytest
+
+_SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+_HEAVY_MODULES = ("cv2", "numpy", "matplotlib", "skimage", "yaml")
+# Generous upper bound for importing os_tester without its heavy dependencies, so only regressions like an eager 'import cv2' fail on slow machines
+_MAX_IMPORT_S = 2.0
+
+
+def _import_in_subprocess(code: str):
+    """
+    Runs the given code inside a fresh interpreter and returns the heavy modules it imported together with the time it took.
+    """
+    script = f"""
+import json, sys, time
+start = time.perf_counter()
+{code}
+durationS = time.perf_counter() - start
+print(json.dumps({{"modules": [m for m in {_HEAVY_MODULES!r} if m in sys.modules], "durationS": durationS}}))
+"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (_SRC_DIR, env.get("PYTHONPATH")) if p)
+    output = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True, env=env).stdout  # nosec B603
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_lazy_import_loads_on_first_use() -> None:
+    code = """
+from os_tester.lazy import lazy_import
+colorsys = lazy_import("colorsys")
+assert "colorsys" not in sys.modules
+assert colorsys.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+assert "colorsys" in sys.modules
+"""
+    result = _import_in_subprocess(code)
+    assert not result["modules"]
+
+
+def test_importing_modules_does_not_import_heavy_dependencies() -> None:
+    result = _import_in_subprocess("import os_tester.stages, os_tester.compare, os_tester.capture, os_tester.trace, os_tester.calibrate, os_tester.profiler")
+    print(f"Importing os_tester modules took {result['durationS'] * 1000:.1f}ms")
+    assert not result["modules"]
+    assert result["durationS"] < _MAX_IMPORT_S
+
+
+def test_loading_stages_imports_opencv_and_yaml(tmp_path) -> None:
+    cv2 = pytest.importorskip("cv2")
+    np = pytest.importorskip("numpy")
+    cv2.imwrite(str(tmp_path / "ref.png"), np.zeros((10, 10, 3), dtype=np.uint8))
+    stage_yaml = """
+stages:
+  - stage: "boot"
+    timeout_s: 5
+    paths:
+      - path:
+          checks:
+            - path: "ref.png"
+              ssim_geq: 0.9
+          nextStage: "None"
+"""
+    (tmp_path / "stages.yml").write_text(stage_yaml, encoding="utf-8")
+    code = f"""
+from os_tester.stages import stages
+stages({str(tmp_path)!r}, "stages")
+"""
+    result = _import_in_subprocess(code)
+    assert "yaml" in result["modules"]
+    assert "cv2" in result["modules"]
+    assert "matplotlib" not in result["modules"]
+
+
+@pytest.mark.skipif(importlib.util.find_spec("libvirt") is None, reason="libvirt is required to import os_tester.vm")
+def test_importing_vm_does_not_import_heavy_dependencies() -> None:
+    result = _import_in_subprocess("import os_tester.vm, os_tester.provision, os_tester.pool\nfrom os_tester.vm import vm\nvm(None, 'uuid')")
+    print(f"Importing os_tester.vm took {result['durationS'] * 1000:.1f}ms")
+    assert not result["modules"]
+    assert result["durationS"] < _MAX_IMPORT_S
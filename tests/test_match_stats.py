@@ -0,0 +1,98 @@
+from os_tester.match_stats import matchStats
+
+_REF_IMAGES = {"a.png": 0, "b.png": 0, "c.png": 0}
+
+
+def _stage_yaml(reorder: bool) -> str:
+    return f"""
+stages:
+  - stage: "boot"
+    timeout_s: 5
+    reorder_paths: {"true" if reorder else "false"}
+    paths:
+      - path:
+          checks:
+            - path: "a.png"
+              ssim_geq: 0.9
+          actions: []
+          nextStage: "a"
+      - path:
+          checks:
+            - path: "b.png"
+              ssim_geq: 0.9
+            - path: "c.png"
+              ssim_geq: 0.9
+          actions: []
+          nextStage: "b"
+      - path:
+          checks: []
+          actions: []
+          nextStage: "fallback"
+"""
+
+
+def _next_stages(ordered) -> list:
+    return [subPathObj.nextStage for _, subPathObj in ordered]
+
+
+def test_order_paths_keeps_yaml_order_without_reorder_flag(write_suite) -> None:
+    stagesObj = write_suite(_stage_yaml(False), _REF_IMAGES)
+    stageObj = stagesObj.stagesList[0]
+    statsObj = matchStats(stagesObj.statsFilePath)
+    statsObj.record_match(stageObj, stageObj.pathsList[1], 0)
+
+    assert _next_stages(statsObj.order_paths(stageObj)) == ["a", "b", "fallback"]
+
+
+def test_order_paths_prefers_frequent_matches(write_suite) -> None:
+    stagesObj = write_suite(_stage_yaml(True), _REF_IMAGES)
+    stageObj = stagesObj.stagesList[0]
+    statsObj = matchStats(stagesObj.statsFilePath)
+    statsObj.record_match(stageObj, stageObj.pathsList[1], 1)
+
+    ordered = statsObj.order_paths(stageObj)
+    assert _next_stages(ordered) == ["b", "a", "fallback"]
+    assert ordered[0][0] == 1
+    assert [i for i, _ in statsObj.order_checks(stageObj, stageObj.pathsList[1])] == [1, 0]
+
+
+def test_order_paths_uses_score_trend_as_tie_breaker(write_suite) -> None:
+    stagesObj = write_suite(_stage_yaml(True), _REF_IMAGES)
+    stageObj = stagesObj.stagesList[0]
+    statsObj = matchStats(stagesObj.statsFilePath)
+    statsObj.record_score(stageObj, stageObj.pathsList[0], 0, 0.2)
+    statsObj.record_score(stageObj, stageObj.pathsList[1], 1, 0.8)
+
+    assert _next_stages(statsObj.order_paths(stageObj)) == ["b", "a", "fallback"]
+
+
+def test_score_trends_are_kept_per_check(write_suite) -> None:
+    stagesObj = write_suite(_stage_yaml(True), _REF_IMAGES)
+    stageObj = stagesObj.stagesList[0]
+    statsObj = matchStats(stagesObj.statsFilePath)
+    statsObj.record_score(stageObj, stageObj.pathsList[0], 0, 0.5)
+    # A poorly scoring second check must not drag down the well scoring first check of the same path
+    for _ in range(5):
+        statsObj.record_score(stageObj, stageObj.pathsList[1], 0, 0.6)
+        statsObj.record_score(stageObj, stageObj.pathsList[1], 1, 0.0)
+
+    assert _next_stages(statsObj.order_paths(stageObj)) == ["b", "a", "fallback"]
+
+
+def test_match_stats_are_persisted(write_suite) -> None:
+    stagesObj = write_suite(_stage_yaml(True), _REF_IMAGES)
+    stageObj = stagesObj.stagesList[0]
+    statsObj = matchStats(stagesObj.statsFilePath)
+    statsObj.record_match(stageObj, stageObj.pathsList[1], 0)
+    statsObj.save()
+
+    reloaded = matchStats(write_suite(_stage_yaml(True), _REF_IMAGES).statsFilePath)
+    assert _next_stages(reloaded.order_paths(stageObj)) == ["b", "a", "fallback"]
+
+
+def test_match_stats_ignore_invalid_file(tmp_path, write_suite) -> None:
+    stagesObj = write_suite(_stage_yaml(True), _REF_IMAGES)
+    (tmp_path / "stages.stats.json").write_text("{not json", encoding="utf-8")
+
+    statsObj = matchStats(stagesObj.statsFilePath)
+    assert _next_stages(statsObj.order_paths(stagesObj.stagesList[0])) == ["a", "b", "fallback"]
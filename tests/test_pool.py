@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+try:
+    import libvirt  # noqa: F401 pylint: disable=unused-import
+except Exception:
+    pytest.skip("libvirt is required to import os_tester.pool", allow_module_level=True)
+
+from os_tester.exceptions import noHostAvailableError
+from os_tester.pool import connectionPool, hostLease, hostStats, poolHost
+
+# Every 'test:///default' connection is a stand-in for a separate host
+_URI = "test:///default"
+
+
+def test_pool_spreads_vms_across_hosts() -> None:
+    pool = connectionPool([_URI, _URI])
+    first = pool.acquire()
+    second = pool.acquire()
+
+    assert first.host is not second.host
+    assert first.conn.isAlive()
+    assert second.conn.isAlive()
+
+    with pytest.raises(noHostAvailableError):
+        pool.acquire(timeoutS=0)
+
+    first.release()
+    # Releasing twice does not free a second slot
+    first.release()
+    third = pool.acquire(timeoutS=0)
+    assert third.host is first.host
+    with pytest.raises(noHostAvailableError):
+        pool.acquire(timeoutS=0)
+    pool.close()
+
+
+def test_pool_prefers_least_loaded_host() -> None:
+    pool = connectionPool([_URI, _URI], maxVmsPerHost=4)
+    with pool.acquire(vcpus=2) as first:
+        # The vCPUs reserved by the first lease make its host more loaded
+        with pool.acquire(vcpus=2) as second:
+            assert first.host is not second.host
+    assert all(host.leases == 0 and host.reservedVcpus == 0 for host in pool.hosts)
+    pool.close()
+
+
+def test_pool_rejects_vms_exceeding_free_memory() -> None:
+    pool = connectionPool([_URI])
+    with pytest.raises(noHostAvailableError):
+        pool.acquire(memoryKiB=2**50, timeoutS=0)
+    pool.close()
+
+
+def test_pool_reconnects_dropped_connections() -> None:
+    pool = connectionPool([_URI])
+    with pool.acquire() as leaseObj:
+        oldConn = leaseObj.conn
+    oldConn.close()
+
+    with pool.acquire() as leaseObj:
+        assert leaseObj.conn is not oldConn
+        assert leaseObj.conn.isAlive()
+    pool.close()
+
+
+def test_pool_skips_unreachable_hosts() -> None:
+    pool = connectionPool(["test:///does/not/exist.xml", _URI])
+    with pool.acquire(timeoutS=0) as leaseObj:
+        assert leaseObj.host.uri == _URI
+    pool.close()
+
+
+def test_pool_host_does_not_count_running_leases_twice() -> None:
+    host = poolHost(_URI, maxVms=8)
+    gib = 1024 * 1024
+    running = [hostLease(None, host, None, f"running-{i}", 12 * gib, 2) for i in range(4)]
+    host.activeLeases.extend(running)
+    # 64 GiB host: the four running 12 GiB VMs are already part of the free memory and allocated vCPUs
+    statsObj = hostStats(None, 64 * gib, 16 * gib, 16, 8, {leaseObj.uuid for leaseObj in running})
+
+    assert host.load(statsObj, 12 * gib, 2) is not None
+    assert host.load(statsObj, 17 * gib) is None
+
+    # A lease whose VM is not running yet still reserves its resources
+    host.activeLeases.append(hostLease(None, host, None, "starting", 12 * gib, 2))
+    assert host.load(statsObj, 12 * gib, 2) is None
+    assert host.load(statsObj, 4 * gib) is not None
+
+
+def test_pool_release_does_not_wait_for_slow_hosts() -> None:
+    pool = connectionPool([_URI], maxVmsPerHost=2)
+    leaseObj = pool.acquire()
+    host = pool.hosts[0]
+    slowQuery = threading.Event()
+    originalQuery = host.query
+
+    def query():
+        slowQuery.set()
+        time.sleep(0.5)
+        return originalQuery()
+
+    host.query = query
+    waiter = threading.Thread(target=lambda: pool.acquire(timeoutS=2).release())
+    waiter.start()
+    # Another caller querying the host must not block releasing a lease
+    assert slowQuery.wait(1.0)
+    start = time.monotonic()
+    leaseObj.release()
+    assert time.monotonic() - start < 0.25
+    waiter.join()
+    pool.close()
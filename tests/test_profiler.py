@@ -0,0 +1,63 @@
+import time
+
+from os_tester.profiler import nullProfiler, runProfiler
+from os_tester.stages import checkConsole, checkState
+
+
+def _busy(durationS: float) -> None:
+    end = time.perf_counter() + durationS
+    while time.perf_counter() < end:
+        pass
+
+
+def test_null_profiler_does_not_allocate() -> None:
+    profiler = nullProfiler()
+    check = checkState("running")
+    assert profiler.stage("boot") is profiler.section("wait")
+    assert profiler.check(0, 0, check) is profiler.stage("boot")
+    with profiler.stage("boot"):
+        with profiler.check(0, 0, check):
+            pass
+
+
+def test_run_profiler_times_stages_sections_and_checks(tmp_path) -> None:
+    profiler = runProfiler(str(tmp_path), intervalS=0.001)
+    profiler.start()
+    for _ in range(2):
+        with profiler.stage("boot"):
+            with profiler.section("wait"):
+                with profiler.check(0, 1, checkConsole({"regex": "login:"})):
+                    _busy(0.02)
+            with profiler.section("actions"):
+                time.sleep(0.02)
+    profiler.stop()
+
+    stageTimer = profiler.stageTimers["boot"]
+    assert stageTimer.count == 2
+    assert stageTimer.wallS >= 0.08
+    # Sleeping does not use any CPU
+    assert profiler.sectionTimers[("boot", "actions")].cpuS < profiler.sectionTimers[("boot", "actions")].wallS
+
+    checkTimer = profiler.checkTimers[("boot", "path 1 check 2 console 'login:'")]
+    assert checkTimer.count == 2
+    assert checkTimer.cpuS > 0.0
+
+    summary = (tmp_path / "profile.txt").read_text(encoding="utf-8")
+    assert "boot" in summary
+    assert "path 1 check 2 console 'login:'" in summary
+
+
+def test_run_profiler_writes_collapsed_stacks(tmp_path) -> None:
+    profiler = runProfiler(str(tmp_path), intervalS=0.001)
+    profiler.start()
+    with profiler.stage("install"):
+        _busy(0.1)
+    profiler.stop()
+
+    lines = (tmp_path / "profile.collapsed").read_text(encoding="utf-8").splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
+        assert stack.startswith("stage ")
+    assert any(line.startswith("stage install;MainThread;") and "_busy (test_profiler.py:" in line for line in lines)
@@ -0,0 +1,109 @@
+import os
+import stat
+
+import pytest
+
+try:
+    import libvirt
+except Exception:
+    pytest.skip("libvirt is required to import os_tester.provision", allow_module_level=True)
+
+from os_tester.exceptions import provisionError
+from os_tester.provision import vmProvisioner
+
+_TEMPLATE = """
+<domain type="test">
+  <name>$name</name>
+  <uuid>$uuid</uuid>
+  <title>$title</title>
+  <memory unit="MiB">64</memory>
+  <os>
+    <type>hvm</type>
+  </os>
+  <devices>
+    <disk type="file" device="disk">
+      <source file="$disk_path"/>
+      <target dev="vda"/>
+    </disk>
+  </devices>
+</domain>
+"""
+
+
+def _write_fake_qemu_img(tmp_path) -> str:
+    # Creates an empty file at the overlay path (the last argument) instead of a real qcow2 overlay
+    script = tmp_path / "qemu-img"
+    script.write_text('#!/bin/sh\nfor arg; do last="$arg"; done\n: > "$last"\n', encoding="utf-8")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    return str(script)
+
+
+def _provisioner(tmp_path, conn) -> vmProvisioner:
+    base = tmp_path / "base.qcow2"
+    base.write_bytes(b"")
+    return vmProvisioner(conn, str(base), _TEMPLATE, str(tmp_path / "overlays"), qemuImgPath=_write_fake_qemu_img(tmp_path))
+
+
+def test_provision_fills_template(tmp_path) -> None:
+    provisioner = _provisioner(tmp_path, None)
+    xml = provisioner.fill_template("vm_1", "VM 1", "1e6cae9f-41d7-4fca-8033-fbd538a65173", "/tmp/vm_1.qcow2")
+
+    assert "<name>vm_1</name>" in xml
+    assert "<uuid>1e6cae9f-41d7-4fca-8033-fbd538a65173</uuid>" in xml
+    assert 'file="/tmp/vm_1.qcow2"' in xml
+
+
+def test_provision_escapes_template_values(tmp_path) -> None:
+    provisioner = _provisioner(tmp_path, None)
+    xml = provisioner.fill_template("vm_1", "Tom & <Jerry>", "1e6cae9f-41d7-4fca-8033-fbd538a65173", '/tmp/"vm".qcow2')
+
+    assert "<title>Tom &amp; &lt;Jerry&gt;</title>" in xml
+    assert 'file="/tmp/&quot;vm&quot;.qcow2"' in xml
+
+
+def test_provision_creates_and_cleans_up_overlay(tmp_path) -> None:
+    conn = libvirt.open("test:///default")
+    provisioner = _provisioner(tmp_path, conn)
+
+    vmObj = provisioner.provision("os_tester_provision_test", captureIntervalS=0.1)
+    assert os.path.isfile(vmObj.overlayPath)
+    assert vmObj.captureIntervalS == 0.1
+    assert conn.lookupByUUIDString(vmObj.uuid).name() == "os_tester_provision_test"
+
+    vmObj.destroy()
+    assert not os.path.exists(vmObj.overlayPath)
+    conn.close()
+
+
+def test_provision_rejects_missing_base_image(tmp_path) -> None:
+    with pytest.raises(ValueError, match="Base image"):
+        vmProvisioner(None, str(tmp_path / "missing.qcow2"), _TEMPLATE, str(tmp_path / "overlays"))
+
+
+def test_provision_reports_qemu_img_errors(tmp_path) -> None:
+    script = tmp_path / "failing-qemu-img"
+    script.write_text("#!/bin/sh\necho 'Could not open backing file' >&2\nexit 1\n", encoding="utf-8")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    base = tmp_path / "base.qcow2"
+    base.write_bytes(b"")
+    provisioner = vmProvisioner(None, str(base), _TEMPLATE, str(tmp_path / "overlays"), qemuImgPath=str(script))
+
+    with pytest.raises(provisionError, match="Could not open backing file"):
+        provisioner.provision("vm_1")
+
+
+def test_provision_reports_missing_qemu_img(tmp_path) -> None:
+    base = tmp_path / "base.qcow2"
+    base.write_bytes(b"")
+    provisioner = vmProvisioner(None, str(base), _TEMPLATE, str(tmp_path / "overlays"), qemuImgPath=str(tmp_path / "missing-qemu-img"))
+
+    with pytest.raises(provisionError, match="missing-qemu-img"):
+        provisioner.provision("vm_1")
+
+
+def test_provision_rejects_names_with_path_separators(tmp_path) -> None:
+    provisioner = _provisioner(tmp_path, None)
+
+    with pytest.raises(ValueError, match="path separators"):
+        provisioner.provision("../vm_1")
+    assert not os.listdir(tmp_path / "overlays")
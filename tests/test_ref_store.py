@@ -0,0 +1,111 @@
+import cv2
+import numpy as np
+import pytest
+from test_stages_parsing import _write_stage_file
+
+from os_tester.exceptions import loadError
+from os_tester.ref_store import pixel_digest, refImageStore
+from os_tester.stages import stages
+
+
+def _write_ref_image(tmp_path, name: str, value: int = 0) -> None:
+    img = np.full((10, 10, 3), value, dtype=np.uint8)
+    cv2.imwrite(str(tmp_path / name), img)
+
+
+def _write_suite_file(tmp_path, refNames) -> None:
+    checks = "".join(
+        f"""
+            - path: "{name}"
+              ssim_geq: 0.9"""
+        for name in refNames
+    )
+    stage_yaml = f"""
+stages:
+  - stage: "boot"
+    timeout_s: 5
+    paths:
+      - path:
+          checks:{checks}
+          actions: []
+          nextStage: "None"
+"""
+    _write_stage_file(tmp_path, stage_yaml)
+
+
+def _ref_data(stagesObj):
+    return [check.fileData for check in stagesObj.stagesList[0].pathsList[0].checkList]
+
+
+def test_identical_pixels_are_shared_across_files_and_suites(tmp_path) -> None:
+    suiteA = tmp_path / "a"
+    suiteB = tmp_path / "b"
+    suiteA.mkdir()
+    suiteB.mkdir()
+    _write_ref_image(suiteA, "login.png")
+    _write_ref_image(suiteA, "login_copy.png")
+    _write_ref_image(suiteB, "other_name.png")
+    _write_suite_file(suiteA, ["login.png", "login_copy.png"])
+    _write_suite_file(suiteB, ["other_name.png"])
+
+    store = refImageStore()
+    stagesA = stages(str(suiteA), "stages", store)
+    stagesB = stages(str(suiteB), "stages", store)
+    dataA = _ref_data(stagesA)
+    dataB = _ref_data(stagesB)
+
+    assert dataA[0] is dataA[1]
+    assert dataA[0] is dataB[0]
+    assert len(store) == 1
+
+
+def test_shared_data_is_read_only(tmp_path) -> None:
+    _write_ref_image(tmp_path, "ref.png")
+    store = refImageStore()
+    image = store.load(str(tmp_path / "ref.png"))
+
+    with pytest.raises(ValueError):
+        image.data[0, 0, 0] = 1
+
+
+def test_different_images_stay_distinct(tmp_path) -> None:
+    _write_ref_image(tmp_path, "black.png", 0)
+    _write_ref_image(tmp_path, "white.png", 255)
+    _write_suite_file(tmp_path, ["black.png", "white.png"])
+
+    store = refImageStore()
+    stagesObj = stages(str(tmp_path), "stages", store)
+    data = _ref_data(stagesObj)
+
+    assert data[0] is not data[1]
+    assert pixel_digest(data[0]) != pixel_digest(data[1])
+    assert len(store) == 2
+
+
+def test_missing_file_raises_load_error(tmp_path) -> None:
+    store = refImageStore()
+    with pytest.raises(loadError) as e:
+        store.load(str(tmp_path / "missing.png"))
+    assert e.value.exitCode == 2
+
+
+def test_modified_file_is_reloaded(tmp_path) -> None:
+    _write_ref_image(tmp_path, "ref.png", 0)
+    store = refImageStore()
+    first = store.load(str(tmp_path / "ref.png"))
+
+    _write_ref_image(tmp_path, "ref.png", 255)
+    second = store.load(str(tmp_path / "ref.png"))
+
+    assert first.digest != second.digest
+    assert int(second.data[0, 0, 0]) == 255
+
+
+def test_unreferenced_images_are_released(tmp_path) -> None:
+    _write_ref_image(tmp_path, "ref.png")
+    store = refImageStore()
+    image = store.load(str(tmp_path / "ref.png"))
+    assert len(store) == 1
+
+    del image
+    assert len(store) == 0
@@ -0,0 +1,79 @@
+import pytest
+
+from os_tester.exceptions import actionError, compareError, loadError, osTesterError, outputError, provisionError, stageNotFoundError, stageTimeoutError, vmError
+from os_tester.run_result import runResult, stageResult
+from os_tester.stages import stages
+
+
+def test_run_result_success() -> None:
+    result = runResult()
+    result.stageResults.append(stageResult("boot", 1.5, "login"))
+    result.stageResults.append(stageResult("login", 0.5, "None"))
+
+    assert result.success
+    assert result.exitCode == 0
+    assert result.failureReason is None
+    assert result.stagePath == ["boot", "login"]
+    assert result.stageResults[0].stateChangeS is None
+
+
+def test_stage_result_reports_state_change() -> None:
+    result = stageResult("shutdown", 2.0, "None", 1.25)
+
+    assert result.stateChangeS == 1.25
+    assert "stateChangeS=1.250" in repr(result)
+
+
+def test_run_result_failure() -> None:
+    result = runResult()
+    result.stageResults.append(stageResult("boot", 10.0, None))
+    result.error = stageTimeoutError("boot", 10.0)
+
+    assert not result.success
+    assert result.exitCode == 5
+    assert "boot" in str(result.failureReason)
+
+
+def test_errors_keep_exit_codes() -> None:
+    assert stageNotFoundError("missing").exitCode == 10
+    assert loadError("broken", 4).exitCode == 4
+    assert isinstance(loadError("broken"), osTesterError)
+    assert loadError("broken").exitCode == 1
+    assert vmError("reboot failed").exitCode == 8
+    assert actionError("unknown").exitCode == 9
+    assert provisionError("qemu-img failed").exitCode == 12
+    assert outputError("disk full").exitCode == 13
+    assert compareError("area too small").exitCode == 14
+
+
+def test_stages_missing_config_raises(tmp_path) -> None:
+    with pytest.raises(loadError) as e:
+        stages(str(tmp_path), "stages")
+    assert e.value.exitCode == 2
+
+
+def test_stages_missing_ref_image_raises(tmp_path) -> None:
+    stage_yaml = """
+stages:
+  - stage: "boot"
+    timeout_s: 5
+    paths:
+      - path:
+          checks:
+            - path: "missing.png"
+              ssim_geq: 0.9
+          actions: []
+          nextStage: "None"
+"""
+    (tmp_path / "stages.yml").write_text(stage_yaml, encoding="utf-8")
+
+    with pytest.raises(loadError, match="missing.png"):
+        stages(str(tmp_path), "stages")
+
+
+def test_stages_invalid_yaml_raises(tmp_path) -> None:
+    (tmp_path / "stages.yml").write_text("stages: [\n  - stage: 'boot'\n", encoding="utf-8")
+
+    with pytest.raises(loadError, match="could not be parsed") as e:
+        stages(str(tmp_path), "stages")
+    assert e.value.exitCode == 4
@@ -2,7 +2,7 @@ import cv2
 import numpy as np
 import pytest
 
-from os_tester.stages import area, stages
+from os_tester.stages import area, checkConsole, checkFile, checkState, stages
 
 
 def _write_stage_file(tmp_path, stage_dict) -> None:
@@ -86,3 +86,170 @@ stages:
 
     with pytest.raises(ValueError, match="ssim_geq"):
         stages(str(tmp_path), "stages")
+
+
+def test_stages_parsing_accepts_console_check(tmp_path) -> None:
+    stage_yaml = """
+stages:
+  - stage: "boot"
+    timeout_s: 5
+    paths:
+      - path:
+          checks:
+            - console:
+                regex: "login:\\\\s*$"
+          actions: []
+          nextStage: "None"
+"""
+    _write_stage_file(tmp_path, stage_yaml)
+
+    stageObj = stages(str(tmp_path), "stages").stagesList[0]
+    check = stageObj.pathsList[0].checkList[0]
+
+    assert isinstance(check, checkConsole)
+    assert not isinstance(check, checkFile)
+    assert stageObj.hasConsoleChecks
+    assert not stageObj.hasImageChecks
+    assert check.regex.search("login: ")
+
+
+def test_stages_parsing_rejects_invalid_console_regex(tmp_path) -> None:
+    stage_yaml = """
+stages:
+  - stage: "boot"
+    timeout_s: 5
+    paths:
+      - path:
+          checks:
+            - console:
+                regex: "login("
+          actions: []
+          nextStage: "None"
+"""
+    _write_stage_file(tmp_path, stage_yaml)
+
+    with pytest.raises(ValueError, match="console.regex"):
+        stages(str(tmp_path), "stages")
+
+
+def test_stages_parsing_accepts_state_check(tmp_path) -> None:
+    stage_yaml = """
+stages:
+  - stage: "reboot"
+    timeout_s: 5
+    paths:
+      - path:
+          checks:
+            - state: "rebooted"
+          actions: []
+          nextStage: "None"
+"""
+    _write_stage_file(tmp_path, stage_yaml)
+
+    stageObj = stages(str(tmp_path), "stages").stagesList[0]
+    check = stageObj.pathsList[0].checkList[0]
+
+    assert isinstance(check, checkState)
+    assert check.state == "rebooted"
+    assert stageObj.hasStateChecks
+    assert not stageObj.hasImageChecks
+
+
+def test_stages_parsing_rejects_invalid_state(tmp_path) -> None:
+    stage_yaml = """
+stages:
+  - stage: "reboot"
+    timeout_s: 5
+    paths:
+      - path:
+          checks:
+            - state: "sleeping"
+          actions: []
+          nextStage: "None"
+"""
+    _write_stage_file(tmp_path, stage_yaml)
+
+    with pytest.raises(ValueError, match="state"):
+        stages(str(tmp_path), "stages")
+
+
+def test_stages_parsing_builds_mask(tmp_path) -> None:
+    _write_ref_image(tmp_path, "ref.png")
+    maskImg = np.full((10, 10), 255, dtype=np.uint8)
+    cv2.imwrite(str(tmp_path / "mask.png"), maskImg)
+    stage_yaml = """
+stages:
+  - stage: "boot"
+    timeout_s: 5
+    paths:
+      - path:
+          checks:
+            - path: "ref.png"
+              ssim_geq: 0.9
+              mask: "mask.png"
+              exclude:
+                - x1Percentage: 0.5
+                  x2Percentage: 1.0
+                  y1Percentage: 0.0
+                  y2Percentage: 1.0
+          actions: []
+          nextStage: "done"
+"""
+    _write_stage_file(tmp_path, stage_yaml)
+
+    check = stages(str(tmp_path), "stages").stagesList[0].pathsList[0].checkList[0]
+    assert isinstance(check, checkFile)
+
+    assert check.maskSpecObj.filePath == str(tmp_path / "mask.png")
+    assert len(check.maskSpecObj.excludeAreas) == 1
+    assert check.maskSpecObj.mask is not None
+    assert check.maskSpecObj.mask.bbox == (3, 5, 3, 7)
+
+
+def test_stages_parsing_without_mask(tmp_path) -> None:
+    _write_ref_image(tmp_path)
+    stage_yaml = """
+stages:
+  - stage: "boot"
+    timeout_s: 5
+    paths:
+      - path:
+          checks:
+            - path: "ref.png"
+              ssim_geq: 0.9
+          actions: []
+          nextStage: "done"
+"""
+    _write_stage_file(tmp_path, stage_yaml)
+
+    check = stages(str(tmp_path), "stages").stagesList[0].pathsList[0].checkList[0]
+    assert isinstance(check, checkFile)
+
+    assert check.maskSpecObj.mask is None
+    assert check.maskSpecObj.includeAreas == [] and check.maskSpecObj.excludeAreas == []
+
+
+def test_stages_parsing_rejects_empty_mask(tmp_path) -> None:
+    _write_ref_image(tmp_path)
+    stage_yaml = """
+stages:
+  - stage: "boot"
+    timeout_s: 5
+    paths:
+      - path:
+          checks:
+            - path: "ref.png"
+              ssim_geq: 0.9
+              include: []
+              exclude:
+                - x1Percentage: 0.0
+                  x2Percentage: 1.0
+                  y1Percentage: 0.0
+                  y2Percentage: 1.0
+          actions: []
+          nextStage: "done"
+"""
+    _write_stage_file(tmp_path, stage_yaml)
+
+    with pytest.raises(ValueError, match="Invalid mask"):
+        stages(str(tmp_path), "stages")